@@ -0,0 +1,78 @@
+import os
+import re
+import random
+from src.constants import RAW_DATA_DIR
+from src.data.split_code import iter_code_files
+
+# Names a template defines, per language, which are renamed in every synthetic copy
+DEFINITION_PATTERNS = {
+    "python": [r"\bdef\s+(\w+)", r"\bclass\s+(\w+)", r"^(\w+)\s*="],
+    "java": [r"\bclass\s+(\w+)", r"\b(?:int|void|double|float|long|boolean|String)\s+(\w+)\s*[(=;]"],
+    "c": [r"\bstruct\s+(\w+)", r"\b(?:int|void|double|float|long|char)\s*\**\s*(\w+)\s*[(=;\[]"],
+}
+
+EXTENSIONS = {"python": ".py", "java": ".java", "c": ".c"}
+
+def load_templates(template_dir=RAW_DATA_DIR):
+    """Reads the code files of `template_dir` as (language, text, defined names) templates."""
+    templates = []
+    for file_path, language in iter_code_files(template_dir):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        names = set()
+        for pattern in DEFINITION_PATTERNS[language]:
+            names.update(re.findall(pattern, text, flags=re.MULTILINE))
+        # main is an entry point, not a name the code chose
+        names.discard("main")
+        templates.append((language, text, sorted(names)))
+    return templates
+
+def synthesize_file(template, rng):
+    """
+    Makes a new code file from a template by renaming the names it defines and shuffling its paragraphs.
+
+    The result keeps the language, size and line structure of real code, while its tokens differ enough
+    from the template that tokenizer and prefix caches do not make the benchmark unrealistically cheap.
+    """
+    language, text, names = template
+    renames = {name: f"{name}{rng.choice(['', '_', 'V'])}{rng.randrange(1000)}" for name in names if rng.random() < 0.7}
+    if renames:
+        pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in renames) + r")\b")
+        text = pattern.sub(lambda match: renames[match.group(1)], text)
+    # Paragraphs (blocks separated by blank lines) are kept whole, so brace and indent structure survives
+    paragraphs = text.split("\n\n")
+    if len(paragraphs) > 2:
+        middle = paragraphs[1:-1]
+        rng.shuffle(middle)
+        paragraphs = [paragraphs[0]] + middle + [paragraphs[-1]]
+    return "\n\n".join(paragraphs)
+
+def build_corpus(out_dir, num_files, seed=0, template_dir=RAW_DATA_DIR):
+    """
+    Writes a synthetic Python/Java/C corpus of `num_files` files generated from the templates.
+
+    Parameters:
+        out_dir (str): The directory to write the corpus to.
+        num_files (int): The number of files to generate; templates are used in turn.
+        seed (int): The seed of the renames and shuffles, so a corpus can be rebuilt identically.
+        template_dir (str): The directory of template code files.
+
+    Returns:
+        dict: The number of files and bytes written per language.
+    """
+    rng = random.Random(seed)
+    templates = load_templates(template_dir)
+    stats = {}
+    for index in range(num_files):
+        template = templates[index % len(templates)]
+        language = template[0]
+        # Spread the files over subdirectories, like a real repository
+        directory = os.path.join(out_dir, language, f"{index // 100:04d}")
+        os.makedirs(directory, exist_ok=True)
+        text = synthesize_file(template, rng)
+        with open(os.path.join(directory, f"file_{index:06d}{EXTENSIONS[language]}"), 'w', encoding='utf-8') as f:
+            f.write(text)
+        language_stats = stats.setdefault(language, {"files": 0, "bytes": 0})
+        language_stats["files"] += 1
+        language_stats["bytes"] += len(text.encode("utf-8"))
+    return stats
@@ -0,0 +1,102 @@
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from src.constants import PROJECT_ROOT, TOKENIZED_DATA_JSON, TOKENIZED_DATA_STORE, MAX_NEW_TOKENS
+from src.models import add_model_args, model_kwargs
+from src.inference.precision import PRECISIONS, metric_drift
+
+def run_precision(args):
+    """Runs the evaluation in one precision and returns its timing, memory and results (worker side)."""
+    import torch
+    from src.models import get_model, get_tokenizer
+    from src.data.tokenized_store import load_tokenized
+    from src.inference.pipeline import run_inference_on_data
+
+    tokenized_data = load_tokenized(args.data)
+    tokenized_data = [tokenized_data[idx] for idx in range(min(args.num_examples, len(tokenized_data)))]
+
+    start = time.perf_counter()
+    model = get_model(args.model, **model_kwargs(args))
+    tokenizer = get_tokenizer(args.model)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = run_inference_on_data(model, tokenizer, tokenized_data, batch_size=args.batch_size,
+                                    max_new_tokens=args.max_new_tokens)
+    seconds = time.perf_counter() - start
+
+    generated_tokens = sum(result["generated_tokens"] for result in results)
+    return {
+        "precision": args.precision,
+        "load_seconds": load_seconds,
+        "seconds": seconds,
+        "generated_tokens": generated_tokens,
+        "tokens_per_second": generated_tokens / seconds if seconds else 0.0,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_cuda_mib": torch.cuda.max_memory_allocated() / 1024 ** 2 if torch.cuda.is_available() else None,
+        "results": results
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compares speed, peak memory and metric drift of precision modes against fp32.")
+    parser.add_argument("--data", default=TOKENIZED_DATA_STORE if os.path.isdir(TOKENIZED_DATA_STORE) else TOKENIZED_DATA_JSON,
+                        help="Tokenized dataset: a token store directory or a tokenized JSON file.")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=["bf16", "int8"],
+                        help="Precisions to compare with fp32.")
+    parser.add_argument("--num-examples", type=int, default=16, help="Number of examples to run in every precision.")
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS, help="Maximum tokens generated per example.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Generate in batches of this size.")
+    parser.add_argument("--output", default=None, help="Write the comparison to this JSON file.")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", default=None, help=argparse.SUPPRESS)
+    add_model_args(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.worker:
+        with open(args.worker_output, 'w', encoding='utf-8') as f:
+            json.dump(run_precision(args), f)
+        raise SystemExit(0)
+
+    # Every precision runs in a fresh process, so peak memory is not inflated by the runs before it
+    precisions = ["fp32"] + [precision for precision in args.precisions if precision != "fp32"]
+    if "int4" in precisions and importlib.util.find_spec("torchao") is None:
+        print("Skipping int4: torchao is not installed")
+        precisions.remove("int4")
+
+    runs = {}
+    for precision in precisions:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            worker_output = f.name
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.precision", *sys.argv[1:], "--worker", "--worker-output", worker_output,
+             "--precision", precision],
+            cwd=PROJECT_ROOT, check=True
+        )
+        with open(worker_output, 'r', encoding='utf-8') as f:
+            runs[precision] = json.load(f)
+        os.remove(worker_output)
+
+    report = {}
+    for precision, run in runs.items():
+        summary = {key: value for key, value in run.items() if key != "results"}
+        summary["speedup"] = runs["fp32"]["seconds"] / run["seconds"] if run["seconds"] else None
+        summary["drift"] = metric_drift(runs["fp32"]["results"], run["results"])
+        report[precision] = summary
+        print(f"{precision}: {run['seconds']:.1f}s ({summary['speedup']:.2f}x), {run['tokens_per_second']:.1f} tokens/s, "
+              f"peak RSS {run['peak_rss_mib']:.0f} MiB, identical generations {summary['drift']['identical_generations']:.0%}, "
+              f"exact match {summary['drift']['exact_match']['mean']:.3f} "
+              f"({summary['drift']['exact_match']['mean_difference']:+.3f}), "
+              f"chrF {summary['drift']['chrf']['mean']:.2f} ({summary['drift']['chrf']['mean_difference']:+.2f})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
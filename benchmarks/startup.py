@@ -0,0 +1,59 @@
+import argparse
+import json
+import subprocess
+import sys
+from src.constants import PROJECT_ROOT
+from src.models import add_model_args, model_kwargs
+
+# Each probe runs in a fresh interpreter, so its time and peak RSS include everything its imports pull in
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{body}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+IMPORT_PROBES = {
+    "import src.evaluation.metrics": "from src.evaluation.metrics import compute_codebleu",
+    "import src.data.tokenize_dataset": "from src.data.tokenize_dataset import tokenize_entry",
+    "import run_starcoder_inference": "import run_starcoder_inference",
+}
+
+FIRST_TOKEN_PROBE = """
+import torch
+from src.models import get_model, get_tokenizer
+options = json.loads(sys.argv[1])
+model_id = options.pop("model_id")
+tokenizer = get_tokenizer(model_id)
+model = get_model(model_id, **options)
+input_ids = torch.tensor([tokenizer.encode("def hello_world():")], device=model.device)
+with torch.no_grad():
+    model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=1, do_sample=False)
+"""
+
+def run_probe(body, *argv):
+    """Runs a probe in a fresh interpreter from the project root and returns its time and peak RSS."""
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(body=body), *argv],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures import time and peak RSS up to the first generated token.")
+    add_model_args(parser)
+    parser.add_argument("--skip-first-token", action="store_true", help="Only measure the imports.")
+    parser.add_argument("--output", default=None, help="Write the measurements to this JSON file.")
+    args = parser.parse_args()
+
+    report = {name: run_probe(body) for name, body in IMPORT_PROBES.items()}
+    if not args.skip_first_token:
+        options = dict(model_kwargs(args), model_id=args.model)
+        report[f"first token ({args.model})"] = dict(run_probe(FIRST_TOKEN_PROBE, json.dumps(options)), options=options)
+
+    for name, measurement in report.items():
+        print(f"{name}: {measurement['seconds']:.2f}s, peak RSS {measurement['peak_rss_mib']:.0f} MiB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
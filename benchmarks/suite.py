@@ -0,0 +1,215 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from src.constants import MAX_TOKENS
+from src.profiling import Profiler, LOG_LEVELS, setup_logging
+from benchmarks.corpus import build_corpus
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+STAGES = ("split", "tokenize", "inference")
+
+def train_tokenizer(corpus_dir, out_dir, vocab_size=2000):
+    """Trains a small byte-level BPE tokenizer on the corpus, with StarCoder's special tokens, so no download is needed."""
+    from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders
+    from transformers import PreTrainedTokenizerFast
+    from src.data.split_code import iter_code_files
+
+    def texts():
+        for file_path, _ in iter_code_files(corpus_dir):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                yield f.read()
+
+    special_tokens = ["<|endoftext|>", "<fim_prefix>", "<fim_middle>", "<fim_suffix>", "<fim_pad>"]
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=special_tokens,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(texts(), trainer)
+    fast_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token="<|endoftext|>", bos_token="<|endoftext|>", unk_token="<|endoftext|>",
+        additional_special_tokens=special_tokens[1:], model_max_length=MAX_TOKENS
+    )
+    fast_tokenizer.save_pretrained(out_dir)
+    return fast_tokenizer
+
+def build_tiny_model(tokenizer, out_dir, max_new_tokens, seed):
+    """Saves a randomly initialized two-layer StarCoder-architecture model, which runs anywhere on the CPU."""
+    import torch
+    from transformers import GPTBigCodeConfig, GPTBigCodeForCausalLM
+
+    torch.manual_seed(seed)
+    config = GPTBigCodeConfig(
+        vocab_size=len(tokenizer), n_positions=MAX_TOKENS + max_new_tokens, n_embd=128, n_layer=2, n_head=4,
+        eos_token_id=tokenizer.eos_token_id, bos_token_id=tokenizer.eos_token_id
+    )
+    GPTBigCodeForCausalLM(config).save_pretrained(out_dir)
+
+def run_suite(args, work_dir):
+    """Runs the selected stages on a synthetic corpus and returns their throughput and peak memory."""
+    from src.data.split_code import generate_split_stream
+    from src.data.tokenize_dataset import load_processed_examples, tokenize_examples
+
+    profiler = Profiler()
+    stages = {}
+    corpus_dir = os.path.join(work_dir, "corpus")
+    split_path = os.path.join(work_dir, "split.jsonl")
+    tokenizer_dir = os.path.join(work_dir, "tokenizer")
+    model_dir = os.path.join(work_dir, "model")
+
+    corpus = build_corpus(corpus_dir, args.num_files, seed=args.seed)
+    num_files = sum(stats["files"] for stats in corpus.values())
+    logger.info("Synthetic corpus: %s", json.dumps(corpus))
+
+    with profiler.stage("split") as stats:
+        num_examples = generate_split_stream(corpus_dir, split_path, num_examples=args.examples_per_file,
+                                             workers=args.workers, seed=args.seed)
+    stages["split"] = {
+        "files": num_files,
+        "examples": num_examples,
+        "seconds": stats["seconds"],
+        "files_per_second": num_files / stats["seconds"],
+        "examples_per_second": num_examples / stats["seconds"],
+        "peak_rss_mib": stats["peak_rss_mib"]
+    }
+
+    if "tokenize" in args.stages or "inference" in args.stages:
+        from src.models import get_tokenizer
+
+        train_tokenizer(corpus_dir, tokenizer_dir)
+        # Loaded (and memoized) before the stage, so the stage times tokenization rather than the import and load
+        tokenizer = get_tokenizer(tokenizer_dir)
+        entries = load_processed_examples(split_path)
+        with profiler.stage("tokenize") as stats:
+            tokenized = tokenize_examples(entries, workers=args.workers, model_id=tokenizer_dir)
+        num_tokens = sum(len(example[field][0]) for example in tokenized for field in ("prefix", "middle", "suffix"))
+        stages["tokenize"] = {
+            "examples": len(tokenized),
+            "tokens": num_tokens,
+            "seconds": stats["seconds"],
+            "examples_per_second": len(tokenized) / stats["seconds"],
+            "tokens_per_second": num_tokens / stats["seconds"],
+            "peak_rss_mib": stats["peak_rss_mib"]
+        }
+
+    if "inference" in args.stages:
+        import torch
+        from src.models import get_model
+        from src.inference.pipeline import run_inference_on_data
+
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        build_tiny_model(tokenizer, model_dir, args.max_new_tokens, args.seed)
+        model = get_model(model_dir, device="cpu")
+        examples = tokenized[:args.inference_examples]
+        inference_profiler = Profiler()
+        with profiler.stage("inference") as stats:
+            results = run_inference_on_data(model, tokenizer, examples, batch_size=args.batch_size,
+                                            max_new_tokens=args.max_new_tokens, profiler=inference_profiler)
+        summary = inference_profiler.summary()
+        generated_tokens = summary["stages"]["generate"]["tokens"]
+        forward = summary["forward"]
+        stages["inference"] = {
+            "examples": len(results),
+            "generated_tokens": generated_tokens,
+            "seconds": stats["seconds"],
+            "examples_per_second": len(results) / stats["seconds"],
+            "tokens_per_second": generated_tokens / stats["seconds"],
+            "prefill_tokens_per_second": forward["prefill"]["tokens_per_second"],
+            "decode_tokens_per_second": forward["decode"]["tokens_per_second"],
+            "peak_rss_mib": stats["peak_rss_mib"]
+        }
+    return {name: stats for name, stats in stages.items() if name in args.stages}
+
+def compare_to_baseline(report, baseline, tolerance):
+    """
+    Compares a benchmark report with a baseline report of the same configuration.
+
+    Throughputs (`*_per_second`) regress when they drop below (1 - tolerance) times the baseline,
+    and peak memory when it grows above (1 + tolerance) times the baseline.
+
+    Returns:
+        list: A (stage, measurement, baseline value, value, ratio, regressed) tuple per compared measurement.
+    """
+    rows = []
+    for stage, stats in report["stages"].items():
+        for name, value in stats.items():
+            base = baseline["stages"].get(stage, {}).get(name)
+            if not base or value is None or not (name.endswith("_per_second") or name == "peak_rss_mib"):
+                continue
+            ratio = value / base
+            regressed = ratio < 1 - tolerance if name.endswith("_per_second") else ratio > 1 + tolerance
+            rows.append((stage, name, base, value, ratio, regressed))
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the split, tokenize and inference stages on a synthetic corpus.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="Stages to benchmark.")
+    parser.add_argument("--num-files", type=int, default=1000, help="Number of synthetic code files.")
+    parser.add_argument("--examples-per-file", type=int, default=4, help="Examples split from every file.")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes of the split and tokenize stages.")
+    parser.add_argument("--inference-examples", type=int, default=32, help="Number of examples to run inference on.")
+    parser.add_argument("--max-new-tokens", type=int, default=32, help="Maximum tokens generated per example.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Inference batch size.")
+    parser.add_argument("--threads", type=int, default=None, help="Torch threads for inference.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus, the split and the model weights.")
+    parser.add_argument("--work-dir", default=None, help="Keep the corpus, split, tokenizer and model here instead of a temporary directory.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the baseline instead of comparing.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change before a measurement counts as a regression.")
+    parser.add_argument("--output", default=None, help="Write the report to this JSON file.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Logging level.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(args.log_level)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        stages = run_suite(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    import torch
+    report = {
+        "config": {key: getattr(args, key) for key in ("stages", "num_files", "examples_per_file", "workers",
+                                                       "inference_examples", "max_new_tokens", "batch_size", "threads", "seed")},
+        "environment": {"python": platform.python_version(), "torch": torch.__version__, "machine": platform.machine(),
+                        "cpu_count": os.cpu_count()},
+        "stages": stages
+    }
+    for stage, stats in stages.items():
+        logger.info("%s: %s", stage, ", ".join(f"{name} {value:.1f}" if isinstance(value, float) else f"{name} {value}"
+                                               for name, value in stats.items()))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        logger.info("Baseline saved to %s", args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        logger.error("No baseline at %s; run with --update-baseline on the reference machine to create one", args.baseline)
+        sys.exit(2)
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline["config"] != report["config"]:
+        logger.warning("The baseline was measured with a different configuration: %s", json.dumps(baseline["config"]))
+
+    rows = compare_to_baseline(report, baseline, args.tolerance)
+    for stage, name, base, value, ratio, regressed in rows:
+        logger.info("%-10s %-28s baseline %12.1f  now %12.1f  %6.2fx%s", stage, name, base, value, ratio,
+                    "  REGRESSION" if regressed else "")
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
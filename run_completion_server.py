@@ -0,0 +1,28 @@
+import asyncio
+import argparse
+from src.constants import MAX_NEW_TOKENS, SERVING_HOST, SERVING_PORT, SERVING_MAX_BATCH_SIZE
+from src.inference.fim import INFERENCE_MODES
+from src.models import get_model, get_tokenizer, add_model_args, model_kwargs
+from src.profiling import LOG_LEVELS, setup_logging
+from src.serving.engine import ContinuousBatcher
+from src.serving.server import CompletionServer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves streamed code completions with continuous batching.")
+    parser.add_argument("--host", default=SERVING_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=SERVING_PORT, help="Port to listen on.")
+    parser.add_argument("--max-batch-size", type=int, default=SERVING_MAX_BATCH_SIZE, help="Maximum number of requests decoded together.")
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS, help="Default maximum tokens generated per request.")
+    parser.add_argument("--mode", choices=INFERENCE_MODES, default="prefix", help="Default prompting mode of requests.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Logging level.")
+    add_model_args(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    model = get_model(args.model, **model_kwargs(args))
+    batcher = ContinuousBatcher(model, get_tokenizer(args.model), max_batch_size=args.max_batch_size)
+    server = CompletionServer(batcher, host=args.host, port=args.port, mode=args.mode, max_new_tokens=args.max_new_tokens)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,17 @@
+import argparse
+from src.constants import TOKENIZED_DATA_JSON, TOKENIZED_DATA_STORE
+from src.data.tokenized_store import TokenizedStore, convert_json_to_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts the tokenized dataset between the JSON file and the token store.")
+    parser.add_argument("--to-json", action="store_true", help="Export the token store to JSON instead.")
+    parser.add_argument("--json-path", default=TOKENIZED_DATA_JSON)
+    parser.add_argument("--store-path", default=TOKENIZED_DATA_STORE)
+    args = parser.parse_args()
+
+    if args.to_json:
+        TokenizedStore(args.store_path).to_json(args.json_path)
+        print(f"Exported {args.store_path} to {args.json_path}")
+    else:
+        store = convert_json_to_store(args.json_path, args.store_path)
+        print(f"Converted {len(store)} examples from {args.json_path} to {args.store_path}")
\ No newline at end of file
@@ -0,0 +1,30 @@
+import argparse
+import json
+from src.constants import DEDUP_DATA_JSONL, NUM_EXAMPLES, SPLIT_SEED, DEDUP_THRESHOLD
+from src.data.dedup import dedup_and_sample
+from src.data.tokenize_dataset import load_processed_examples
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drops near-duplicate split examples and samples them down, stratified by language and middle length.")
+    parser.add_argument("--input", default=None,
+                        help="Processed examples (JSON or JSONL); defaults to the JSONL splitter output if present.")
+    parser.add_argument("--output", default=DEDUP_DATA_JSONL, help="JSONL file to write the kept examples to.")
+    parser.add_argument("--target", type=int, default=NUM_EXAMPLES, help="Number of examples to keep; 0 keeps every distinct example.")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Estimated similarity of middle and prefix tail from which examples count as near-duplicates.")
+    parser.add_argument("--seed", type=int, default=SPLIT_SEED, help="Seed of the MinHash permutations and of the sampling.")
+    parser.add_argument("--report", default=None, help="Write the dedup and per-stratum counts to this JSON file.")
+    args = parser.parse_args()
+
+    examples = load_processed_examples(args.input)
+    kept, report = dedup_and_sample(examples, target=args.target or None, seed=args.seed, threshold=args.threshold)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for example in kept:
+            f.write(json.dumps(example) + '\n')
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    print(f"Dropped {report['near_duplicates']} near-duplicates of {report['examples']} examples, "
+          f"kept {report['kept']} and saved them to {args.output}")
+    print(f"Tokenize them with: python run_dataset_tokenizer.py --input {args.output}")
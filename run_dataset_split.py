@@ -1,4 +1,25 @@
-from src.data.split_code import generate_split
+import argparse
+from src.constants import SPLIT_SEED, PROCESSED_DATA_JSONL
+from src.data.split_code import generate_split, SPLIT_MODES
+from src.data.manifest import update_split
 
 if __name__ == "__main__":
-    generate_split()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Splits the raw code files into prefix/middle/suffix examples.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read each file once, split files in parallel and write examples incrementally as JSONL.")
+    parser.add_argument("--num-examples", type=int, default=4, help="Number of examples per file.")
+    parser.add_argument("--workers", type=int, default=0, help="Number of splitter worker processes (with --stream).")
+    parser.add_argument("--seed", type=int, default=SPLIT_SEED, help="Run seed the per-file seeds are derived from (with --stream).")
+    parser.add_argument("--split-mode", choices=SPLIT_MODES, default="line",
+                        help="'syntax' draws split points at statement and identifier boundaries found by a per-language lexer.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-split only raw files added or changed since the last run and drop deleted ones (implies --stream).")
+    args = parser.parse_args()
+
+    if args.incremental:
+        stats = update_split(num_examples=args.num_examples, workers=args.workers, seed=args.seed, split_mode=args.split_mode)
+        print(f"Split {stats['added']} added and {stats['changed']} changed files, kept {stats['unchanged']}, "
+              f"dropped {stats['deleted']} deleted; {stats['examples']} examples in {PROCESSED_DATA_JSONL}")
+    else:
+        generate_split(stream=args.stream, num_examples=args.num_examples, workers=args.workers, seed=args.seed,
+                       split_mode=args.split_mode)
@@ -1,4 +1,22 @@
+import argparse
+from src.constants import PROCESSED_DATA_JSONL, TOKENIZED_DATA_STORE
 from src.data.tokenize_dataset import tokenize_dataset
+from src.data.manifest import update_tokenized
 
 if __name__ == "__main__":
-    tokenize_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tokenizes the processed dataset into the memory-mapped token store.")
+    parser.add_argument("--input", default=None,
+                        help="Processed examples (JSON or JSONL); defaults to the JSONL splitter output if present.")
+    parser.add_argument("--json", action="store_true", help="Also export the tokenized dataset as JSON, for debugging.")
+    parser.add_argument("--workers", type=int, default=0, help="Number of tokenizer worker processes.")
+    parser.add_argument("--verify", action="store_true", help="Check batched token ids against per-example encoding.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-tokenize only the examples of source files that changed since the last run (needs the JSONL splitter output).")
+    args = parser.parse_args()
+
+    if args.incremental:
+        stats = update_tokenized(input_path=args.input or PROCESSED_DATA_JSONL, workers=args.workers)
+        print(f"Re-tokenized {stats['retokenized']} source files, copied {stats['copied']}, dropped {stats['dropped']}; "
+              f"{stats['examples']} examples in {TOKENIZED_DATA_STORE}")
+    else:
+        tokenize_dataset(export_json=args.json, workers=args.workers, verify=args.verify, input_path=args.input)
@@ -0,0 +1,38 @@
+import json
+import asyncio
+import argparse
+from src.constants import TOKENIZED_DATA_JSON, SERVING_HOST, SERVING_PORT
+from src.data.tokenized_store import load_tokenized
+from src.inference.fim import INFERENCE_MODES
+from src.inference.stopping import STOP_RULES
+from src.serving.load_generator import replay_payloads, replay
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays the tokenized dataset against the completion server and reports latency.")
+    parser.add_argument("--host", default=SERVING_HOST, help="Server address.")
+    parser.add_argument("--port", type=int, default=SERVING_PORT, help="Server port.")
+    parser.add_argument("--data", default=TOKENIZED_DATA_JSON, help="Tokenized dataset: JSON file or token store directory.")
+    parser.add_argument("--num-requests", type=int, default=None, help="Replay only the first N examples.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum number of requests in flight.")
+    parser.add_argument("--rate", type=float, default=None, help="Poisson arrival rate in requests per second; default sends back to back.")
+    parser.add_argument("--mode", choices=INFERENCE_MODES, default="prefix", help="Prompting mode of the requests.")
+    parser.add_argument("--max-new-tokens", type=int, default=None, help="Maximum tokens generated per request; defaults to the server's.")
+    parser.add_argument("--stop-on", nargs="+", choices=[rule for rule in STOP_RULES if rule != "tokens"], default=None,
+                        help="Stop rules the server applies to each request.")
+    parser.add_argument("--max-lines", type=int, default=None, help="Line budget of the lines stop rule.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the arrival times.")
+    parser.add_argument("--output", default=None, help="Write the per-request results and the summary to this JSON file.")
+    args = parser.parse_args()
+    if args.stop_on and "lines" in args.stop_on and not args.max_lines:
+        parser.error("--stop-on lines needs --max-lines")
+
+    tokenized_data = load_tokenized(args.data)
+    count = len(tokenized_data) if args.num_requests is None else min(args.num_requests, len(tokenized_data))
+    payloads = replay_payloads([tokenized_data[index] for index in range(count)], args.mode, args.max_new_tokens,
+                               args.stop_on, args.max_lines)
+    results, summary = asyncio.run(replay(payloads, args.host, args.port, args.concurrency, args.rate, args.seed))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "results": results}, f, indent=4)
+    print(json.dumps(summary, indent=4))
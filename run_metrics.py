@@ -0,0 +1,38 @@
+import os
+import argparse
+import json
+from src.evaluation.metrics import load_results, score_results, corpus_scores
+from src.inference.results_log import load_configs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scores an inference results file in bulk, separately from the GPU job.")
+    parser.add_argument("results", help="Inference results: JSON, JSONL or a run directory, whose shards are merged.")
+    parser.add_argument("--config", default=None,
+                        help="Only score the results of this config hash; a run directory is otherwise reported per config.")
+    parser.add_argument("--output", default=None, help="Write the scored results to this JSON file.")
+    parser.add_argument("--report", default=None, help="Write the per-language corpus report to this JSON file.")
+    parser.add_argument("--workers", type=int, default=0, help="Number of metric worker processes.")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.results) and args.config is None:
+        # One report per config, as in the run's report.json, so modes and settings are never averaged together
+        results = []
+        report = {}
+        for config_hash, config in load_configs(args.results).items():
+            config_results = score_results(load_results(args.results, config_hash), workers=args.workers)
+            if not config_results:
+                continue
+            results.extend(config_results)
+            report[config_hash] = {"config": config, "examples": len(config_results),
+                                   "metrics": corpus_scores(config_results)}
+    else:
+        results = score_results(load_results(args.results, args.config), workers=args.workers)
+        report = corpus_scores(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
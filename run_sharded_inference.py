@@ -0,0 +1,132 @@
+import argparse
+import json
+import logging
+import os
+from src.constants import (TOKENIZED_DATA_JSON, TOKENIZED_DATA_STORE, MAX_NEW_TOKENS, MAX_BATCH_TOKENS,
+                           CACHE_DIR, CACHE_MAX_BYTES, RUNS_DIR, SHARD_CHUNK_SIZE)
+from src.data.tokenized_store import load_tokenized
+from src.models import add_model_args, model_kwargs
+from src.inference.cache import ArtifactCache
+from src.inference.fim import INFERENCE_MODES, compare_modes
+from src.inference.pipeline import run_config, generation_conflicts
+from src.inference.results_log import ResultsLog, example_ids, merge_results
+from src.inference.sharding import plan_chunks, run_sharded, default_threads_per_worker
+from src.inference.stopping import STOP_RULES
+from src.evaluation.metrics import corpus_scores
+from src.profiling import LOG_LEVELS, setup_logging
+
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs code completion evaluation with one model replica per worker process.")
+    parser.add_argument("--data", default=TOKENIZED_DATA_STORE if os.path.isdir(TOKENIZED_DATA_STORE) else TOKENIZED_DATA_JSON,
+                        help="Tokenized dataset: a token store directory or a tokenized JSON file.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+    parser.add_argument("--devices", nargs="+", default=["cpu"],
+                        help="Devices assigned to the workers in turn, e.g. cuda:0 cuda:1.")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Torch threads per worker; defaults to the CPU cores split evenly between workers.")
+    parser.add_argument("--chunk-size", type=int, default=SHARD_CHUNK_SIZE, help="Examples per chunk handed to a worker.")
+    parser.add_argument("--run-dir", default=os.path.join(RUNS_DIR, "sharded"),
+                        help="Run directory the coordinator appends the results log to.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip examples the run directory already has results for with the same config.")
+    parser.add_argument("--mode", choices=INFERENCE_MODES + ("both",), default="prefix",
+                        help="Prompt with the prefix only, with fill-in-the-middle, or run both and compare.")
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS, help="Maximum tokens generated per example.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Generate each chunk in batches of this size.")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS,
+                        help="Maximum padded prompt tokens per batched generate call.")
+    parser.add_argument("--share-prefix", action="store_true", help="Share prefilled KV caches within each chunk.")
+    parser.add_argument("--speculative", choices=["prompt-lookup", "draft-model"], default=None,
+                        help="Assisted greedy decoding with n-gram lookup or a draft model.")
+    parser.add_argument("--draft-model", default="bigcode/tiny_starcoder_py",
+                        help="Draft model used with --speculative draft-model.")
+    parser.add_argument("--stop-on", nargs="+", choices=STOP_RULES, default=None,
+                        help="Stop each generation when its middle is complete, see run_starcoder_inference.py.")
+    parser.add_argument("--embedding-model", default=None,
+                        help="Sentence-transformers model used for cosine similarity instead of the generating model.")
+    parser.add_argument("--skip-metrics", action="store_true", help="Only generate and embed.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of the on-disk artifact cache.")
+    parser.add_argument("--cache-max-bytes", type=int, default=CACHE_MAX_BYTES,
+                        help="Size cap of the cache shared by the workers; least recently used entries are evicted beyond it.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk cache.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Logging level of the coordinator.")
+    # --model bigcode/tiny_starcoder_py shares StarCoder's tokenizer and makes a quick CPU run
+    add_model_args(parser)
+    args = parser.parse_args()
+    for conflict in generation_conflicts(args.batch_size, args.share_prefix, args.speculative):
+        parser.error(conflict)
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(args.log_level)
+    threads_per_worker = args.threads_per_worker or default_threads_per_worker(args.workers)
+    modes = INFERENCE_MODES if args.mode == "both" else (args.mode,)
+
+    tokenized_data = load_tokenized(args.data)
+    ids = example_ids(tokenized_data)
+    prefix_lengths = {idx: len(entry['prefix'][0]) for idx, entry in enumerate(tokenized_data)}
+
+    # One results log per mode, written by this process only; workers just send their results back
+    logs = {}
+    tasks = []
+    for mode in modes:
+        config = run_config(args.model, mode, stop_rules=args.stop_on, embedding_model=args.embedding_model,
+                            compute_metrics=not args.skip_metrics, max_new_tokens=args.max_new_tokens,
+                            precision=args.precision)
+        logs[mode] = ResultsLog(args.run_dir, config, shard="sharded")
+        done = logs[mode].completed() if args.resume else set()
+        pending = {idx: length for idx, length in prefix_lengths.items() if ids[idx] not in done}
+        if done:
+            logger.info("Resuming %s: %d of %d examples already done", mode, len(prefix_lengths) - len(pending), len(prefix_lengths))
+        tasks.extend((mode, chunk) for chunk in plan_chunks(pending, args.chunk_size))
+
+    def log_chunk(mode, indices, chunk_results):
+        logs[mode].append([ids[idx] for idx in indices], chunk_results)
+
+    logger.info("Running %d chunks on %d workers (%d threads each)", len(tasks), args.workers, threads_per_worker)
+    try:
+        _, worker_stats = run_sharded(
+            args.data, tasks, args.model,
+            model_options=model_kwargs(args),
+            devices=args.devices,
+            threads_per_worker=threads_per_worker,
+            num_workers=args.workers,
+            draft_model_id=args.draft_model if args.speculative == "draft-model" else None,
+            on_result=log_chunk,
+            batch_size=args.batch_size,
+            max_batch_tokens=args.max_batch_tokens,
+            embedding_model=args.embedding_model,
+            cache=None if args.no_cache else ArtifactCache(args.cache_dir, args.cache_max_bytes),
+            compute_metrics=not args.skip_metrics,
+            share_prefix=args.share_prefix,
+            speculative=args.speculative,
+            stop_rules=args.stop_on,
+            max_new_tokens=args.max_new_tokens
+        )
+    finally:
+        for results_log in logs.values():
+            results_log.close()
+
+    for worker_index, stats in sorted(worker_stats.items()):
+        logger.info("Worker %d (%s): %d examples, %.2f examples/s, %.1f tokens/s, loaded in %.1fs", worker_index,
+                    stats['device'], stats['examples'], stats['examples_per_second'], stats['tokens_per_second'],
+                    stats['load_seconds'])
+
+    # Only the configs of this run are reported, one report per mode; other configs in the directory are left out
+    results = []
+    report = {"workers": worker_stats, "configs": {}}
+    for mode, results_log in logs.items():
+        mode_results = merge_results(args.run_dir, results_log.config_hash)
+        results.extend(mode_results)
+        report["configs"][mode] = {"config_hash": results_log.config_hash, "config": results_log.config,
+                                   "examples": len(mode_results)}
+        if not args.skip_metrics:
+            report["configs"][mode]["metrics"] = corpus_scores(mode_results)
+    if len(modes) > 1:
+        report["modes"] = compare_modes(results)
+    with open(os.path.join(args.run_dir, "report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    logger.info("Report over %d results saved to %s", len(results), os.path.join(args.run_dir, 'report.json'))
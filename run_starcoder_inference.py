@@ -1,142 +1,209 @@
+import argparse
 import json
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from src.constants import TOKENIZED_DATA_JSON
+from src.constants import TOKENIZED_DATA_JSON, TOKENIZED_DATA_STORE, MAX_BATCH_TOKENS, CACHE_DIR, CACHE_MAX_BYTES, RESULTS_FLUSH_EVERY, RUNS_DIR
 from src.utils import get_device
-from sacrebleu import sentence_chrf
-
-from Levenshtein import distance as levenshtein_distance
-from sentence_transformers import SentenceTransformer, util
+from src.models import get_model, get_tokenizer, add_model_args, model_kwargs
+from src.profiling import Profiler, LOG_LEVELS, setup_logging, parse_window
+from src.inference import pipeline
+from src.inference.stopping import STOP_RULES
+from src.inference.fim import INFERENCE_MODES, compare_modes
+from src.inference.embeddings import StarCoderEmbedder
+from src.inference.cache import ArtifactCache
+from src.inference.results_log import ResultsLog, config_hash, example_ids, merge_results
+from src.data.tokenized_store import load_tokenized
+import os
+from src.evaluation.metrics import corpus_scores
+import logging
 import warnings
-from collections import Counter
-import torch.nn.functional as F
 warnings.filterwarnings("ignore")
 
-# Load the tokenizer and model for StarCoder
-tokenizer = AutoTokenizer.from_pretrained("bigcode/starcoder", use_auth_token=True)
-model = AutoModelForCausalLM.from_pretrained("bigcode/starcoder", use_auth_token=True)
-model.to(get_device())
-model.eval()
+logger = logging.getLogger(__name__)
+
+# The tokenizer and model for StarCoder are loaded on first use through src/models.py, so importing
+# this module for a helper stays cheap; the helpers below use the default StarCoder model
 
-# Load tokenized data from a JSON file
+# Load tokenized data from a token store directory or a JSON file
 def load_tokenized_data(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return load_tokenized(file_path)
 
 def get_starcoder_embedding(code_text):
     # When computing the cosine similarity between two pieces of code,
     #we want to measure how similar their meanings are in the model's learned representation space,
     #to do this, we need to obtain the embeddings of the code snippets, not just their token ids.
-    inputs = tokenizer.encode(code_text, return_tensors='pt', truncation=True).to(get_device())
-    with torch.no_grad():
-        outputs = model(inputs, output_hidden_states=True)
-    last_hidden_state = outputs.hidden_states[-1]  
-    embedding = torch.mean(last_hidden_state, dim=1)  
-    return embedding
-
-def compute_codebleu(preds, refs, lang="python"):
-    #Simplified version of codebleu, I had some error with the codexglue repo
-    #Here, I'll compute n gram matching score as a placeholder
-
-    def ngram_match_score(candidate, reference, n):
-        def ngram_counter(text, n):
-            tokens = text.split()
-            return Counter([tuple(tokens[i:i+n]) for i in range(len(tokens)-n+1)])
-        candidate_ngrams = ngram_counter(candidate, n)
-        reference_ngrams = ngram_counter(reference, n)
-        overlap = sum((candidate_ngrams & reference_ngrams).values())
-        total = sum(candidate_ngrams.values())
-        return overlap / total if total > 0 else 0
-
-    # Compute n gram scores
-    ngram_scores = []
-    for n in range(1, 5):
-        score = ngram_match_score(preds, refs, n)
-        ngram_scores.append(score)
-    # Average n gram scores as a placeholder for Codebleu
-    codebleu_score = sum(ngram_scores) / len(ngram_scores) * 100
-    return codebleu_score
-
-def run_inference_on_data(tokenized_data):
-    inference_results = []
-
-    for idx, entry in enumerate(tokenized_data):
-        input_ids = torch.tensor(entry['prefix'][0]).unsqueeze(0).to(get_device())
-        attention_mask = torch.ones_like(input_ids).to(get_device())
-        with torch.no_grad():
-            outputs = model.generate(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                max_new_tokens=200,
-                num_return_sequences=1,
-                do_sample=False  # Disable sampling for deterministic results
-            )
-            generated_ids = outputs[0]
-            #Exclude the input_ids from the generated_ids to get the new tokens
-            generated_tokens = generated_ids[input_ids.shape[1]:]
-            generated_text = tokenizer.decode(generated_tokens, skip_special_tokens=True)
-
-        # Decode the true middle text
-        true_middle_text = tokenizer.decode(entry['middle'][0], skip_special_tokens=True)
-        input_text = tokenizer.decode(entry['prefix'][0], skip_special_tokens=True)
-
-
-        # Get the programming language from the entry
-        lang = entry['language']  
-
-        # Compute Exact Match
-        exact_match = int(generated_text.strip() == true_middle_text.strip())
-
-        # Compute chrF
-        chrf_score = sentence_chrf(generated_text, [true_middle_text]).score
-
-        # Compute Levenshtein distance
-        lev_distance = levenshtein_distance(generated_text, true_middle_text)
-
-        # Compute Cosine similarity of embeddings
-        embedding1 = get_starcoder_embedding(generated_text)
-        embedding2 = get_starcoder_embedding(true_middle_text)
-        cosine_sim = F.cosine_similarity(embedding1, embedding2).item()
-
-        # Compute Codebleu
-        codebleu_score = compute_codebleu(generated_text, true_middle_text, lang)
-
-        # Print the results for each metric
-        print(f"Example {idx + 1}:")
-        print("Input text:")
-        print(input_text)
-        print("\nGenerated text:")
-        print(generated_text)
-        print("\nTrue middle text:")
-        print(true_middle_text)
-        print("\nMetrics:")
-        print(f"Language: {lang}")
-        print(f"Exact match: {exact_match}")
-        print(f"Chrf score: {chrf_score:.4f}")
-        print(f"Levenshtein distance: {lev_distance}")
-        print(f"Cosine similarity: {cosine_sim:.4f}")
-        print(f"Codebleu score: {codebleu_score:.2f}")
-
-
-        inference_results.append({
-            "input": input_text,
-            "generated": generated_text,
-            "true_middle": true_middle_text,
-            "language": lang,
-            "metrics": {
-                "exact_match": exact_match,
-                "chrf": chrf_score,
-                "levenshtein_distance": lev_distance,
-                "cosine_similarity": cosine_sim,
-                "codebleu": codebleu_score
-            }
-        })
-
-    return inference_results
+    return StarCoderEmbedder(get_model(), get_tokenizer(), device=get_device()).embed([code_text])
+
+def generate_single(prefix_ids, stop_rule=None):
+    # Generates the continuation of one prefix with batch size 1
+    return pipeline.generate_single(get_model(), get_tokenizer(), prefix_ids, stop_rule, device=get_device())
+
+def run_inference_on_data(tokenized_data, **kwargs):
+    return pipeline.run_inference_on_data(get_model(), get_tokenizer(), tokenized_data, device=get_device(), **kwargs)
+
+def __getattr__(name):
+    # compute_codebleu used to be defined here; it lives with the other metrics now and is imported on first access
+    if name == "compute_codebleu":
+        from src.evaluation.metrics import compute_codebleu
+        return compute_codebleu
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs StarCoder code completion and evaluation on the tokenized dataset.")
+    parser.add_argument("--data", default=TOKENIZED_DATA_STORE if os.path.isdir(TOKENIZED_DATA_STORE) else TOKENIZED_DATA_JSON,
+                        help="Tokenized dataset: a token store directory or a tokenized JSON file.")
+    parser.add_argument("--mode", choices=INFERENCE_MODES + ("both",), default="prefix",
+                        help="Prompt with the prefix only, with StarCoder's fill-in-the-middle format, or run both and compare.")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Generate in length-bucketed batches of this size instead of one example at a time.")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS,
+                        help="Maximum padded prompt tokens per batched generate call.")
+    parser.add_argument("--share-prefix", action="store_true",
+                        help="Prefill the leading tokens shared by several examples once and fork generation from that KV cache.")
+    parser.add_argument("--speculative", choices=["prompt-lookup", "draft-model"], default=None,
+                        help="Assisted greedy decoding: draft tokens by n-gram lookup in the prefix and suffix, or with a small draft model.")
+    parser.add_argument("--draft-model", default="bigcode/tiny_starcoder_py",
+                        help="Draft model sharing StarCoder's tokenizer, used with --speculative draft-model.")
+    parser.add_argument("--stop-on", nargs="+", choices=STOP_RULES, default=None,
+                        help="Stop each generation when its middle is complete: after the reference's line count (lines), "
+                             "at the first line of the suffix (suffix), at the end of the enclosing block (block), "
+                             "or at a token budget scaled from the reference length (tokens).")
+    parser.add_argument("--embedding-model", default=None,
+                        help="Sentence-transformers model used for cosine similarity instead of StarCoder itself.")
+    parser.add_argument("--reuse-generation-states", action="store_true",
+                        help="Embed generated texts from the hidden states of generation, and references after the same "
+                             "prompt, reported as contextual_cosine_similarity (batched mode only).")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help="Directory of the on-disk cache for reference embeddings, decoded texts and token ids.")
+    parser.add_argument("--cache-max-bytes", type=int, default=CACHE_MAX_BYTES,
+                        help="Size cap of the cache; least recently used entries are evicted beyond it.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk cache.")
+    parser.add_argument("--skip-metrics", action="store_true",
+                        help="Only generate and embed; score the text metrics later with run_metrics.py.")
+    parser.add_argument("--metric-workers", type=int, default=0, help="Number of metric worker processes.")
+    parser.add_argument("--output", default=None, help="Write the inference results to this JSON file.")
+    parser.add_argument("--run-dir", default=None,
+                        help="Append results to a JSONL log in this run directory after every chunk, so a crashed run can resume.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip examples the run directory already has results for with the same config.")
+    parser.add_argument("--flush-every", type=int, default=RESULTS_FLUSH_EVERY,
+                        help="Number of examples generated between results log flushes.")
+    parser.add_argument("--num-shards", type=int, default=1, help="Split the dataset into this many shards.")
+    parser.add_argument("--shard-index", type=int, default=0, help="The shard this process runs.")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO",
+                        help="DEBUG also logs every example with its generated text and metrics.")
+    parser.add_argument("--profile-output", default=None,
+                        help="Write the per-stage profile summary to this JSON file (default: profile.json in the run directory).")
+    parser.add_argument("--profile-window", default=None,
+                        help="Record a torch profiler trace of the examples in this START:END window.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Load the data and print the run plan without loading the model or generating.")
+    add_model_args(parser)
+    args = parser.parse_args()
+    for conflict in pipeline.generation_conflicts(args.batch_size, args.share_prefix, args.speculative,
+                                                  args.reuse_generation_states):
+        parser.error(conflict)
+    return args
 
 if __name__ == "__main__":
-    # Load the tokenized data
-    tokenized_data = load_tokenized_data(TOKENIZED_DATA_JSON)
-
-    # Run inference
-    results = run_inference_on_data(tokenized_data)
+    args = parse_args()
+    setup_logging(args.log_level)
+    if args.resume and not args.run_dir:
+        raise SystemExit("--resume needs --run-dir")
+
+    # Load the tokenized data; with several shards, this process takes every num_shards-th example
+    tokenized_data = load_tokenized_data(args.data)
+    ids = example_ids(tokenized_data)
+    shard = list(range(args.shard_index, len(ids), args.num_shards))
+    tokenized_data = [tokenized_data[idx] for idx in shard]
+    ids = [ids[idx] for idx in shard]
+    modes = INFERENCE_MODES if args.mode == "both" else (args.mode,)
+    configs = {
+        mode: pipeline.run_config(args.model, mode, stop_rules=args.stop_on, embedding_model=args.embedding_model,
+                                  reuse_generation_states=args.reuse_generation_states,
+                                  compute_metrics=not args.skip_metrics, precision=args.precision)
+        for mode in modes
+    }
+
+    if args.dry_run:
+        # Checks the data and settings in seconds, before committing to loading a 15B model
+        logger.info("Data: %s (%d examples in shard %d of %d)", args.data, len(tokenized_data), args.shard_index, args.num_shards)
+        logger.info("Model: %s (%s)", args.model, json.dumps(model_kwargs(args)))
+        for mode, config in configs.items():
+            logger.info("Mode %s: config %s %s", mode, config_hash(config), json.dumps(config))
+        if args.run_dir and args.resume:
+            for mode, config in configs.items():
+                done = {record["example_id"] for record in merge_results(args.run_dir, config_hash(config))}
+                logger.info("Mode %s: %d examples already done in %s", mode, sum(example_id in done for example_id in ids), args.run_dir)
+        raise SystemExit(0)
+
+    cache = None if args.no_cache else ArtifactCache(args.cache_dir, args.cache_max_bytes)
+    model = get_model(args.model, **model_kwargs(args))
+    tokenizer = get_tokenizer(args.model)
+
+    draft_model = None
+    if args.speculative == "draft-model":
+        draft_model = get_model(args.draft_model, **model_kwargs(args))
+
+    profiler = Profiler(trace_dir=args.run_dir or os.path.join(RUNS_DIR, "traces"))
+    profile_window = parse_window(args.profile_window) if args.profile_window else None
+
+    # Run inference, once per mode
+    results = []
+    for mode in modes:
+        inference_kwargs = dict(
+            batch_size=args.batch_size,
+            max_batch_tokens=args.max_batch_tokens,
+            embedding_model=args.embedding_model,
+            reuse_generation_states=args.reuse_generation_states,
+            cache=cache,
+            compute_metrics=not args.skip_metrics,
+            metric_workers=args.metric_workers,
+            share_prefix=args.share_prefix,
+            speculative=args.speculative,
+            draft_model=draft_model,
+            stop_rules=args.stop_on,
+            mode=mode,
+            device=get_device(),
+            profiler=profiler,
+            profile_window=profile_window
+        )
+        if args.run_dir:
+            with ResultsLog(args.run_dir, configs[mode], shard=f"{args.shard_index}-of-{args.num_shards}") as results_log:
+                results.extend(pipeline.run_logged(model, tokenizer, tokenized_data, results_log, ids, resume=args.resume,
+                                                   flush_every=args.flush_every, **inference_kwargs))
+        else:
+            results.extend(pipeline.run_logged(model, tokenizer, tokenized_data, None, ids, **inference_kwargs))
+
+    profile_output = args.profile_output or (os.path.join(args.run_dir, "profile.json") if args.run_dir else None)
+    if profile_output:
+        profiler.write(profile_output)
+    summary = profiler.summary()
+    for name, stats in summary["stages"].items():
+        logger.info("Stage %s: %.2fs over %d calls, peak RSS %.0f MiB", name, stats["seconds"], stats["calls"], stats["peak_rss_mib"])
+    for kind, stats in summary["forward"].items():
+        if stats["passes"]:
+            logger.info("%s: %d tokens in %d forward passes, %.1f tokens/s", kind.capitalize(), stats["tokens"],
+                        stats["passes"], stats["tokens_per_second"])
+
+    if args.run_dir:
+        # The report covers every shard of the run directory, including those finished by earlier or parallel runs,
+        # but only the configs of this run, with one report per mode; other configs in the directory are left out
+        results = []
+        report = {}
+        for mode, config in configs.items():
+            mode_results = merge_results(args.run_dir, config_hash(config))
+            results.extend(mode_results)
+            report[mode] = {"config_hash": config_hash(config), "config": config, "examples": len(mode_results)}
+            if not args.skip_metrics:
+                report[mode]["metrics"] = corpus_scores(mode_results)
+        if not args.skip_metrics:
+            with open(os.path.join(args.run_dir, "report.json"), 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=4)
+            logger.info("Report over %d results saved to %s", len(results), os.path.join(args.run_dir, 'report.json'))
+
+    if len(modes) > 1:
+        logger.info(json.dumps(compare_modes(results), indent=4))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        logger.info("Inference results saved to %s", args.output)
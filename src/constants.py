@@ -10,6 +10,10 @@ TOKENIZED_DATA_DIR = os.path.join(DATA_DIR, "tokenized")
 
 PROCESSED_DATA_JSON = os.path.join(PROCESSED_DATA_DIR, "code_completion_dataset.json")
 TOKENIZED_DATA_JSON = os.path.join(TOKENIZED_DATA_DIR, "tokenized_dataset.json")
+# Memory-mapped binary store of the tokenized dataset, see src/data/tokenized_store.py
+TOKENIZED_DATA_STORE = os.path.join(TOKENIZED_DATA_DIR, "tokenized_dataset")
+
+MODEL_ID = "bigcode/starcoder"
 
 MAX_TOKENS = 1024
 NUM_EXAMPLES = 50
@@ -17,3 +21,64 @@ NUM_EXAMPLES = 50
 MIN_PREFIX_LENGTH = 50
 MIN_SUFFIX_LENGTH = 0
 
+
+MAX_NEW_TOKENS = 200
+INFERENCE_BATCH_SIZE = 8
+# Upper bound on padded prompt tokens (batch size x longest prefix) per generate call
+MAX_BATCH_TOKENS = 8192
+EMBEDDING_BATCH_SIZE = 32
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Examples per task sent to a tokenizer worker process
+TOKENIZE_CHUNK_SIZE = 256
+
+# Streaming splitter output and the run seed its per-file seeds are derived from
+PROCESSED_DATA_JSONL = os.path.join(PROCESSED_DATA_DIR, "code_completion_dataset.jsonl")
+SPLIT_SEED = 0
+
+# Examples per task sent to a metrics worker process
+METRICS_CHUNK_SIZE = 256
+
+# Minimum number of leading prompt tokens examples must share to reuse one prefilled KV cache
+PREFIX_SHARE_MIN_TOKENS = 32
+
+# Speculative decoding: draft tokens proposed per verification pass, longest n-gram prompt lookup matches
+NUM_DRAFT_TOKENS = 8
+PROMPT_LOOKUP_MAX_NGRAM = 3
+
+# Token budget stopping rule: generate at most factor x reference middle tokens + slack
+TOKEN_BUDGET_FACTOR = 1.5
+TOKEN_BUDGET_SLACK = 8
+
+# Resumable runs: run directories and the number of examples generated between results log flushes
+RUNS_DIR = os.path.join(DATA_DIR, "runs")
+RESULTS_FLUSH_EVERY = 32
+
+# Examples per chunk handed to a sharded inference worker
+SHARD_CHUNK_SIZE = 8
+
+# Incremental dataset builds: per raw file content hashes and seeds of the streaming splitter output
+SPLIT_MANIFEST = os.path.join(PROCESSED_DATA_DIR, "manifest.json")
+
+# Syntax-aware split points: per-file indexes of statement and identifier boundaries, keyed by file content
+SYNTAX_INDEX_CACHE_DIR = os.path.join(CACHE_DIR, "syntax_index")
+
+# Near-duplicate filtering between split and tokenize: MinHash signatures over token 3-grams of the middle
+# and the last prefix characters, banded for LSH (8 bands of 8 rows match pairs from about 0.77 similarity)
+DEDUP_DATA_JSONL = os.path.join(PROCESSED_DATA_DIR, "code_completion_dataset.dedup.jsonl")
+DEDUP_PREFIX_TAIL_CHARS = 200
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 8
+DEDUP_THRESHOLD = 0.8
+# Shingles hashed per vectorized MinHash step; the (shingles x permutations) working array stays in cache
+DEDUP_CHUNK_SHINGLES = 1 << 14
+# Upper edges, in characters, of the middle length strata sampled from
+MIDDLE_LENGTH_BINS = (32, 96, 256)
+
+# Completion server: address, requests decoded together, and requests kept for latency percentiles
+SERVING_HOST = "127.0.0.1"
+SERVING_PORT = 8765
+SERVING_MAX_BATCH_SIZE = 8
+SERVING_STATS_WINDOW = 10000
@@ -0,0 +1,223 @@
+import re
+import zlib
+import itertools
+import random
+import bisect
+import numpy as np
+from collections import defaultdict
+from src.constants import (NUM_EXAMPLES, SPLIT_SEED, DEDUP_PREFIX_TAIL_CHARS, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD,
+                           DEDUP_CHUNK_SHINGLES, MIDDLE_LENGTH_BINS)
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SHINGLE_SIZE = 3
+# Bucket members a new example is compared with; bounds the work when many examples share a band
+MAX_BUCKET_COMPARISONS = 8
+
+class TokenHashes(dict):
+    """A token to crc32 memo; crc32 rather than `hash`, which differs between processes."""
+
+    def __missing__(self, token):
+        value = self[token] = zlib.crc32(token.encode("utf-8"))
+        return value
+
+def token_hashes_of(text, token_hashes):
+    """
+    Hashes the tokens of a text, the units its shingles are made of.
+
+    Tokens are words and single punctuation characters, so whitespace and indentation changes do not make
+    two snippets look different. Texts with fewer than SHINGLE_SIZE tokens are padded with zeros, so every
+    text has at least one shingle.
+
+    Parameters:
+        text (str): The text to tokenize.
+        token_hashes (TokenHashes): The token hash memo, shared across texts.
+
+    Returns:
+        list: The crc32 of every token.
+    """
+    hashes = [token_hashes[token] for token in TOKEN_PATTERN.findall(text)]
+    return hashes + [0] * (SHINGLE_SIZE - len(hashes)) if len(hashes) < SHINGLE_SIZE else hashes
+
+def dedup_text(example, prefix_tail_chars=DEDUP_PREFIX_TAIL_CHARS):
+    """The part of an example near-duplicates are detected on: the middle and the end of the prefix."""
+    return example["prefix"][-prefix_tail_chars:] + "\n" + example["middle"]
+
+def _signature_chunk(texts_tokens, a, b):
+    # Token 3-gram hashes of every text of the chunk at once: windows are taken over the concatenated
+    # tokens, and the windows that straddle two texts are skipped
+    lengths = np.fromiter((len(tokens) for tokens in texts_tokens), dtype=np.int64, count=len(texts_tokens))
+    ids = np.fromiter(itertools.chain.from_iterable(texts_tokens), dtype=np.uint64, count=int(lengths.sum()))
+    combined = ids[:-2] * np.uint64(0x9E3779B1) + ids[1:-1] * np.uint64(0x85EBCA77) + ids[2:]
+    counts = lengths - (SHINGLE_SIZE - 1)
+    token_starts = np.cumsum(lengths) - lengths
+    shingle_starts = np.cumsum(counts) - counts
+    windows = np.repeat(token_starts - shingle_starts, counts) + np.arange(counts.sum())
+    shingles = combined[windows]
+    shingles ^= shingles >> np.uint64(32)
+    shingles &= np.uint64(0xFFFFFFFF)
+    # Permutations along the rows, so each text's minimum is a reduction over contiguous memory
+    permuted = a[:, None] * shingles[None, :]
+    permuted += b[:, None]
+    permuted >>= np.uint64(32)
+    return np.minimum.reduceat(permuted, shingle_starts, axis=1).T.astype(np.uint32)
+
+def minhash_signatures(texts, num_perm=DEDUP_NUM_PERM, seed=SPLIT_SEED, chunk_shingles=DEDUP_CHUNK_SHINGLES):
+    """
+    Computes MinHash signatures of texts over their token 3-grams, in vectorized chunks.
+
+    Each permutation is a multiply-shift hash, (a * x + b) >> 32 with wrapping 64-bit arithmetic, which
+    numpy evaluates much faster than a modular one. The shingles of many texts are hashed and permuted
+    together as one (permutations x shingles) array, and each text's minimum is taken with
+    `np.minimum.reduceat`, so the cost is linear in the total number of shingles.
+
+    Parameters:
+        texts (iterable): The texts to sign.
+        num_perm (int): The number of hash permutations, the signature length.
+        seed (int): The seed of the permutations.
+        chunk_shingles (int): The number of shingles permuted per step.
+
+    Returns:
+        np.ndarray: A uint32 array of shape (number of texts, num_perm).
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    token_hashes = TokenHashes()
+    signatures = []
+    pending, pending_size = [], 0
+    for text in texts:
+        tokens = token_hashes_of(text, token_hashes)
+        pending.append(tokens)
+        pending_size += len(tokens)
+        if pending_size >= chunk_shingles:
+            signatures.append(_signature_chunk(pending, a, b))
+            pending, pending_size = [], 0
+    if pending:
+        signatures.append(_signature_chunk(pending, a, b))
+    return np.concatenate(signatures) if signatures else np.empty((0, num_perm), dtype=np.uint32)
+
+def find_near_duplicates(signatures, bands=DEDUP_BANDS, threshold=DEDUP_THRESHOLD):
+    """
+    Finds near-duplicate examples with locality-sensitive hashing over MinHash signatures.
+
+    Each signature is cut into `bands` bands; examples sharing a band land in the same bucket and become
+    candidates. Examples are visited in order, and one is a duplicate when a kept example in one of its
+    buckets has an estimated Jaccard similarity (the share of equal signature values) of at least
+    `threshold`. Only the first kept members of a bucket are compared with, so the work stays linear even
+    when many examples share a band.
+
+    Parameters:
+        signatures (np.ndarray): The MinHash signatures, one row per example.
+        bands (int): The number of LSH bands; the signature length must be a multiple of it.
+        threshold (float): The estimated similarity from which an example counts as a duplicate.
+
+    Returns:
+        np.ndarray: A boolean mask of the duplicates; the first example of every group is kept.
+    """
+    num_examples, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f"The signature length {num_perm} is not a multiple of the number of bands {bands}")
+    rows = num_perm // bands
+    # One bucket id per (example, band): rows of equal band values get the same id
+    bucket_ids = np.empty((num_examples, bands), dtype=np.int64)
+    for band in range(bands):
+        band_values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        _, bucket_ids[:, band] = np.unique(band_values.view(np.dtype((np.void, rows * 4))).ravel(), return_inverse=True)
+
+    # Offset per band, so one flat dict holds the buckets of every band
+    bucket_ids = (bucket_ids + np.arange(bands) * num_examples).tolist()
+    duplicates = np.zeros(num_examples, dtype=bool)
+    buckets = defaultdict(list)
+    for index, example_buckets in enumerate(bucket_ids):
+        candidates = {member for bucket in example_buckets for member in buckets[bucket]}
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarity = (signatures[candidates] == signatures[index]).mean(axis=1)
+            if similarity.max() >= threshold:
+                duplicates[index] = True
+                continue
+        for bucket in example_buckets:
+            members = buckets[bucket]
+            if len(members) < MAX_BUCKET_COMPARISONS:
+                members.append(index)
+    return duplicates
+
+def middle_length_stratum(example, bins=MIDDLE_LENGTH_BINS):
+    """Returns the index of the middle length bin of an example; the last stratum is open-ended."""
+    return bisect.bisect_left(bins, len(example["middle"]))
+
+def stratified_sample(examples, target=NUM_EXAMPLES, seed=SPLIT_SEED, bins=MIDDLE_LENGTH_BINS):
+    """
+    Samples examples so every (language, middle length) stratum keeps its share of the data.
+
+    Each stratum gets a quota proportional to its size, rounded with the largest remainder method. Quota a
+    stratum cannot fill is handed to the strata that still have examples, so exactly `target` examples are
+    kept whenever there are that many.
+
+    Parameters:
+        examples (list): The examples, with 'language' and 'middle' keys.
+        target (int): The number of examples to keep.
+        seed (int): The seed of the draws within each stratum.
+        bins (tuple): The upper edges of the middle length bins, in characters.
+
+    Returns:
+        tuple: The kept example indexes in their original order, and the per-stratum available and kept counts.
+    """
+    strata = defaultdict(list)
+    for index, example in enumerate(examples):
+        strata[(example["language"], middle_length_stratum(example, bins))].append(index)
+    keys = sorted(strata)
+    quotas = dict.fromkeys(keys, 0)
+    remaining = min(target, len(examples))
+    while remaining:
+        open_keys = [key for key in keys if quotas[key] < len(strata[key])]
+        available = sum(len(strata[key]) - quotas[key] for key in open_keys)
+        shares = {key: remaining * (len(strata[key]) - quotas[key]) / available for key in open_keys}
+        grants = {key: min(int(share), len(strata[key]) - quotas[key]) for key, share in shares.items()}
+        # Largest remainders first, ties broken by stratum order
+        leftover = remaining - sum(grants.values())
+        for key in sorted(open_keys, key=lambda key: shares[key] - int(shares[key]), reverse=True):
+            if not leftover:
+                break
+            if grants[key] < len(strata[key]) - quotas[key]:
+                grants[key] += 1
+                leftover -= 1
+        for key, grant in grants.items():
+            quotas[key] += grant
+        remaining -= sum(grants.values())
+
+    rng = random.Random(seed)
+    selected = []
+    for key in keys:
+        selected.extend(rng.sample(strata[key], quotas[key]))
+    report = {f"{language}/{bin_index}": {"available": len(strata[(language, bin_index)]), "kept": quotas[(language, bin_index)]}
+              for language, bin_index in keys}
+    return sorted(selected), report
+
+def dedup_and_sample(examples, target=NUM_EXAMPLES, seed=SPLIT_SEED, threshold=DEDUP_THRESHOLD,
+                     num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, prefix_tail_chars=DEDUP_PREFIX_TAIL_CHARS):
+    """
+    Drops near-duplicate examples and samples the rest down to a target count, stratified by language and middle length.
+
+    Parameters:
+        examples (list): The split examples.
+        target (int or None): The number of examples to keep; None keeps every distinct example.
+        seed (int): The seed of the MinHash permutations and of the sampling.
+        threshold (float): The estimated similarity from which an example counts as a duplicate.
+        num_perm (int): The MinHash signature length.
+        bands (int): The number of LSH bands.
+        prefix_tail_chars (int): How many trailing prefix characters are compared along with the middle.
+
+    Returns:
+        tuple: The kept examples, in their original order, and a report of the counts.
+    """
+    signatures = minhash_signatures((dedup_text(example, prefix_tail_chars) for example in examples), num_perm, seed)
+    duplicates = find_near_duplicates(signatures, bands, threshold)
+    distinct = [example for example, duplicate in zip(examples, duplicates) if not duplicate]
+    report = {"examples": len(examples), "near_duplicates": int(duplicates.sum()), "distinct": len(distinct)}
+    if target is None:
+        report["kept"] = len(distinct)
+        return distinct, report
+    selected, strata = stratified_sample(distinct, target, seed)
+    report.update(kept=len(selected), strata=strata)
+    return [distinct[index] for index in selected], report
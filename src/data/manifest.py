@@ -0,0 +1,222 @@
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from src.constants import RAW_DATA_DIR, PROCESSED_DATA_JSONL, TOKENIZED_DATA_STORE, SPLIT_MANIFEST, SPLIT_SEED, MODEL_ID
+from src.data.split_code import iter_code_files, file_seed, _split_file_task
+from src.data.tokenized_store import TokenizedStore, TokenizedStoreWriter, dtype_for_vocab, MANIFEST_FILE
+from src.data.tokenize_dataset import tokenize_examples
+from src.models import get_tokenizer
+
+MANIFEST_VERSION = 1
+# Written inside the token store directory, so it is swapped in together with the store it describes
+STORE_MANIFEST_FILE = MANIFEST_FILE
+
+def hash_file(file_path):
+    """Returns the sha256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(path):
+    """Loads a manifest, or returns None if there is none or it was written by another manifest version."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+def scan_files(directory, previous=None):
+    """
+    Lists the code files of a corpus with their content hashes.
+
+    A file whose size and modification time match its entry in `previous` keeps the recorded hash,
+    so an unchanged corpus is not read again.
+
+    Parameters:
+        directory (str): The corpus root.
+        previous (dict or None): The "files" entry of the last manifest.
+
+    Returns:
+        dict: Per source (the path relative to `directory`), in corpus order, its path, language,
+              content hash, size and modification time.
+    """
+    previous = previous or {}
+    files = {}
+    for file_path, language in iter_code_files(directory):
+        source = os.path.relpath(file_path, directory)
+        stat = os.stat(file_path)
+        recorded = previous.get(source)
+        if recorded and recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+            content_hash = recorded["hash"]
+        else:
+            content_hash = hash_file(file_path)
+        files[source] = {"path": file_path, "language": language, "hash": content_hash,
+                         "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+def _read_examples_by_source(file_path):
+    """Reads a JSONL examples file as its raw lines grouped per 'source', so kept examples are written back unchanged."""
+    groups = {}
+    if not os.path.exists(file_path):
+        return groups
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            source = json.loads(line).get("source")
+            if source is None:
+                raise ValueError(f"{file_path} has examples without a 'source' key; rebuild it with the streaming splitter")
+            groups.setdefault(source, []).append(line if line.endswith("\n") else line + "\n")
+    return groups
+
+def update_split(directory=RAW_DATA_DIR, output_file=PROCESSED_DATA_JSONL, manifest_path=SPLIT_MANIFEST,
+                 num_examples=4, workers=0, seed=SPLIT_SEED, split_mode="line"):
+    """
+    Brings the streaming splitter output up to date with the corpus, re-splitting only what changed.
+
+    The manifest records a content hash and seed per raw file. Files that were added or whose hash changed
+    are split again, examples of deleted files are dropped, and the examples of every other file are kept
+    as they are. The output is identical to a full `generate_split_stream` run with the same seed, and it
+    is replaced atomically. A different seed, number of examples per file or split mode rebuilds everything.
+
+    Parameters:
+        directory (str): The directory containing code files.
+        output_file (str): The JSONL file to update.
+        manifest_path (str): The manifest of `output_file`.
+        num_examples (int): The number of examples to draw per file.
+        workers (int): The number of worker processes splitting changed files; 0 or 1 splits in this process.
+        seed (int): The run seed.
+        split_mode (str): How split points are chosen, one of SPLIT_MODES.
+
+    Returns:
+        dict: The number of added, changed, unchanged and deleted files, and of examples written.
+    """
+    manifest = load_manifest(manifest_path)
+    settings = {"seed": seed, "num_examples": num_examples, "split_mode": split_mode}
+    if manifest:
+        # Manifests written before split modes existed were built with line split points
+        manifest.setdefault("split_mode", "line")
+        if any(manifest[key] != value for key, value in settings.items()) or not os.path.exists(output_file):
+            manifest = None
+    recorded = manifest["files"] if manifest else {}
+    files = scan_files(directory, recorded)
+
+    stale = [source for source, info in files.items() if recorded.get(source, {}).get("hash") != info["hash"]]
+    stats = {
+        "added": sum(source not in recorded for source in stale),
+        "changed": sum(source in recorded for source in stale),
+        "unchanged": len(files) - len(stale),
+        "deleted": sum(source not in files for source in recorded)
+    }
+
+    tasks = [(files[source]["path"], files[source]["language"], num_examples, file_seed(seed, source), source, split_mode)
+             for source in stale]
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_split_file_task, tasks))
+    else:
+        results = [_split_file_task(task) for task in tasks]
+    fresh = {source: [json.dumps(example) + "\n" for example in examples] for source, examples in zip(stale, results)}
+
+    kept = _read_examples_by_source(output_file) if manifest else {}
+    count = 0
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Corpus order, as the full splitter writes it
+        for source in files:
+            lines = fresh[source] if source in fresh else kept.get(source, [])
+            f.writelines(lines)
+            files[source]["examples"] = len(lines)
+            count += len(lines)
+    os.replace(tmp_path, output_file)
+
+    for source, info in files.items():
+        del info["path"]
+        info["seed"] = file_seed(seed, source)
+    _write_json_atomic(manifest_path, {"version": MANIFEST_VERSION, **settings, "files": files})
+    stats["examples"] = count
+    return stats
+
+def update_tokenized(input_path=PROCESSED_DATA_JSONL, store_path=TOKENIZED_DATA_STORE, workers=0, model_id=MODEL_ID):
+    """
+    Brings the token store up to date with the splitter output, re-tokenizing only the examples that changed.
+
+    The store's manifest records, per source file, a digest of its examples and their position in the store.
+    Examples of sources whose digest is unchanged are copied from the old store, the others are tokenized,
+    and examples of sources that are no longer in the input are dropped. The new store is written next to
+    the old one and swapped in when complete. A different tokenizer, or a manifest whose example count does
+    not match the store, retokenizes everything.
+
+    Parameters:
+        input_path (str): The JSONL examples, with a 'source' key, written by the streaming splitter.
+        store_path (str): The token store directory to update.
+        workers (int): The number of tokenizer worker processes; 0 tokenizes in this process.
+        model_id (str): The Hugging Face model id or local path of the tokenizer.
+
+    Returns:
+        dict: The number of retokenized, copied and dropped sources, and of examples written.
+    """
+    groups = _read_examples_by_source(input_path)
+    digests = {source: hashlib.sha256("".join(lines).encode("utf-8")).hexdigest() for source, lines in groups.items()}
+
+    manifest = load_manifest(os.path.join(store_path, STORE_MANIFEST_FILE))
+    if manifest and manifest["tokenizer"] != model_id:
+        manifest = None
+    old_store = TokenizedStore(store_path) if manifest else None
+    if old_store is not None and sum(count for _, _, count in manifest["sources"]) != old_store.meta["num_examples"]:
+        # The store was rewritten without its manifest, so the recorded ranges point at other examples
+        manifest = old_store = None
+    recorded = {}
+    if manifest:
+        start = 0
+        for source, digest, count in manifest["sources"]:
+            recorded[source] = (digest, start, count)
+            start += count
+
+    stale = [source for source in groups if recorded.get(source, (None,))[0] != digests[source]]
+    entries = [json.loads(line) for source in stale for line in groups[source]]
+    tokenized = iter(tokenize_examples(entries, workers=workers, model_id=model_id))
+
+    tmp_path = f"{store_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    stale_sources = set(stale)
+    sources = []
+    with TokenizedStoreWriter(tmp_path, dtype_for_vocab(len(get_tokenizer(model_id)))) as writer:
+        for source, lines in groups.items():
+            if source in stale_sources:
+                for _ in lines:
+                    writer.add(next(tokenized))
+            else:
+                _, start, count = recorded[source]
+                for index in range(start, start + count):
+                    writer.add(old_store[index])
+            sources.append([source, digests[source], len(lines)])
+        num_examples = len(writer.offsets)
+    _write_json_atomic(os.path.join(tmp_path, STORE_MANIFEST_FILE),
+                       {"version": MANIFEST_VERSION, "tokenizer": model_id, "sources": sources})
+
+    # Swap the stores with renames, so readers see either the old or the new store in full
+    del old_store
+    old_path = f"{store_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(store_path):
+        os.replace(store_path, old_path)
+    os.replace(tmp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return {
+        "retokenized": len(stale),
+        "copied": len(groups) - len(stale),
+        "dropped": sum(source not in groups for source in recorded),
+        "examples": num_examples
+    }
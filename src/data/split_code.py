@@ -1,22 +1,25 @@
 import os
 import json
 import random
-from src.constants import RAW_DATA_DIR, MIN_PREFIX_LENGTH, MIN_SUFFIX_LENGTH, PROCESSED_DATA_DIR
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.constants import RAW_DATA_DIR, MIN_PREFIX_LENGTH, MIN_SUFFIX_LENGTH, PROCESSED_DATA_DIR, PROCESSED_DATA_JSONL, SPLIT_SEED
 
-def read_code_files(directory):
+def iter_code_files(directory):
     """
-    Reads all code files from a specified directory and its subdirectories.
+    Yields code files from a specified directory and its subdirectories, without listing them all up front.
 
     Parameters:
         directory (str): The root directory to search for code files.
 
-    Returns:
-        list: A list of tuples containing file paths and their corresponding programming language.
+    Yields:
+        tuple: A file path and its corresponding programming language.
     """
-    code_files = []
-    # Walk through the directory tree
-    for root, _, files in os.walk(directory):
-        for file in files:
+    # Walk through the directory tree in a fixed order, so seeds and output order are reproducible
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
             # Check if the file has a code file extension
             if file.endswith((".py", ".java", ".c")):
                 # Determine the programming language based on the file extension
@@ -28,79 +31,170 @@ def read_code_files(directory):
                     language = "c"
                 else:
                     language = "unknown"
-                # Add the full path of the code file and its language to the list
-                code_files.append((os.path.join(root, file), language))
-    return code_files
+                yield os.path.join(root, file), language
 
-def pick_line_position(code_lines):
+def read_code_files(directory):
     """
-    Picks a valid line and a cursor position within that line, ensuring the line is not a comment or empty.
+    Reads all code files from a specified directory and its subdirectories.
 
     Parameters:
-        code_lines (list): A list of code lines from the file.
+        directory (str): The root directory to search for code files.
 
     Returns:
-        tuple: A tuple containing the chosen line index and the cursor position within that line.
-               Returns (None, None) if no valid lines are found.
+        list: A list of tuples containing file paths and their corresponding programming language.
     """
-    # Find indexes of lines that are not empty and do not start with comment characters
-    valid_lines_indexes = [
-        i for i, line in enumerate(code_lines)
-        if line.strip() and not line.strip().startswith(("\n", "#", "//"))
-    ]
+    return list(iter_code_files(directory))
 
-    # If there are no valid lines, return None
-    if not valid_lines_indexes:
-        return None, None  # No valid lines found
+COMMENT_PREFIXES = ("#", "//")
 
-    # Randomly choose a line index from the valid lines
-    chosen_line = random.choice(valid_lines_indexes)
+class LineIndex:
+    """
+    An index of a code file's lines, built once and shared by every split point drawn from the file.
 
-    # Choose a random cursor position within the chosen line (up to half its length)
-    position_in_line = random.randint(0, len(code_lines[chosen_line].strip()) // 2)
-    # Adjust the position to maintain indentation by adding leading whitespace length
-    position_in_line += len(code_lines[chosen_line]) - len(code_lines[chosen_line].lstrip())
+    The lines are those of `str.splitlines`, joined with '\n' into `text`, so every line starts at a known
+    character offset of `text` and a run of whole lines is one slice of it. The index also keeps the lines
+    that may hold the cursor (not blank and not a comment), and the stripped length and indentation of each
+    line, so drawing a split point neither strips nor re-splits the file.
+    """
 
-    return chosen_line, position_in_line
+    def __init__(self, code_lines):
+        self.lines = code_lines
+        self.text = '\n'.join(code_lines)
+        self.starts = []
+        self.stripped_lengths = []
+        self.indents = []
+        self.comments = []
+        self.valid = []
+        offset = 0
+        for i, line in enumerate(code_lines):
+            self.starts.append(offset)
+            offset += len(line) + 1
+            stripped = line.strip()
+            self.stripped_lengths.append(len(stripped))
+            self.indents.append(len(line) - len(line.lstrip()))
+            comment = stripped.startswith(COMMENT_PREFIXES)
+            self.comments.append(comment)
+            if stripped and not comment:
+                self.valid.append(i)
+
+    @classmethod
+    def from_text(cls, code_text):
+        return cls(code_text.splitlines())
+
+    def __len__(self):
+        return len(self.lines)
+
+    def line_end(self, i):
+        """Returns the offset in `text` just past line i, before its newline."""
+        return self.starts[i] + len(self.lines[i])
+
+    def pick(self, rng=random):
+        """Draws a cursor line and position, as `pick_line_position` does; (None, None) if no line is valid."""
+        if not self.valid:
+            return None, None
+        chosen_line = rng.choice(self.valid)
+        position_in_line = rng.randint(0, self.stripped_lengths[chosen_line] // 2) + self.indents[chosen_line]
+        return chosen_line, position_in_line
+
+    def draw_middle_lines(self, chosen_line, rng=random):
+        """Draws how many lines after the cursor line the middle spans (1 to 5, but not past the end of the file)."""
+        return min(len(self.lines) - chosen_line - 1, rng.randint(1, 5))
+
+    def prefix_length(self, chosen_line, position_in_line):
+        # A cursor on the first line still gets the newline the prefix join puts in front of it
+        return self.starts[chosen_line] + position_in_line + (1 if chosen_line == 0 else 0)
+
+    def suffix_length(self, suffix_start):
+        return len(self.text) - self.starts[suffix_start] if suffix_start < len(self.lines) else 0
+
+    def cut(self, chosen_line, position_in_line, additional_lines):
+        """
+        Cuts the prefix, middle and suffix at a split point as slices of `text`.
+
+        Returns:
+            tuple: The same prefix, middle and suffix strings as `construct_prefix_middle_suffix`.
+        """
+        cursor = self.starts[chosen_line] + position_in_line
+        prefix = self.text[:cursor] if chosen_line else '\n' + self.text[:cursor]
+
+        last_line = chosen_line + additional_lines
+        if not any(self.comments[chosen_line + 1:last_line + 1]):
+            middle = self.text[cursor:self.line_end(last_line)] + '\n'
+        else:
+            # Comment lines are left out of the middle, so it is no longer one slice
+            middle = self.text[cursor:self.line_end(chosen_line)] + '\n' + ''.join(
+                self.lines[i] + '\n' for i in range(chosen_line + 1, last_line + 1) if not self.comments[i]
+            )
+
+        suffix_start = last_line + 1
+        suffix = self.text[self.starts[suffix_start]:] if suffix_start < len(self.lines) else ''
+        return prefix, middle, suffix
+
+SPLIT_MODES = ("line", "syntax")
+
+def index_code(code_text, language, split_mode="line"):
+    """
+    Builds the index split points are drawn from.
+
+    Parameters:
+        code_text (str): The full text of the code file.
+        language (str): The programming language of the file.
+        split_mode (str): "line" for any position on a non-comment line, or "syntax" for statement and
+                          identifier boundaries found by a per-language lexer (see src/data/syntax_index.py).
 
-def construct_prefix_middle_suffix(code_lines, chosen_line, position_in_line):
+    Returns:
+        LineIndex: The index of the file.
     """
-    Constructs the prefix, middle, and suffix sections of the code based on the chosen line and cursor position.
+    if split_mode == "syntax":
+        # Imported here, since the syntax index builds on LineIndex
+        from src.data.syntax_index import SyntaxIndex
+        return SyntaxIndex.from_text(code_text, language)
+    if split_mode != "line":
+        raise ValueError(f"Unknown split mode {split_mode!r}, expected one of {SPLIT_MODES}")
+    return LineIndex.from_text(code_text)
+
+def pick_line_position(code_lines, rng=random):
+    """
+    Picks a valid line and a cursor position within that line, ensuring the line is not a comment or empty.
 
     Parameters:
-        code_lines (list): A list of code lines from the file.
-        chosen_line (int): The index of the chosen line in the code_lines list.
-        position_in_line (int): The cursor position within the chosen line.
+        code_lines (list or LineIndex): The code lines from the file, or their index.
+        rng (random.Random): The random number generator to draw from.
 
     Returns:
-        tuple: A tuple containing the prefix, middle, and suffix strings.
+        tuple: A tuple containing the chosen line index and the cursor position within that line.
+               Returns (None, None) if no valid lines are found.
     """
-    # Construct the prefix by joining all lines up to the chosen line and adding the part of the chosen line before the cursor
-    prefix = '\n'.join(code_lines[:chosen_line]) + '\n' + code_lines[chosen_line][:position_in_line]
+    index = code_lines if isinstance(code_lines, LineIndex) else LineIndex(code_lines)
+    return index.pick(rng)
 
-    # Start constructing the middle section from the cursor position in the chosen line
-    middle = code_lines[chosen_line][position_in_line:] + '\n'
+def construct_prefix_middle_suffix(code_lines, chosen_line, position_in_line, rng=random):
+    """
+    Constructs the prefix, middle, and suffix sections of the code based on the chosen line and cursor position.
 
-    # Determine how many additional lines to add to the middle section (1 to 5, but not exceeding the file length)
-    additional_lines = min(len(code_lines) - chosen_line - 1, random.randint(1, 5))
-    for i in range(1, additional_lines + 1):
-        # Skip lines that are comments
-        if not code_lines[chosen_line + i].strip().startswith(("#", "//")):
-            # Add the line to the middle section
-            middle += code_lines[chosen_line + i] + '\n'
+    The prefix is every line before the chosen line and the chosen line up to the cursor. The middle is the
+    rest of the chosen line and the next 1 to 5 lines, leaving out comment lines. The suffix is everything after.
 
-    # Construct the suffix by joining all lines after the middle section
-    suffix_start = chosen_line + additional_lines + 1
-    suffix = '\n'.join(code_lines[suffix_start:])
+    Parameters:
+        code_lines (list or LineIndex): The code lines from the file, or their index.
+        chosen_line (int): The index of the chosen line in the code_lines list.
+        position_in_line (int): The cursor position within the chosen line.
+        rng (random.Random): The random number generator to draw from.
 
-    return prefix, middle, suffix
+    Returns:
+        tuple: A tuple containing the prefix, middle, and suffix strings.
+    """
+    index = code_lines if isinstance(code_lines, LineIndex) else LineIndex(code_lines)
+    return index.cut(chosen_line, position_in_line, index.draw_middle_lines(chosen_line, rng))
 
-def split_code_example(code_text):
+def split_code_example(code_text, rng=random, index=None):
     """
     Splits code text into prefix, middle, and suffix sections at a random point, ensuring minimum length requirements.
 
     Parameters:
         code_text (str): The full text of the code file.
+        rng (random.Random): The random number generator to draw from.
+        index (LineIndex or None): The line index of `code_text`, when drawing several split points from one file.
 
     Returns:
         dict or None: A dictionary with 'prefix', 'middle', 'suffix', and 'language' keys if successful; otherwise, None.
@@ -109,46 +203,48 @@ def split_code_example(code_text):
     if len(code_text) < MIN_PREFIX_LENGTH:
         return None
 
-    # Split the code text into lines
-    code_lines = code_text.splitlines()
-    if len(code_lines) < 1:
+    if index is None:
+        index = LineIndex.from_text(code_text)
+    if len(index) < 1:
         return None
 
     # Pick a valid line and cursor position
-    chosen_line, position_in_line = pick_line_position(code_lines)
+    chosen_line, position_in_line = index.pick(rng)
     if chosen_line is None:
         return None
+    additional_lines = index.draw_middle_lines(chosen_line, rng)
 
-    # Construct the prefix, middle, and suffix sections
-    prefix, middle, suffix = construct_prefix_middle_suffix(code_lines, chosen_line, position_in_line)
-
-    # Ensure the prefix and suffix meet the minimum length requirements
-    if len(prefix) >= MIN_PREFIX_LENGTH and len(suffix) >= MIN_SUFFIX_LENGTH:
-        return {"prefix": prefix, "middle": middle, "suffix": suffix}
-    return None
+    # Check the minimum lengths from the offsets, so rejected split points cost no string copies
+    if (index.prefix_length(chosen_line, position_in_line) < MIN_PREFIX_LENGTH
+            or index.suffix_length(chosen_line + additional_lines + 1) < MIN_SUFFIX_LENGTH):
+        return None
+    prefix, middle, suffix = index.cut(chosen_line, position_in_line, additional_lines)
+    return {"prefix": prefix, "middle": middle, "suffix": suffix}
 
-def generate_code_completion_examples(directory, num_examples=4):
+def generate_code_completion_examples(directory, num_examples=4, split_mode="line"):
     """
     Generates code completion examples from code files in the specified directory.
 
     Parameters:
         directory (str): The directory containing code files.
         num_examples (int): The number of examples to generate per file.
+        split_mode (str): How split points are chosen, one of SPLIT_MODES.
 
     Returns:
         list: A list of dictionaries containing 'prefix', 'middle', 'suffix', and 'language' for each example.
     """
-    # Read all code files from the directory
-    code_files = read_code_files(directory)
+    # Read all code files from the directory, and index each one once
+    code_files = []
+    for file_path, language in read_code_files(directory):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            code_text = file.read()
+        code_files.append((code_text, index_code(code_text, language, split_mode), language))
     examples = []
     # Iterate to generate the specified number of examples
     for _ in range(num_examples):
-        for file_path, language in code_files:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                code_text = file.read()
-
+        for code_text, index, language in code_files:
             # Attempt to split the code into an example
-            example = split_code_example(code_text)
+            example = split_code_example(code_text, index=index)
             if example:
                 # Include the programming language in the example
                 example['language'] = language
@@ -156,12 +252,25 @@ def generate_code_completion_examples(directory, num_examples=4):
 
     return examples
 
-def generate_split():
+def generate_split(stream=False, num_examples=4, workers=0, seed=SPLIT_SEED, split_mode="line"):
     """
     Generates code completion examples and saves them to a JSON file.
+
+    Parameters:
+        stream (bool): Whether to use the streaming splitter and write JSON lines instead.
+        num_examples (int): The number of examples to generate per file.
+        workers (int): The number of worker processes of the streaming splitter.
+        seed (int): The run seed of the streaming splitter.
+        split_mode (str): How split points are chosen, one of SPLIT_MODES.
     """
+    if stream:
+        count = generate_split_stream(RAW_DATA_DIR, PROCESSED_DATA_JSONL, num_examples=num_examples, workers=workers,
+                                      seed=seed, split_mode=split_mode)
+        print(f"Generated {count} code completion examples and saved to {PROCESSED_DATA_JSONL}")
+        return
+
     # Generate the dataset
-    dataset = generate_code_completion_examples(RAW_DATA_DIR, num_examples=4)
+    dataset = generate_code_completion_examples(RAW_DATA_DIR, num_examples=num_examples, split_mode=split_mode)
     # Define the output file path
     output_file = os.path.join(PROCESSED_DATA_DIR, 'code_completion_dataset.json')
 
@@ -170,3 +279,94 @@ def generate_split():
         json.dump(dataset, f, indent=4)
 
     print(f"Generated {len(dataset)} code completion examples and saved to {output_file}")
+
+def file_seed(seed, source):
+    """
+    Derives the seed of one file from the run seed and the file's path relative to the corpus root,
+    so a file gets the same split points no matter which worker processes it or in which order.
+    """
+    digest = hashlib.sha256(f"{seed}:{source}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def split_file(file_path, language, num_examples, seed, source=None, split_mode="line"):
+    """
+    Reads one code file once and draws all of its split points from that single read.
+
+    Parameters:
+        file_path (str): The path of the code file.
+        language (str): The programming language of the file.
+        num_examples (int): The number of split points to draw.
+        seed (int): The seed of this file's random number generator.
+        source (str or None): The name recorded in each example's 'source' key; defaults to the path.
+        split_mode (str): How split points are chosen, one of SPLIT_MODES.
+
+    Returns:
+        list: The examples of this file, with 'prefix', 'middle', 'suffix', 'language' and 'source' keys.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        code_text = file.read()
+
+    rng = random.Random(seed)
+    index = index_code(code_text, language, split_mode)
+    examples = []
+    for _ in range(num_examples):
+        example = split_code_example(code_text, rng, index)
+        if example:
+            example['language'] = language
+            example['source'] = source or file_path
+            examples.append(example)
+    return examples
+
+def _split_file_task(args):
+    # Unpacks the arguments of one pool task, since executor.submit pickles a single callable call
+    return split_file(*args)
+
+def generate_split_stream(directory, output_file, num_examples=4, workers=0, seed=SPLIT_SEED, max_pending=None, split_mode="line"):
+    """
+    Splits every code file of a corpus and writes the examples incrementally as JSON lines.
+
+    Each file is read once and gets its own seed, derived from `seed` and its relative path, so the
+    output is reproducible and independent of the number of workers. Files are fanned out over a process
+    pool, but at most `max_pending` of them are in flight, and their examples are written as soon as they
+    arrive in corpus order, so peak memory does not grow with the size of the corpus.
+
+    Parameters:
+        directory (str): The directory containing code files.
+        output_file (str): The JSONL file to write.
+        num_examples (int): The number of examples to draw per file.
+        workers (int): The number of worker processes; 0 or 1 splits in this process.
+        seed (int): The run seed.
+        max_pending (int or None): The maximum number of files in flight; defaults to 4 per worker.
+        split_mode (str): How split points are chosen, one of SPLIT_MODES.
+
+    Returns:
+        int: The number of examples written.
+    """
+    def tasks():
+        for file_path, language in iter_code_files(directory):
+            source = os.path.relpath(file_path, directory)
+            yield file_path, language, num_examples, file_seed(seed, source), source, split_mode
+
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        def write(examples):
+            for example in examples:
+                f.write(json.dumps(example) + '\n')
+            return len(examples)
+
+        if not workers or workers <= 1:
+            for task in tasks():
+                count += write(_split_file_task(task))
+            return count
+
+        max_pending = max_pending or 4 * workers
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for task in tasks():
+                pending.append(executor.submit(_split_file_task, task))
+                # Bound the in-flight window; results are consumed in submission order
+                if len(pending) >= max_pending:
+                    count += write(pending.popleft().result())
+            while pending:
+                count += write(pending.popleft().result())
+    return count
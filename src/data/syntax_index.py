@@ -0,0 +1,168 @@
+import io
+import os
+import re
+import bisect
+import hashlib
+import random
+import tokenize
+import numpy as np
+from src.constants import SYNTAX_INDEX_CACHE_DIR
+from src.data.split_code import LineIndex
+
+# Bumped whenever the lexers or the boundary rules change, so stale cached indexes are not reused
+SYNTAX_INDEX_VERSION = 1
+
+# Tokens a cursor may be placed in front of: identifiers, literals and the first token of a statement
+BOUNDARY_KINDS = ("name", "number", "string")
+# Lines made only of these tokens close a block; completing them says little about the model
+CLOSING_TOKENS = {"}", ")", "]", ";", ",", "};", ");"}
+
+C_FAMILY_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<preprocessor>^[ \t]*\#(?:[^\n\\]|\\.)*)
+  | (?P<string>\"\"\"(?:[^\\]|\\.)*?(?:\"\"\"|\Z)|"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<number>\.?\d(?:[\w.]|[eEpP][+-])*)
+  | (?P<op>[^\s\w])
+""", re.DOTALL | re.MULTILINE | re.VERBOSE)
+
+# Used for Python files the standard tokenizer rejects, such as files with broken indentation
+PYTHON_TOKEN = re.compile(r"""
+    (?P<comment>\#[^\n]*)
+  | (?P<string>[rRbBuUfF]{0,2}(?:'''.*?(?:'''|\Z)|\"\"\".*?(?:\"\"\"|\Z)|'(?:[^'\\\n]|\\.)*'?|"(?:[^"\\\n]|\\.)*"?))
+  | (?P<name>[^\W\d]\w*)
+  | (?P<number>\.?\d(?:[\w.]|[eE][+-])*)
+  | (?P<op>[^\s\w])
+""", re.DOTALL | re.VERBOSE)
+
+PYTHON_KINDS = {tokenize.NAME: "name", tokenize.NUMBER: "number", tokenize.STRING: "string",
+                tokenize.OP: "op", tokenize.COMMENT: "comment"}
+
+def _lex_regex(text, pattern):
+    return [(match.lastgroup, match.start(), match.end()) for match in pattern.finditer(text)]
+
+def _lex_python(text, starts):
+    tokens = []
+    # Python 3.12+ tokenizes f-strings into parts; everything between their start and end is one string
+    fstring_start = getattr(tokenize, "FSTRING_START", None)
+    fstring_end = getattr(tokenize, "FSTRING_END", None)
+    depth = 0
+    fstring_offset = 0
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            (start_row, start_col), (end_row, end_col) = token.start, token.end
+            if start_row > len(starts):
+                break
+            start = starts[start_row - 1] + start_col
+            if token.type == fstring_start:
+                depth += 1
+                fstring_offset = start if depth == 1 else fstring_offset
+            elif token.type == fstring_end:
+                depth -= 1
+                if not depth:
+                    tokens.append(("string", fstring_offset, starts[end_row - 1] + end_col))
+            elif not depth and token.type in PYTHON_KINDS:
+                tokens.append((PYTHON_KINDS[token.type], start, starts[end_row - 1] + end_col))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return _lex_regex(text, PYTHON_TOKEN)
+    return tokens
+
+def lex(index, language):
+    """
+    Splits a file into (kind, start, end) tokens with a lightweight lexer for its language.
+
+    Python files go through the standard `tokenize` module, C and Java files through one regular expression
+    that knows their comments, string and character literals and (for C) preprocessor lines. The kinds are
+    "name", "number", "string", "op", "comment" and "preprocessor"; whitespace is skipped.
+
+    Parameters:
+        index (LineIndex): The line index of the file; token offsets are offsets into its `text`.
+        language (str): "python", "java" or "c".
+
+    Returns:
+        list: The tokens, in file order.
+    """
+    if language == "python":
+        return _lex_python(index.text, index.starts)
+    return _lex_regex(index.text, C_FAMILY_TOKEN)
+
+def find_split_points(index, language):
+    """
+    Finds the cursor positions a syntax-aware split may use.
+
+    A line qualifies when it holds code outside comments, strings and preprocessor directives, and is not
+    only closing brackets or semicolons. Its split points are the start of its first code token (a statement
+    boundary) and the start of every identifier, number or string literal on it (expression and identifier
+    boundaries). Lines inside block comments and multi-line strings have no token starting on them.
+
+    Returns:
+        np.ndarray: An int32 array of (line, position in line) rows, sorted.
+    """
+    code_tokens = {}
+    for kind, start, end in lex(index, language):
+        if kind in ("comment", "preprocessor"):
+            continue
+        line = bisect.bisect_right(index.starts, start) - 1
+        code_tokens.setdefault(line, []).append((kind, start, end))
+
+    points = []
+    for line, tokens in code_tokens.items():
+        texts = [index.text[start:end] for _, start, end in tokens]
+        if all(text in CLOSING_TOKENS for text in texts):
+            continue
+        line_start = index.starts[line]
+        positions = {tokens[0][1] - line_start}
+        positions.update(start - line_start for kind, start, _ in tokens if kind in BOUNDARY_KINDS)
+        points.extend((line, position) for position in sorted(positions))
+    return np.asarray(points, dtype=np.int32).reshape(-1, 2)
+
+def _cache_path(cache_dir, index, language):
+    key = hashlib.sha256(f"{SYNTAX_INDEX_VERSION}\0{language}\0{index.text}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:2], key + ".npy")
+
+def load_split_points(index, language, cache_dir=SYNTAX_INDEX_CACHE_DIR):
+    """
+    Returns the split points of a file, from the cache when the same content was indexed before.
+
+    The cache is keyed by the file content, language and index version, so an edited file is indexed
+    again and an unchanged one never is. None as `cache_dir` disables the cache.
+    """
+    if cache_dir is None:
+        return find_split_points(index, language)
+    path = _cache_path(cache_dir, index, language)
+    if os.path.exists(path):
+        return np.load(path)
+    points = find_split_points(index, language)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Splitter workers may index the same content concurrently; each writes its own temporary file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, points)
+    os.replace(tmp_path, path)
+    return points
+
+class SyntaxIndex(LineIndex):
+    """
+    A line index whose split points are syntactic boundaries rather than any position on a non-comment line.
+
+    `pick` draws a line uniformly among the lines with split points, then one of that line's split points.
+    The prefix, middle and suffix are cut exactly as with `LineIndex`.
+    """
+
+    def __init__(self, code_lines, language, cache_dir=SYNTAX_INDEX_CACHE_DIR):
+        super().__init__(code_lines)
+        self.language = language
+        self.split_points = {}
+        for line, position in load_split_points(self, language, cache_dir).tolist():
+            self.split_points.setdefault(line, []).append(position)
+        self.valid = sorted(self.split_points)
+
+    @classmethod
+    def from_text(cls, code_text, language, cache_dir=SYNTAX_INDEX_CACHE_DIR):
+        return cls(code_text.splitlines(), language, cache_dir)
+
+    def pick(self, rng=random):
+        if not self.valid:
+            return None, None
+        chosen_line = rng.choice(self.valid)
+        return chosen_line, rng.choice(self.split_points[chosen_line])
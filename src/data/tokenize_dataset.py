@@ -1,49 +1,150 @@
-from transformers import AutoTokenizer 
-from src.constants import PROCESSED_DATA_DIR, PROCESSED_DATA_JSON, TOKENIZED_DATA_JSON
+from src.constants import MODEL_ID, PROCESSED_DATA_JSON, PROCESSED_DATA_JSONL, TOKENIZED_DATA_JSON, TOKENIZED_DATA_STORE, TOKENIZE_CHUNK_SIZE
+from src.data.tokenized_store import TokenizedStoreWriter, dtype_for_vocab
+from src.models import get_tokenizer
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
 import json
+import time
 
-# Initialize the tokenizer for StarCoder
-tokenizer = AutoTokenizer.from_pretrained("bigcode/starcoder")
+FIELDS = ("prefix", "middle", "suffix")
 
-def tokenize_entry(entry):
+def tokenize_entry(entry, tokenizer=None):
     """
     Takes a code completion example and returns the tokenized version.
     
     Args:
-        example (dict): A dictionary with keys 'prefix', 'middle', and 'suffix' containing code segments.
+        entry (dict): A dictionary with keys 'prefix', 'middle', and 'suffix' containing code segments.
+        tokenizer: The tokenizer to use; defaults to the StarCoder tokenizer.
     
     Returns:
         dict: A dictionary containing the tokenized 'prefix', 'middle', and 'suffix'.
     """
-    tokenized = {
-        "language" : entry["language"],
-        "prefix": tokenizer.encode(entry["prefix"], return_tensors="pt", truncation=True).tolist(),
-        "middle": tokenizer.encode(entry["middle"], return_tensors="pt", truncation=True).tolist(),
-        "suffix": tokenizer.encode(entry["suffix"], return_tensors="pt", truncation=True).tolist()
-    }
-    return tokenized  
+    tokenizer = tokenizer or get_tokenizer()
+    # Each field is wrapped in a one-row list, the layout of the tokenized JSON file
+    tokenized = {"language": entry["language"]}
+    for field in FIELDS:
+        tokenized[field] = [tokenizer.encode(entry[field], truncation=True)]
+    return tokenized
 
-def load_processed_examples():
-    """Loads processed examples from JSON files in the specified directory."""
+def tokenize_batch(entries, tokenizer=None):
+    """
+    Tokenizes a list of examples with one batched tokenizer call per field.
+
+    Args:
+        entries (list): Examples with 'prefix', 'middle', 'suffix' and 'language' keys.
+        tokenizer: The tokenizer to use; defaults to the StarCoder tokenizer.
+
+    Returns:
+        list: The tokenized examples, identical to calling `tokenize_entry` on each one.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    tokenized = [{"language": entry["language"]} for entry in entries]
+    for field in FIELDS:
+        # The fast tokenizer encodes the whole list in Rust, without a Python round trip per text
+        input_ids = tokenizer([entry[field] for entry in entries], truncation=True)["input_ids"]
+        for example, ids in zip(tokenized, input_ids):
+            example[field] = [ids]
+    return tokenized
+
+def _init_worker():
+    # Each worker process already runs in parallel; nested Rust threads would only oversubscribe the CPU
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+def _tokenize_chunk(chunk, model_id=MODEL_ID):
+    return tokenize_batch(chunk, get_tokenizer(model_id))
+
+def tokenize_examples(entries, workers=0, chunk_size=TOKENIZE_CHUNK_SIZE, model_id=MODEL_ID):
+    """
+    Tokenizes examples in chunks, optionally fanned out over a process pool.
+
+    Args:
+        entries (list): Examples with 'prefix', 'middle', 'suffix' and 'language' keys.
+        workers (int): The number of worker processes; 0 or 1 tokenizes in this process.
+        chunk_size (int): The number of examples per batched tokenizer call.
+        model_id (str): The Hugging Face model id or local path of the tokenizer.
+
+    Returns:
+        list: The tokenized examples, in the input order.
+    """
+    chunks = [entries[start:start + chunk_size] for start in range(0, len(entries), chunk_size)]
+    tokenize_chunk = partial(_tokenize_chunk, model_id=model_id)
+    if workers and workers > 1 and len(chunks) > 1:
+        # Every worker loads its own tokenizer lazily through get_tokenizer
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = executor.map(tokenize_chunk, chunks)
+            return [example for chunk in results for example in chunk]
+    return [example for chunk in chunks for example in tokenize_chunk(chunk)]
+
+def verify_tokenization(entries, tokenized_examples, tokenizer=None):
+    """
+    Checks batched tokenization against encoding every field on its own.
+
+    Returns:
+        list: The indexes of examples whose token ids differ.
+    """
+    return [
+        index for index, (entry, tokenized) in enumerate(zip(entries, tokenized_examples))
+        if tokenize_entry(entry, tokenizer) != tokenized
+    ]
+
+def load_processed_examples(file_path=None):
+    """
+    Loads processed examples from a JSON file, or a JSON lines file written by the streaming splitter.
+
+    Args:
+        file_path (str or None): The file to load; defaults to the JSONL output if it exists, else the JSON file.
+    """
     processed_data = []
+    file_path = file_path or (PROCESSED_DATA_JSONL if os.path.exists(PROCESSED_DATA_JSONL) else PROCESSED_DATA_JSON)
 
-    with open(PROCESSED_DATA_JSON, 'r', encoding='utf-8') as file:
-       processed_data = json.load(file)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        if file_path.endswith(".jsonl"):
+            processed_data = [json.loads(line) for line in file if line.strip()]
+        else:
+            processed_data = json.load(file)
 
     return processed_data
 
-def tokenize_dataset():
-    """Tokenizes the processed dataset and saves it as a single JSON file."""
-    # Load processed examples from the specified directory
-    processed_data = load_processed_examples()
-    #print(processed_data)
-    # Tokenize each example
-    tokenized_examples = [tokenize_entry(entry) for entry in processed_data]
-
-    # Save the tokenized examples to the specified JSON file
-    with open(TOKENIZED_DATA_JSON, 'w', encoding='utf-8') as f:
-        json.dump(tokenized_examples, f, indent=4)
-    
-    print(f"Tokenized dataset saved to {TOKENIZED_DATA_JSON}")
+def tokenize_dataset(export_json=False, workers=0, verify=False, input_path=None, store_path=TOKENIZED_DATA_STORE,
+                     model_id=MODEL_ID):
+    """
+    Tokenizes the processed dataset and saves it as a memory-mapped token store.
+
+    The store is rewritten in full, so the manifest `update_tokenized` keeps in it is removed with it.
+
+    Args:
+        export_json (bool): Whether to also write the tokenized JSON file, for debugging.
+        workers (int): The number of tokenizer worker processes; 0 tokenizes in this process.
+        verify (bool): Whether to check the batched token ids against per-example encoding.
+        input_path (str or None): The processed examples to tokenize, JSON or JSONL.
+        store_path (str): The token store directory to write.
+        model_id (str): The Hugging Face model id or local path of the tokenizer.
+    """
+    # Load processed examples from the specified file
+    processed_data = load_processed_examples(input_path)
+
+    # Tokenize the examples in batches
+    start = time.perf_counter()
+    tokenized_examples = tokenize_examples(processed_data, workers=workers, model_id=model_id)
+    elapsed = time.perf_counter() - start
+    num_tokens = sum(len(example[field][0]) for example in tokenized_examples for field in FIELDS)
+    print(f"Tokenized {len(tokenized_examples)} examples ({num_tokens} tokens) in {elapsed:.2f}s, "
+          f"{num_tokens / max(elapsed, 1e-9):.0f} tokens/s")
+
+    if verify:
+        mismatches = verify_tokenization(processed_data, tokenized_examples, get_tokenizer(model_id))
+        if mismatches:
+            raise ValueError(f"Batched tokenization differs from per-example encoding for examples {mismatches}")
+        print("Batched token ids match per-example encoding")
+
+    # Save the tokenized examples to the token store
+    with TokenizedStoreWriter(store_path, dtype_for_vocab(len(get_tokenizer(model_id)))) as writer:
+        for entry in tokenized_examples:
+            writer.add(entry)
+    print(f"Tokenized dataset saved to {store_path}")
 
+    if export_json:
+        with open(TOKENIZED_DATA_JSON, 'w', encoding='utf-8') as f:
+            json.dump(tokenized_examples, f, indent=4)
+        print(f"Tokenized dataset exported to {TOKENIZED_DATA_JSON}")
@@ -0,0 +1,175 @@
+import os
+import json
+import numpy as np
+
+FIELDS = ("prefix", "middle", "suffix")
+
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.npy"
+LANGUAGES_FILE = "languages.npy"
+META_FILE = "meta.json"
+# Written by `update_tokenized` next to the store files it describes
+MANIFEST_FILE = "manifest.json"
+
+def dtype_for_vocab(vocab_size):
+    """Returns the smallest unsigned dtype that can hold every token id of the vocabulary."""
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+class TokenizedStoreWriter:
+    """
+    Writes tokenized examples to the compact on-disk format read by `TokenizedStore`.
+
+    The store is a directory with:
+        - tokens.bin: every token id of every example, as one flat uint16/uint32 array.
+          An example's prefix, middle and suffix are stored back to back.
+        - offsets.npy: an int64 array of shape (num_examples, 4) holding the start of the prefix,
+          middle and suffix of each example in tokens.bin, and the end of its suffix.
+        - languages.npy: a uint8 language code per example.
+        - meta.json: the token dtype, the language names of the codes and the example count.
+
+    Tokens are appended to tokens.bin as examples come in, so the writer never holds the dataset in memory.
+    A manifest left in the directory by an earlier store is removed, as its ranges no longer describe the store.
+    """
+
+    def __init__(self, out_dir, dtype=np.uint16):
+        self.out_dir = out_dir
+        self.dtype = np.dtype(dtype)
+        os.makedirs(out_dir, exist_ok=True)
+        manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        self.tokens_file = open(os.path.join(out_dir, TOKENS_FILE), "wb")
+        self.position = 0
+        self.offsets = []
+        self.language_codes = []
+        self.languages = []
+
+    def add(self, entry):
+        """
+        Appends one tokenized example.
+
+        Parameters:
+            entry (dict): An example in the tokenized JSON layout, with 'language' and the
+                          'prefix', 'middle' and 'suffix' token ids wrapped in a one-row list.
+        """
+        row = [self.position]
+        for field in FIELDS:
+            ids = np.asarray(entry[field][0], dtype=np.int64)
+            if ids.size and ids.max() > np.iinfo(self.dtype).max:
+                raise ValueError(f"Token id {ids.max()} does not fit in {self.dtype}")
+            self.tokens_file.write(ids.astype(self.dtype).tobytes())
+            self.position += ids.size
+            row.append(self.position)
+        self.offsets.append(row)
+
+        if entry["language"] not in self.languages:
+            self.languages.append(entry["language"])
+        self.language_codes.append(self.languages.index(entry["language"]))
+
+    def close(self):
+        """Writes the index files and closes the store."""
+        self.tokens_file.close()
+        np.save(os.path.join(self.out_dir, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64).reshape(-1, 4))
+        np.save(os.path.join(self.out_dir, LANGUAGES_FILE), np.asarray(self.language_codes, dtype=np.uint8))
+        with open(os.path.join(self.out_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "dtype": self.dtype.name,
+                "languages": self.languages,
+                "num_examples": len(self.offsets),
+                "num_tokens": self.position
+            }, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TokenizedStore:
+    """
+    Reads a tokenized dataset written by `TokenizedStoreWriter` without loading it into memory.
+
+    The token array and the index are memory-mapped, and each example's fields are zero-copy slices
+    of the token array. Indexing returns examples in the same layout as the tokenized JSON file
+    (each field wrapped in a one-row list), so code written against the JSON format works unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.languages = self.meta["languages"]
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self.language_codes = np.load(os.path.join(path, LANGUAGES_FILE), mmap_mode="r")
+        if self.meta["num_tokens"]:
+            self.tokens = np.memmap(os.path.join(path, TOKENS_FILE), dtype=self.meta["dtype"], mode="r")
+        else:
+            # np.memmap cannot map an empty file
+            self.tokens = np.empty(0, dtype=self.meta["dtype"])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def field(self, index, field):
+        """Returns the token ids of one field of one example, as a view into the token array."""
+        column = FIELDS.index(field)
+        start, end = self.offsets[index, column], self.offsets[index, column + 1]
+        return self.tokens[start:end]
+
+    def language(self, index):
+        return self.languages[self.language_codes[index]]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        entry = {"language": self.language(index)}
+        for field in FIELDS:
+            entry[field] = [self.field(index, field)]
+        return entry
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_json(self, file_path):
+        """Exports the store to the tokenized JSON layout, for debugging."""
+        examples = [
+            {"language": entry["language"], **{field: [entry[field][0].tolist()] for field in FIELDS}}
+            for entry in self
+        ]
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(examples, f, indent=4)
+
+def convert_json_to_store(json_path, out_dir):
+    """
+    Converts a tokenized JSON file to the memory-mapped store format.
+
+    Parameters:
+        json_path (str): The tokenized JSON file.
+        out_dir (str): The store directory to write.
+
+    Returns:
+        TokenizedStore: The converted store, opened for reading.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        examples = json.load(f)
+
+    max_id = max((max(entry[field][0], default=0) for entry in examples for field in FIELDS), default=0)
+    with TokenizedStoreWriter(out_dir, dtype_for_vocab(max_id + 1)) as writer:
+        for entry in examples:
+            writer.add(entry)
+    return TokenizedStore(out_dir)
+
+def load_tokenized(path):
+    """
+    Opens a tokenized dataset, either a store directory or a tokenized JSON file.
+
+    Returns:
+        TokenizedStore or list: The examples, indexable and iterable in the tokenized JSON layout.
+    """
+    if os.path.isdir(path):
+        return TokenizedStore(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
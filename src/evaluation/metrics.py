@@ -0,0 +1,198 @@
+import os
+import json
+import time
+from functools import partial
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from sacrebleu import sentence_chrf, corpus_chrf
+from Levenshtein import distance as levenshtein_distance
+from src.constants import METRICS_CHUNK_SIZE
+from src.inference.results_log import merge_results
+
+MAX_NGRAM = 4
+
+def ngram_counts(text, max_n=MAX_NGRAM):
+    """
+    Counts the whitespace-token n-grams of a text for every n from 1 to `max_n` in one pass.
+
+    Parameters:
+        text (str): The text to count n-grams of.
+        max_n (int): The largest n-gram order.
+
+    Returns:
+        list: One Counter per order, the n-grams of order n at index n - 1.
+    """
+    tokens = text.split()
+    counts = [Counter() for _ in range(max_n)]
+    for i in range(len(tokens)):
+        # Every n-gram starting at position i is a prefix of the longest one
+        for n in range(1, min(max_n, len(tokens) - i) + 1):
+            counts[n - 1][tuple(tokens[i:i + n])] += 1
+    return counts
+
+def ngram_overlaps(candidate_counts, reference_counts):
+    """
+    Computes the clipped n-gram overlap of a candidate with a reference for every order.
+
+    Returns:
+        list: A (overlap, candidate total) pair per order.
+    """
+    return [
+        (sum((candidate & reference).values()), sum(candidate.values()))
+        for candidate, reference in zip(candidate_counts, reference_counts)
+    ]
+
+def codebleu_from_overlaps(overlaps):
+    """Averages the n-gram precisions of `ngram_overlaps` into the simplified CodeBLEU score."""
+    ngram_scores = [overlap / total if total > 0 else 0 for overlap, total in overlaps]
+    return sum(ngram_scores) / len(ngram_scores) * 100
+
+def compute_codebleu(preds, refs, lang="python"):
+    #Simplified version of codebleu, I had some error with the codexglue repo
+    #Here, I'll compute n gram matching score as a placeholder, counting the n-grams of both texts once for all n
+    return codebleu_from_overlaps(ngram_overlaps(ngram_counts(preds), ngram_counts(refs)))
+
+METRICS = {
+    "exact_match": lambda generated, reference, lang: int(generated.strip() == reference.strip()),
+    "chrf": lambda generated, reference, lang: sentence_chrf(generated, [reference]).score,
+    "levenshtein_distance": lambda generated, reference, lang: levenshtein_distance(generated, reference),
+    "codebleu": lambda generated, reference, lang: compute_codebleu(generated, reference, lang)
+}
+
+def score_example(generated_text, true_middle_text, lang="python", timings=None):
+    """
+    Computes the text metrics of one example.
+
+    Parameters:
+        generated_text (str): The generated middle.
+        true_middle_text (str): The reference middle.
+        lang (str): The programming language of the example.
+        timings (dict or None): If given, the seconds spent in each metric are added to it.
+
+    Returns:
+        dict: The exact match, chrF, Levenshtein distance and CodeBLEU scores.
+    """
+    if timings is None:
+        return {name: metric(generated_text, true_middle_text, lang) for name, metric in METRICS.items()}
+    scores = {}
+    for name, metric in METRICS.items():
+        start = time.perf_counter()
+        scores[name] = metric(generated_text, true_middle_text, lang)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    return scores
+
+def _score_chunk(chunk, timed=False):
+    timings = {} if timed else None
+    scores = [score_example(generated, reference, lang, timings) for generated, reference, lang in chunk]
+    return (scores, timings) if timed else scores
+
+def score_examples(examples, workers=0, chunk_size=METRICS_CHUNK_SIZE, timings=None):
+    """
+    Scores many examples, optionally across a process pool.
+
+    Parameters:
+        examples (list): Tuples of generated text, reference text and language.
+        workers (int): The number of worker processes; 0 or 1 scores in this process.
+        chunk_size (int): The number of examples per pool task.
+        timings (dict or None): If given, the seconds spent in each metric, summed over workers, are added to it.
+
+    Returns:
+        list: The metric dicts of `score_example`, in the input order.
+    """
+    chunks = [examples[start:start + chunk_size] for start in range(0, len(examples), chunk_size)]
+    score_chunk = partial(_score_chunk, timed=timings is not None)
+    if workers and workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(score_chunk, chunks))
+    else:
+        chunk_results = [score_chunk(chunk) for chunk in chunks]
+
+    if timings is not None:
+        for _, chunk_timings in chunk_results:
+            for name, seconds in chunk_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+        chunk_results = [scores for scores, _ in chunk_results]
+    return [metrics for chunk in chunk_results for metrics in chunk]
+
+def corpus_scores(results):
+    """
+    Aggregates scored results per language and over all languages.
+
+    Per-example metrics are averaged. chrF is additionally computed at corpus level, and CodeBLEU
+    from n-gram overlaps summed over the whole corpus before taking precisions.
+
+    Parameters:
+        results (list): Results with 'generated', 'true_middle', 'language' and 'metrics' keys.
+
+    Returns:
+        dict: Aggregate scores per language, plus an 'all' entry.
+    """
+    groups = defaultdict(list)
+    for result in results:
+        groups[result["language"]].append(result)
+        groups["all"].append(result)
+
+    report = {}
+    for language, group in sorted(groups.items()):
+        summary = {"count": len(group)}
+        for name in group[0]["metrics"]:
+            values = [result["metrics"][name] for result in group if result["metrics"].get(name) is not None]
+            summary[f"mean_{name}"] = sum(values) / len(values) if values else None
+
+        generated = [result["generated"] for result in group]
+        references = [result["true_middle"] for result in group]
+        summary["corpus_chrf"] = corpus_chrf(generated, [references]).score
+
+        totals = [[0, 0] for _ in range(MAX_NGRAM)]
+        for candidate, reference in zip(generated, references):
+            for n, (overlap, total) in enumerate(ngram_overlaps(ngram_counts(candidate), ngram_counts(reference))):
+                totals[n][0] += overlap
+                totals[n][1] += total
+        summary["corpus_codebleu"] = codebleu_from_overlaps(totals)
+        report[language] = summary
+    return report
+
+def load_results(file_path, config_hash=None):
+    """
+    Loads inference results from a JSON file, a JSON lines file or the results logs of a run directory.
+
+    Results logged with different configs, such as the two prompting modes of one run directory, are never
+    mixed: `config_hash` selects one of them, and is required when the input holds several.
+
+    Parameters:
+        file_path (str): The results file or run directory.
+        config_hash (str or None): Only load the results of this config.
+
+    Returns:
+        list: The results.
+    """
+    if os.path.isdir(file_path):
+        results = merge_results(file_path, config_hash)
+    else:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if file_path.endswith(".jsonl"):
+                results = [json.loads(line) for line in f if line.strip()]
+            else:
+                results = json.load(f)
+        if config_hash is not None:
+            results = [result for result in results if result.get("config_hash") == config_hash]
+
+    hashes = sorted({result["config_hash"] for result in results if "config_hash" in result})
+    if len(hashes) > 1:
+        raise ValueError(f"{file_path} holds results of {len(hashes)} configs ({', '.join(hashes)}); select one by its config hash")
+    return results
+
+def score_results(results, workers=0):
+    """
+    Fills in the text metrics of inference results, keeping metrics already present (such as cosine similarity).
+
+    Returns:
+        list: The results, with their 'metrics' updated in place.
+    """
+    scores = score_examples(
+        [(result["generated"], result["true_middle"], result["language"]) for result in results],
+        workers=workers
+    )
+    for result, metrics in zip(results, scores):
+        result.setdefault("metrics", {}).update(metrics)
+    return results
@@ -0,0 +1,142 @@
+import torch
+from transformers import StoppingCriteriaList
+from src.inference.embeddings import pool_generation_hidden_states
+from src.inference.stopping import MiddleSpanStoppingCriteria, kept_token_count
+from src.constants import INFERENCE_BATCH_SIZE, MAX_BATCH_TOKENS, MAX_NEW_TOKENS
+
+def bucket_by_length(sequences, batch_size=INFERENCE_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Groups sequences into batches of similar length so that little padding is needed.
+
+    Parameters:
+        sequences (list): A list of token id lists.
+        batch_size (int): The maximum number of sequences per batch.
+        max_batch_tokens (int or None): The maximum padded size (rows x longest row) of a batch.
+
+    Returns:
+        list: A list of batches, each a list of indexes into `sequences`.
+    """
+    # Longest first, so an out-of-memory error shows up on the first batch rather than the last
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]), reverse=True)
+
+    batches = []
+    current = []
+    for index in order:
+        # The first sequence of a batch is the longest, so it sets the padded width
+        width = len(sequences[current[0]]) if current else len(sequences[index])
+        too_many_rows = len(current) >= batch_size
+        too_many_tokens = max_batch_tokens is not None and (len(current) + 1) * width > max_batch_tokens
+        if current and (too_many_rows or too_many_tokens):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+def left_pad(sequences, pad_token_id):
+    """
+    Left-pads token id lists to a common length, as required for batched decoder-only generation.
+
+    Parameters:
+        sequences (list): A list of token id lists.
+        pad_token_id (int): The token id used for padding.
+
+    Returns:
+        tuple: The padded input ids and the matching attention mask, both of shape (batch, width).
+    """
+    width = max(len(sequence) for sequence in sequences)
+    input_ids = torch.full((len(sequences), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, sequence in enumerate(sequences):
+        if len(sequence) == 0:
+            continue
+        input_ids[row, width - len(sequence):] = torch.as_tensor(list(sequence), dtype=torch.long)
+        attention_mask[row, width - len(sequence):] = 1
+    return input_ids, attention_mask
+
+def strip_generated(tokens, eos_token_id, stopped_at=None):
+    """
+    Cuts a generated row after its first end-of-sequence token, dropping the padding added once it finished.
+
+    Parameters:
+        tokens (list): The newly generated token ids of one row.
+        eos_token_id (int or None): The end-of-sequence token id.
+        stopped_at (int or None): The number of tokens generated when a stopping criterion ended the row;
+            everything after it is padding, including the first eos.
+
+    Returns:
+        list: The token ids the row would have produced if it had been generated on its own.
+    """
+    if stopped_at is not None:
+        tokens = tokens[:stopped_at]
+    if eos_token_id is not None and eos_token_id in tokens:
+        return tokens[:tokens.index(eos_token_id) + 1]
+    return tokens
+
+def generate_batched(model, tokenizer, sequences, batch_size=INFERENCE_BATCH_SIZE,
+                     max_batch_tokens=MAX_BATCH_TOKENS, max_new_tokens=MAX_NEW_TOKENS, device=None,
+                     return_embeddings=False, stop_rules=None):
+    """
+    Greedily generates continuations for many prompts, one `generate` call per length bucket.
+
+    Parameters:
+        model: A causal language model.
+        tokenizer: The tokenizer matching the model, used for its pad and eos token ids.
+        sequences (list): A list of prompt token id lists.
+        batch_size (int): The maximum number of prompts per `generate` call.
+        max_batch_tokens (int or None): The maximum padded prompt size of a `generate` call.
+        max_new_tokens (int): The maximum number of tokens to generate per prompt.
+        device (torch.device or None): The device to run on; defaults to the model's device.
+        return_embeddings (bool): Whether to also pool embeddings of the generated texts from the
+            hidden states computed during generation (see `pool_generation_hidden_states`). Only the
+            tokens kept once the text is trimmed with its stop rule are pooled.
+        stop_rules (list or None): A `MiddleStopRule` per prompt, to stop each row once its middle is complete.
+
+    Returns:
+        list: The generated token ids (without the prompt) for each prompt, in the original order.
+              With `return_embeddings`, a tuple of that list and a tensor with one embedding per prompt.
+    """
+    device = device or model.device
+    eos_token_id = tokenizer.eos_token_id
+    # StarCoder has no pad token; eos is safe to pad with since padded positions are masked out
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else eos_token_id
+
+    generated = [None] * len(sequences)
+    embeddings = [None] * len(sequences)
+    for batch in bucket_by_length(sequences, batch_size, max_batch_tokens):
+        input_ids, attention_mask = left_pad([sequences[i] for i in batch], pad_token_id)
+        stopping_criteria = None
+        stopped_at = [None] * len(batch)
+        if stop_rules is not None:
+            middle_span = MiddleSpanStoppingCriteria(tokenizer, input_ids.shape[1], [stop_rules[i] for i in batch])
+            stopping_criteria = StoppingCriteriaList([middle_span])
+            stopped_at = middle_span.stopped_at
+        with torch.no_grad():
+            outputs = model.generate(
+                input_ids=input_ids.to(device),
+                attention_mask=attention_mask.to(device),
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=1,
+                do_sample=False,
+                pad_token_id=pad_token_id,
+                output_hidden_states=return_embeddings,
+                return_dict_in_generate=return_embeddings,
+                stopping_criteria=stopping_criteria
+            )
+        output_ids = outputs.sequences if return_embeddings else outputs
+        # Every row shares the padded prompt width, so the new tokens start at the same column
+        new_tokens = output_ids[:, input_ids.shape[1]:].tolist()
+        rows = [strip_generated(tokens, eos_token_id, stopped) for tokens, stopped in zip(new_tokens, stopped_at)]
+        for row, index in enumerate(batch):
+            generated[index] = rows[row]
+        if return_embeddings:
+            kept = [kept_token_count(tokenizer, tokens, stop_rules[index] if stop_rules is not None else None)
+                    for tokens, index in zip(rows, batch)]
+            pooled = pool_generation_hidden_states(outputs.hidden_states, kept)
+            for row, index in enumerate(batch):
+                embeddings[index] = pooled[row]
+
+    if return_embeddings:
+        return generated, torch.stack(embeddings) if embeddings else torch.empty(0)
+    return generated
@@ -0,0 +1,209 @@
+import os
+import hashlib
+import numpy as np
+import torch
+from src.constants import CACHE_DIR, CACHE_MAX_BYTES
+
+# Every time a process has written this share of `max_bytes`, it rescans the directory for other processes' entries
+RESCAN_FRACTION = 8
+# Eviction frees space down to this share of `max_bytes`, so it runs once per many writes instead of on every one
+LOW_WATER_FRACTION = 0.9
+
+def content_hash(value):
+    """
+    Hashes a text or a sequence of token ids.
+
+    Parameters:
+        value (str or list): The text or token ids to hash.
+
+    Returns:
+        str: A hex digest that only depends on the content.
+    """
+    if isinstance(value, str):
+        data = b"text:" + value.encode("utf-8")
+    else:
+        data = b"ids:" + ",".join(str(int(token)) for token in value).encode("ascii")
+    return hashlib.sha256(data).hexdigest()
+
+class ArtifactCache:
+    """
+    A content-addressed on-disk cache for embeddings, decoded texts and token ids.
+
+    Entries are keyed by kind, model id, content hash and any extra parameter (such as the pooling method),
+    so reference-side artifacts computed in one eval run are reused by the next. Arrays are stored as `.npy`
+    files and memory-mapped on read. Once the cache grows past `max_bytes`, the least recently used entries
+    are evicted until it is down to LOW_WATER_FRACTION of `max_bytes`.
+
+    Several processes, such as the workers of a sharded run, may share one cache directory. Each one tracks
+    the entries it knows of in memory and rescans the directory whenever it has written 1 / RESCAN_FRACTION
+    of `max_bytes` since its last scan. The other processes' writes are therefore picked up late, and the
+    directory can exceed `max_bytes` by up to that share per process.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        """Rebuilds the entry index from the files on disk, including those other processes wrote or evicted."""
+        # path -> (last access time, size in bytes), used for LRU eviction
+        self.entries = {}
+        for root, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                self.entries[path] = (stat.st_mtime, stat.st_size)
+        self.total_bytes = sum(size for _, size in self.entries.values())
+        self.written_since_scan = 0
+
+    def key(self, kind, model_id, content, *params):
+        """Builds the cache key of an artifact derived from `content` by `model_id`."""
+        parts = [kind, model_id, content_hash(content)] + [str(param) for param in params]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def _touch(self, path):
+        # The modification time doubles as the last access time, since atime is often disabled
+        os.utime(path)
+        stat = os.stat(path)
+        self.entries[path] = (stat.st_mtime, stat.st_size)
+
+    def _store(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One temporary file per process, so workers writing the same entry do not collide
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        # Stat before the rename: once it is in place, another process may already evict the entry
+        stat = os.stat(tmp_path)
+        # Atomic, so a crashed run never leaves a truncated entry behind
+        os.replace(tmp_path, path)
+        previous = self.entries.get(path)
+        if previous:
+            self.total_bytes -= previous[1]
+        self.entries[path] = (stat.st_mtime, stat.st_size)
+        self.total_bytes += stat.st_size
+        self.written_since_scan += stat.st_size
+        if self.max_bytes is not None and self.written_since_scan * RESCAN_FRACTION >= self.max_bytes:
+            self.scan()
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries once the cache is over `max_bytes`, down to the low-water mark."""
+        if self.max_bytes is None or self.total_bytes <= self.max_bytes:
+            return
+        low_water = self.max_bytes * LOW_WATER_FRACTION
+        for path, (_, size) in sorted(self.entries.items(), key=lambda item: item[1][0]):
+            if self.total_bytes <= low_water:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            del self.entries[path]
+            self.total_bytes -= size
+
+    def get_array(self, key):
+        """Returns the cached array memory-mapped read-only, or None on a miss."""
+        path = self._path(key, ".npy")
+        try:
+            self._touch(path)
+            return np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            # Never written, or evicted by another process
+            return None
+
+    def put_array(self, key, array):
+        self._store(self._path(key, ".npy"), lambda f: np.save(f, np.asarray(array)))
+
+    def get_text(self, key):
+        """Returns the cached text, or None on a miss."""
+        path = self._path(key, ".txt")
+        try:
+            self._touch(path)
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_text(self, key, text):
+        self._store(self._path(key, ".txt"), lambda f: f.write(text.encode("utf-8")))
+
+def cached_embeddings(cache, model_id, pooling, items, compute):
+    """
+    Embeds items, computing only those that are not cached yet.
+
+    Parameters:
+        cache (ArtifactCache or None): The cache to use; None computes everything.
+        model_id (str): The id of the embedding model.
+        pooling (str): The pooling method, part of the cache key.
+        items (list): The texts or token id lists to embed.
+        compute (callable): Embeds a list of items, returning a (len(items), hidden) tensor.
+
+    Returns:
+        torch.Tensor: The embeddings, one row per item.
+    """
+    if cache is None:
+        return compute(items)
+
+    keys = [cache.key("embedding", model_id, item, pooling) for item in items]
+    rows = [cache.get_array(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        computed = compute([items[i] for i in missing])
+        for i, embedding in zip(missing, computed):
+            cache.put_array(keys[i], embedding.numpy())
+            rows[i] = embedding.numpy()
+    if not rows:
+        return torch.empty(0)
+    return torch.from_numpy(np.stack([np.asarray(row) for row in rows]))
+
+def cached_decode(cache, model_id, tokenizer, sequences):
+    """
+    Decodes token id lists to text, reusing cached decodings.
+
+    Returns:
+        list: The decoded texts, with special tokens skipped.
+    """
+    texts = []
+    for sequence in sequences:
+        if cache is None:
+            texts.append(tokenizer.decode(sequence, skip_special_tokens=True))
+            continue
+        key = cache.key("decoded", model_id, sequence)
+        text = cache.get_text(key)
+        if text is None:
+            text = tokenizer.decode(sequence, skip_special_tokens=True)
+            cache.put_text(key, text)
+        texts.append(text)
+    return texts
+
+def cached_encode(cache, model_id, tokenizer, texts):
+    """
+    Tokenizes texts (with truncation), reusing cached token ids.
+
+    Returns:
+        list: The token id lists, memory-mapped when they come from the cache.
+    """
+    sequences = []
+    for text in texts:
+        if cache is None:
+            sequences.append(tokenizer.encode(text, truncation=True))
+            continue
+        key = cache.key("tokens", model_id, text)
+        ids = cache.get_array(key)
+        if ids is None:
+            ids = tokenizer.encode(text, truncation=True)
+            cache.put_array(key, np.asarray(ids, dtype=np.int64))
+        sequences.append(ids)
+    return sequences
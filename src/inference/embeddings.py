@@ -0,0 +1,203 @@
+import torch
+import torch.nn.functional as F
+from src.inference.cache import cached_embeddings, cached_encode
+from src.inference.precision import model_cache_id
+from src.constants import EMBEDDING_BATCH_SIZE
+
+# Separates the prompt from the continuation inside a cached item; never a token id
+CONTEXT_SEPARATOR = -1
+
+def mean_pool(hidden_states, attention_mask):
+    """
+    Averages token hidden states over the positions that are not padding.
+
+    Parameters:
+        hidden_states (torch.Tensor): Hidden states of shape (batch, length, hidden).
+        attention_mask (torch.Tensor): A mask of shape (batch, length), 1 for real tokens.
+
+    Returns:
+        torch.Tensor: One embedding per row, of shape (batch, hidden). Rows without tokens are all zeros.
+    """
+    mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+    summed = (hidden_states * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1)
+    return summed / counts
+
+class StarCoderEmbedder:
+    """
+    Embeds code with the generation model itself, as the mean of its last hidden layer.
+
+    Texts are embedded in right-padded batches through the model's base transformer, so only the
+    last layer is ever materialised instead of every layer's hidden states. With an `ArtifactCache`,
+    embeddings and token ids already computed by an earlier run are read back instead.
+    """
+
+    pooling = "mean-last-hidden"
+
+    def __init__(self, model, tokenizer, batch_size=EMBEDDING_BATCH_SIZE, device=None, cache=None, model_id=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.device = device or model.device
+        self.cache = cache
+        self.model_id = model_id or model_cache_id(model)
+        # StarCoder has no pad token; the padded positions are masked out of the mean anyway
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    def embed_ids(self, sequences):
+        """
+        Embeds already tokenized texts.
+
+        Parameters:
+            sequences (list): A list of token id lists.
+
+        Returns:
+            torch.Tensor: The embeddings, of shape (len(sequences), hidden), on the CPU.
+        """
+        return cached_embeddings(self.cache, self.model_id, self.pooling, sequences, self._embed_ids)
+
+    def _embed_ids(self, sequences):
+        embeddings = []
+        # Sorting by length keeps the padding inside each batch small
+        order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = [list(sequences[i]) for i in order[start:start + self.batch_size]]
+            width = max(max(len(sequence) for sequence in batch), 1)
+            input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for row, sequence in enumerate(batch):
+                input_ids[row, :len(sequence)] = torch.as_tensor(sequence, dtype=torch.long)
+                attention_mask[row, :len(sequence)] = 1
+            attention_mask = attention_mask.to(self.device)
+            with torch.no_grad():
+                # The base model returns only the last hidden layer, without the LM head
+                outputs = self.model.base_model(input_ids=input_ids.to(self.device), attention_mask=attention_mask)
+            embeddings.append(mean_pool(outputs.last_hidden_state, attention_mask).float().cpu())
+
+        stacked = torch.cat(embeddings) if embeddings else torch.empty(0)
+        # Undo the length sort
+        result = torch.empty_like(stacked)
+        result[torch.as_tensor(order, dtype=torch.long)] = stacked
+        return result
+
+    def embed(self, texts):
+        """
+        Embeds texts in batches.
+
+        Parameters:
+            texts (list): A list of code strings.
+
+        Returns:
+            torch.Tensor: The embeddings, of shape (len(texts), hidden), on the CPU.
+        """
+        sequences = cached_encode(self.cache, self.model_id, self.tokenizer, texts)
+        return self.embed_ids(sequences)
+
+    def embed_continuations(self, prompts, continuations):
+        """
+        Embeds continuations in the context of their prompts, the way `pool_generation_hidden_states` embeds
+        generated tokens: as the mean of the last hidden layer at the positions that predict each continuation
+        token, which are the last prompt token and every continuation token but the last.
+
+        Parameters:
+            prompts (list): The prompt token id lists.
+            continuations (list): The continuation token id lists, one per prompt.
+
+        Returns:
+            torch.Tensor: The embeddings, of shape (len(prompts), hidden), on the CPU. Empty continuations are all zeros.
+        """
+        items = [list(prompt) + [CONTEXT_SEPARATOR] + list(continuation)
+                 for prompt, continuation in zip(prompts, continuations)]
+        return cached_embeddings(self.cache, self.model_id, "mean-last-hidden-in-context", items, self._embed_continuations)
+
+    def _embed_continuations(self, items):
+        sequences = []
+        spans = []
+        for item in items:
+            split = item.index(CONTEXT_SEPARATOR)
+            prompt, continuation = item[:split], item[split + 1:]
+            # The last continuation token predicts nothing that is part of the continuation, so it is never fed
+            sequences.append(prompt + continuation[:-1])
+            spans.append((len(prompt) - 1, len(prompt) - 1 + len(continuation)))
+
+        embeddings = []
+        for start in range(0, len(sequences), self.batch_size):
+            batch = sequences[start:start + self.batch_size]
+            width = max(max(len(sequence) for sequence in batch), 1)
+            input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            pool_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for row, (sequence, (first, end)) in enumerate(zip(batch, spans[start:start + self.batch_size])):
+                input_ids[row, :len(sequence)] = torch.as_tensor(sequence, dtype=torch.long)
+                attention_mask[row, :len(sequence)] = 1
+                pool_mask[row, first:end] = 1
+            with torch.no_grad():
+                outputs = self.model.base_model(input_ids=input_ids.to(self.device),
+                                                attention_mask=attention_mask.to(self.device))
+            embeddings.append(mean_pool(outputs.last_hidden_state, pool_mask.to(self.device)).float().cpu())
+        return torch.cat(embeddings) if embeddings else torch.empty(0)
+
+class SentenceTransformerEmbedder:
+    """
+    Embeds code with a small, separate sentence-transformers model instead of the generation model.
+    """
+
+    pooling = "sentence-transformers"
+
+    def __init__(self, model_name, batch_size=EMBEDDING_BATCH_SIZE, device=None, cache=None):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=str(device) if device is not None else None)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = cache
+
+    def embed(self, texts):
+        """
+        Embeds texts in batches.
+
+        Parameters:
+            texts (list): A list of code strings.
+
+        Returns:
+            torch.Tensor: The embeddings, of shape (len(texts), hidden), on the CPU.
+        """
+        return cached_embeddings(self.cache, self.model_name, self.pooling, list(texts), self._embed)
+
+    def _embed(self, texts):
+        embeddings = self.model.encode(texts, batch_size=self.batch_size, convert_to_tensor=True)
+        return embeddings.float().cpu()
+
+def pool_generation_hidden_states(step_hidden_states, generated_lengths):
+    """
+    Builds embeddings of generated texts from the hidden states `generate` already computed.
+
+    With `output_hidden_states=True` and `return_dict_in_generate=True`, step 0 holds the hidden states of the
+    (left-padded) prompt and every later step those of the token fed back in. The embedding averages the last
+    layer at the positions that predicted the generated tokens: the last prompt position, then each fed-back
+    token. These are contextual embeddings (the generated tokens attend to the prompt), so they are compared
+    with `StarCoderEmbedder.embed_continuations` of the reference, not with `StarCoderEmbedder.embed`.
+
+    Parameters:
+        step_hidden_states (tuple): The `hidden_states` field of the generate output.
+        generated_lengths (list): The number of generated tokens to pool of each row, such as those kept after trimming.
+
+    Returns:
+        torch.Tensor: One embedding per row, of shape (batch, hidden), on the CPU.
+    """
+    # Keep only the last layer: the prompt's last position, then one position per decode step
+    hidden_states = torch.cat([step_hidden_states[0][-1][:, -1:]] + [step[-1] for step in step_hidden_states[1:]], dim=1)
+    positions = torch.arange(hidden_states.shape[1], device=hidden_states.device)
+    lengths = torch.as_tensor(generated_lengths, device=hidden_states.device)
+    attention_mask = (positions.unsqueeze(0) < lengths.unsqueeze(1)).long()
+    return mean_pool(hidden_states, attention_mask).float().cpu()
+
+def cosine_similarities(embeddings1, embeddings2):
+    """
+    Computes row-wise cosine similarity between two equally sized embedding matrices.
+
+    Returns:
+        list: One similarity per row.
+    """
+    if len(embeddings1) == 0:
+        return []
+    return F.cosine_similarity(embeddings1, embeddings2, dim=-1).tolist()
@@ -0,0 +1,84 @@
+from collections import defaultdict
+from src.constants import MAX_TOKENS
+
+FIM_PREFIX = "<fim_prefix>"
+FIM_SUFFIX = "<fim_suffix>"
+FIM_MIDDLE = "<fim_middle>"
+
+INFERENCE_MODES = ("prefix", "fim")
+
+def fim_token_ids(tokenizer):
+    """
+    Looks up the ids of StarCoder's fill-in-the-middle special tokens.
+
+    Returns:
+        tuple: The ids of <fim_prefix>, <fim_suffix> and <fim_middle>.
+    """
+    ids = tuple(tokenizer.convert_tokens_to_ids(token) for token in (FIM_PREFIX, FIM_SUFFIX, FIM_MIDDLE))
+    if any(token_id is None or token_id == tokenizer.unk_token_id for token_id in ids):
+        raise ValueError("The tokenizer has no fill-in-the-middle tokens")
+    return ids
+
+def trim_around_cursor(prefix_ids, suffix_ids, budget):
+    """
+    Trims a prefix and a suffix to a shared token budget, keeping the tokens closest to the cursor.
+
+    Each side gets half of the budget; a side that needs less leaves the rest to the other.
+
+    Parameters:
+        prefix_ids (list): The prefix token ids; its end is next to the cursor.
+        suffix_ids (list): The suffix token ids; its start is next to the cursor.
+        budget (int): The maximum total number of prefix and suffix tokens.
+
+    Returns:
+        tuple: The trimmed prefix and suffix token ids.
+    """
+    prefix_budget = max(budget - min(len(suffix_ids), budget // 2), 0)
+    prefix_ids = prefix_ids[max(len(prefix_ids) - prefix_budget, 0):]
+    suffix_ids = suffix_ids[:max(budget - len(prefix_ids), 0)]
+    return prefix_ids, suffix_ids
+
+def build_fim_input(prefix_ids, suffix_ids, fim_ids, max_tokens=MAX_TOKENS):
+    """
+    Builds a <fim_prefix>prefix<fim_suffix>suffix<fim_middle> prompt directly from stored token ids.
+
+    Parameters:
+        prefix_ids (list): The prefix token ids.
+        suffix_ids (list): The suffix token ids.
+        fim_ids (tuple): The ids returned by `fim_token_ids`.
+        max_tokens (int): The maximum prompt length, special tokens included.
+
+    Returns:
+        list: The prompt token ids.
+    """
+    fim_prefix, fim_suffix, fim_middle = fim_ids
+    prefix_ids, suffix_ids = trim_around_cursor(
+        [int(token) for token in prefix_ids], [int(token) for token in suffix_ids], max_tokens - 3
+    )
+    return [fim_prefix] + prefix_ids + [fim_suffix] + suffix_ids + [fim_middle]
+
+def compare_modes(results):
+    """
+    Compares inference modes on quality and generation length.
+
+    Parameters:
+        results (list): Results with 'mode', 'generated_tokens' and 'metrics' keys.
+
+    Returns:
+        dict: Per mode, the number of examples, the mean number of generated tokens and the mean of each metric.
+    """
+    groups = defaultdict(list)
+    for result in results:
+        groups[result.get("mode", "prefix")].append(result)
+
+    report = {}
+    for mode, group in groups.items():
+        summary = {
+            "examples": len(group),
+            "mean_generated_tokens": sum(result["generated_tokens"] for result in group) / len(group)
+        }
+        for name in group[0]["metrics"]:
+            values = [result["metrics"][name] for result in group if result["metrics"].get(name) is not None]
+            summary[f"mean_{name}"] = sum(values) / len(values) if values else None
+        report[mode] = summary
+    return report
@@ -0,0 +1,320 @@
+import logging
+import torch
+from transformers import StoppingCriteriaList
+from src.constants import MAX_TOKENS, MAX_NEW_TOKENS, MAX_BATCH_TOKENS, RESULTS_FLUSH_EVERY
+from src.inference.batching import generate_batched
+from src.inference.prefix_cache import generate_with_shared_prefix
+from src.inference.speculative import PromptLookupDrafter, DraftModelDrafter, speculative_generate, summarize_speculative_stats
+from src.inference.stopping import MiddleSpanStoppingCriteria, build_stop_rule, trim_completion, decode_steps_report
+from src.inference.fim import fim_token_ids, build_fim_input
+from src.inference.embeddings import StarCoderEmbedder, SentenceTransformerEmbedder, cosine_similarities
+from src.inference.cache import cached_decode
+from src.evaluation.metrics import score_examples
+from src.profiling import Profiler
+
+logger = logging.getLogger(__name__)
+
+def generate_single(model, tokenizer, prefix_ids, stop_rule=None, max_new_tokens=MAX_NEW_TOKENS, device=None):
+    # Generates the continuation of one prefix with batch size 1
+    device = device or model.device
+    input_ids = torch.tensor(list(prefix_ids), dtype=torch.long).unsqueeze(0).to(device)
+    attention_mask = torch.ones_like(input_ids).to(device)
+    stopping_criteria = None
+    if stop_rule is not None:
+        stopping_criteria = StoppingCriteriaList([MiddleSpanStoppingCriteria(tokenizer, input_ids.shape[1], [stop_rule])])
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            num_return_sequences=1,
+            do_sample=False,  # Disable sampling for deterministic results
+            stopping_criteria=stopping_criteria
+        )
+    #Exclude the input_ids from the generated_ids to get the new tokens
+    return outputs[0][input_ids.shape[1]:].tolist()
+
+def generation_conflicts(batch_size=None, share_prefix=False, speculative=None, reuse_generation_states=False):
+    """
+    Lists the generation options that cannot be combined.
+
+    `run_inference_on_data` takes a single generation path: prefix sharing, else speculative decoding, else
+    batched generation. Hidden states of generation are only reused on the batched path.
+
+    Returns:
+        list: A message per conflict, empty when the options work together.
+    """
+    conflicts = []
+    if share_prefix and speculative:
+        conflicts.append("--share-prefix cannot be combined with --speculative")
+    if share_prefix and batch_size:
+        conflicts.append("--share-prefix generates one example at a time from the shared caches and cannot be combined with --batch-size")
+    if speculative and batch_size:
+        conflicts.append("--speculative decodes one example at a time and cannot be combined with --batch-size")
+    if reuse_generation_states and (not batch_size or share_prefix or speculative):
+        conflicts.append("--reuse-generation-states only works with --batch-size, without --share-prefix or --speculative")
+    return conflicts
+
+def run_inference_on_data(model, tokenizer, tokenized_data, batch_size=None, max_batch_tokens=MAX_BATCH_TOKENS,
+                          embedding_model=None, reuse_generation_states=False, cache=None,
+                          compute_metrics=True, metric_workers=0, share_prefix=False,
+                          speculative=None, draft_model=None, stop_rules=None, mode="prefix",
+                          max_new_tokens=MAX_NEW_TOKENS, device=None, profiler=None):
+    """
+    Generates the middle of every example, embeds and scores it.
+
+    Parameters:
+        model: The causal language model to generate and embed with.
+        tokenizer: The tokenizer matching the model.
+        tokenized_data (list): The tokenized examples.
+        batch_size (int or None): Generate in length-bucketed batches of this size.
+        max_batch_tokens (int): The maximum padded prompt tokens per batched generate call.
+        embedding_model (str or None): A sentence-transformers model to embed with instead of `model`.
+        reuse_generation_states (bool): Embed generated texts from the hidden states of batched generation, and
+            references after the same prompts; the score is reported as 'contextual_cosine_similarity'.
+        cache (ArtifactCache or None): The cache for reference-side artifacts.
+        compute_metrics (bool): Score the text metrics; otherwise only cosine similarity is computed.
+        metric_workers (int): The number of metric worker processes.
+        share_prefix (bool): Prefill prompt prefixes shared by several examples once.
+        speculative (str or None): "prompt-lookup" or "draft-model" speculative decoding.
+        draft_model: The draft model for "draft-model" speculative decoding.
+        stop_rules (tuple or None): The stopping rules to enable, a subset of STOP_RULES.
+        mode (str): "prefix" or "fim" prompting.
+        max_new_tokens (int): The maximum number of tokens to generate per example.
+        device (torch.device or None): The device to run on; defaults to the model's device.
+        profiler (Profiler or None): Collects the time, tokens and memory of each stage.
+
+    Returns:
+        list: A result dict per example, in the order of `tokenized_data`.
+    """
+    device = device or model.device
+    profiler = profiler if profiler is not None else Profiler()
+    inference_results = []
+    for conflict in generation_conflicts(batch_size, share_prefix, speculative, reuse_generation_states):
+        logger.warning("Ignoring an incompatible generation option: %s", conflict)
+
+    with profiler.stage("prepare"):
+        # Prefix-only mode feeds the prefix; FIM mode builds <fim_prefix>...<fim_suffix>...<fim_middle> from the stored ids
+        if mode == "fim":
+            fim_ids = fim_token_ids(tokenizer)
+            prompts = [build_fim_input(entry['prefix'][0], entry['suffix'][0], fim_ids) for entry in tokenized_data]
+        else:
+            prompts = [entry['prefix'][0] for entry in tokenized_data]
+
+        # Decode the true middle and input texts; these only depend on the dataset, so they come from the cache on reruns
+        model_id = model.config.name_or_path
+        true_middle_texts = cached_decode(cache, model_id, tokenizer, [entry['middle'][0] for entry in tokenized_data])
+        input_texts = cached_decode(cache, model_id, tokenizer, [entry['prefix'][0] for entry in tokenized_data])
+
+        # Stop each generation once its middle is complete, instead of always running to MAX_NEW_TOKENS
+        example_stop_rules = None
+        if stop_rules:
+            suffix_texts = cached_decode(cache, model_id, tokenizer, [entry['suffix'][0] for entry in tokenized_data])
+            example_stop_rules = [
+                build_stop_rule(entry['language'], input_texts[idx], true_middle_texts[idx], suffix_texts[idx],
+                                len(entry['middle'][0]), rules=stop_rules)
+                for idx, entry in enumerate(tokenized_data)
+            ]
+
+    generated_embeddings = None
+    with profiler.stage("generate") as generate_stage, profiler.track_forward(model):
+        if share_prefix:
+            # Examples split from the same file share their leading tokens; their KV cache is prefilled once
+            generated_tokens, prefix_stats = generate_with_shared_prefix(
+                model, tokenizer, prompts,
+                max_new_tokens=max_new_tokens, device=device, stop_rules=example_stop_rules
+            )
+            logger.info("Prefix sharing saved %d of %d prefill tokens (%d shared prefixes)",
+                        prefix_stats['prefill_tokens_saved'], prefix_stats['prefill_tokens'], prefix_stats['shared_prefixes'])
+        elif speculative:
+            # A drafter proposes tokens that StarCoder verifies in one forward pass; the output stays greedy
+            generated_tokens = []
+            speculative_stats = []
+            for idx, entry in enumerate(tokenized_data):
+                if speculative == "prompt-lookup":
+                    drafter = PromptLookupDrafter(entry['suffix'][0])
+                else:
+                    drafter = DraftModelDrafter(draft_model)
+                stopping_criteria = None
+                example_max_new_tokens = max_new_tokens
+                if example_stop_rules is not None:
+                    rule = example_stop_rules[idx]
+                    stopping_criteria = MiddleSpanStoppingCriteria(tokenizer, len(prompts[idx]), [rule])
+                    # A verify round can accept several tokens at once, so the token budget must cap the round itself
+                    if "tokens" in rule.rules:
+                        example_max_new_tokens = min(max_new_tokens, rule.token_budget)
+                tokens, stats = speculative_generate(
+                    model, prompts[idx], drafter, max_new_tokens=example_max_new_tokens,
+                    eos_token_id=tokenizer.eos_token_id, device=device, stopping_criteria=stopping_criteria
+                )
+                generated_tokens.append(tokens)
+                speculative_stats.append(stats)
+            summary = summarize_speculative_stats(speculative_stats)
+            logger.info("Speculative decoding (%s): acceptance rate %.2f%%, %.1f tokens/s, %d forward passes",
+                        speculative, 100 * summary['acceptance_rate'], summary['mean_tokens_per_second'], summary['forward_passes'])
+        elif batch_size:
+            # In batched mode every prefix is generated up front, bucketed by length, in a few large generate calls
+            generated_tokens = generate_batched(
+                model, tokenizer, prompts,
+                batch_size=batch_size, max_batch_tokens=max_batch_tokens, max_new_tokens=max_new_tokens, device=device,
+                return_embeddings=reuse_generation_states, stop_rules=example_stop_rules
+            )
+            if reuse_generation_states:
+                generated_tokens, generated_embeddings = generated_tokens
+        else:
+            generated_tokens = [
+                generate_single(model, tokenizer, prompt, example_stop_rules[idx] if example_stop_rules else None,
+                                max_new_tokens=max_new_tokens, device=device)
+                for idx, prompt in enumerate(prompts)
+            ]
+
+    generate_stage["tokens"] += sum(len(tokens) for tokens in generated_tokens)
+
+    with profiler.stage("detokenize"):
+        generated_texts = [tokenizer.decode(tokens, skip_special_tokens=True) for tokens in generated_tokens]
+        if example_stop_rules is not None:
+            # Generation stops only after the line that ends the middle is complete; cut that overshoot off
+            generated_texts = [trim_completion(text, rule) for text, rule in zip(generated_texts, example_stop_rules)]
+            for language, steps in sorted(decode_steps_report([entry['language'] for entry in tokenized_data], generated_tokens, max_new_tokens).items()):
+                logger.info("Decode steps (%s): %d used, %d saved over %d examples",
+                            language, steps['decode_steps'], steps['decode_steps_saved'], steps['examples'])
+
+    # Embed all generated and reference texts across the dataset in batches, instead of two forward passes per example
+    if embedding_model:
+        embedder = SentenceTransformerEmbedder(embedding_model, device=device, cache=cache)
+        with profiler.stage("embed_generated"):
+            embeddings1 = embedder.embed(generated_texts)
+        with profiler.stage("embed_references"):
+            embeddings2 = embedder.embed(true_middle_texts)
+    else:
+        embedder = StarCoderEmbedder(model, tokenizer, device=device, cache=cache)
+        with profiler.stage("embed_generated"):
+            if generated_embeddings is not None:
+                embeddings1 = generated_embeddings
+            else:
+                embeddings1 = embedder.embed(generated_texts)
+        with profiler.stage("embed_references"):
+            if generated_embeddings is not None:
+                # Generation states are contextual, so the reference is embedded after the same prompt; it is
+                # capped at the generation limit, the most the generated side can pool
+                embeddings2 = embedder.embed_continuations(
+                    prompts, [entry['middle'][0][:max_new_tokens] for entry in tokenized_data])
+            else:
+                embeddings2 = embedder.embed_ids([entry['middle'][0] for entry in tokenized_data])
+    cosine_sims = cosine_similarities(embeddings1, embeddings2)
+    # Contextual embeddings score differently from embeddings of the texts alone, so they are reported apart
+    similarity_metric = "contextual_cosine_similarity" if generated_embeddings is not None else "cosine_similarity"
+
+    # Text metrics are scored in bulk; with compute_metrics=False they are left to run_metrics.py
+    if compute_metrics:
+        metric_timings = {}
+        with profiler.stage("metrics"):
+            text_metrics = score_examples(
+                [(generated_texts[idx], true_middle_texts[idx], entry['language']) for idx, entry in enumerate(tokenized_data)],
+                workers=metric_workers, timings=metric_timings
+            )
+        profiler.add_metric_seconds(metric_timings)
+    else:
+        text_metrics = [{} for _ in tokenized_data]
+    profiler.examples += len(tokenized_data)
+
+    for idx, entry in enumerate(tokenized_data):
+        generated_text = generated_texts[idx]
+        true_middle_text = true_middle_texts[idx]
+        input_text = input_texts[idx]
+
+        # Get the programming language from the entry
+        lang = entry['language']  
+
+        metrics = dict(text_metrics[idx], **{similarity_metric: cosine_sims[idx]})
+
+        # Log the results for each metric; formatting them is skipped unless DEBUG is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            lines = [f"Example {idx + 1}:", "Input text:", input_text, "\nGenerated text:", generated_text,
+                     "\nTrue middle text:", true_middle_text, "\nMetrics:", f"Language: {lang}"]
+            if compute_metrics:
+                lines += [f"Exact match: {metrics['exact_match']}", f"Chrf score: {metrics['chrf']:.4f}",
+                          f"Levenshtein distance: {metrics['levenshtein_distance']}"]
+            lines.append(f"{similarity_metric.replace('_', ' ').capitalize()}: {metrics[similarity_metric]:.4f}")
+            if compute_metrics:
+                lines.append(f"Codebleu score: {metrics['codebleu']:.2f}")
+            logger.debug("\n".join(lines))
+
+        inference_results.append({
+            "input": input_text,
+            "generated": generated_text,
+            "true_middle": true_middle_text,
+            "language": lang,
+            "mode": mode,
+            "generated_tokens": len(generated_tokens[idx]),
+            "metrics": metrics
+        })
+
+    return inference_results
+
+def run_config(model_id, mode, stop_rules=None, embedding_model=None, reuse_generation_states=False,
+               compute_metrics=True, max_new_tokens=MAX_NEW_TOKENS, precision=None):
+    # The settings that change the results of an example; speed-only options such as batching are left out
+    return {
+        "model": model_id,
+        "mode": mode,
+        "max_tokens": MAX_TOKENS,
+        "max_new_tokens": max_new_tokens,
+        "stop_on": sorted(stop_rules) if stop_rules else None,
+        "embedding_model": embedding_model,
+        "reuse_generation_states": reuse_generation_states,
+        "compute_metrics": compute_metrics,
+        "precision": precision
+    }
+
+def run_logged(model, tokenizer, tokenized_data, results_log, ids, resume=False, flush_every=RESULTS_FLUSH_EVERY,
+               profiler=None, profile_window=None, **kwargs):
+    """
+    Runs inference in chunks, appending each chunk's results to the results log as soon as it is done.
+
+    Parameters:
+        model: The causal language model.
+        tokenizer: The tokenizer matching the model.
+        tokenized_data (list): The examples of this shard.
+        results_log (ResultsLog or None): The log to append to; without one, all examples run as a single chunk.
+        ids (list): The example id of each example.
+        resume (bool): Skip examples the run directory already has results for with the same config.
+        flush_every (int): The number of examples generated between flushes.
+        profiler (Profiler or None): Collects the stage measurements of all chunks.
+        profile_window (tuple or None): A (start, end) range of example positions to record a torch profiler
+            trace of; those examples run as a chunk of their own.
+        **kwargs: Passed on to `run_inference_on_data`.
+
+    Returns:
+        list: The results of the examples run now.
+    """
+    done = results_log.completed() if results_log is not None and resume else set()
+    pending = [idx for idx, example_id in enumerate(ids) if example_id not in done]
+    if done:
+        logger.info("Resuming: %d of %d examples already done", len(ids) - len(pending), len(ids))
+
+    chunk_size = flush_every if results_log is not None else max(len(pending), 1)
+    chunks = []
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        if profile_window is None:
+            chunks.append((chunk, False))
+            continue
+        # Split the chunk at the window edges, so the trace covers exactly the examples of the window
+        before = [idx for idx in chunk if idx < profile_window[0]]
+        inside = [idx for idx in chunk if profile_window[0] <= idx < profile_window[1]]
+        after = [idx for idx in chunk if idx >= profile_window[1]]
+        chunks.extend((part, traced) for part, traced in ((before, False), (inside, True), (after, False)) if part)
+
+    results = []
+    for chunk, traced in chunks:
+        examples = [tokenized_data[idx] for idx in chunk]
+        if traced:
+            with profiler.trace(f"{chunk[0]}-{chunk[-1] + 1}"):
+                chunk_results = run_inference_on_data(model, tokenizer, examples, profiler=profiler, **kwargs)
+        else:
+            chunk_results = run_inference_on_data(model, tokenizer, examples, profiler=profiler, **kwargs)
+        if results_log is not None:
+            results_log.append([ids[idx] for idx in chunk], chunk_results)
+        results.extend(chunk_results)
+    return results
@@ -0,0 +1,92 @@
+import importlib.util
+
+PRECISIONS = ("fp32", "bf16", "int8", "int4")
+
+# The dtype each precision loads the checkpoint in before it is quantized, if at all
+LOAD_DTYPES = {"fp32": "float32", "bf16": "bfloat16", "int8": "float32", "int4": "bfloat16"}
+
+def apply_precision(model, precision):
+    """
+    Converts a loaded model to a reduced-precision inference mode, in place.
+
+    - fp32 and bf16 cast every weight.
+    - int8 replaces every linear layer with a dynamically quantized one: weights are stored as int8 and
+      activations are quantized on the fly. This runs on the CPU only.
+    - int4 quantizes linear weights to 4 bits with torchao, which must be installed.
+
+    Parameters:
+        model: The causal language model, loaded in the dtype of LOAD_DTYPES[precision].
+        precision (str): One of PRECISIONS.
+
+    Returns:
+        The converted model, tagged with its precision for cache keys and run configs.
+    """
+    # Imported here so the registry can list the precisions without importing torch
+    import torch
+
+    if precision == "fp32":
+        model = model.float()
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+    elif precision == "int8":
+        if model.device.type != "cpu":
+            raise ValueError("int8 dynamic quantization runs on the CPU only")
+        from torch.ao.quantization import quantize_dynamic
+        model = quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif precision == "int4":
+        if importlib.util.find_spec("torchao") is None:
+            raise ImportError("int4 weight-only quantization needs torchao: pip install torchao")
+        from torchao.quantization import quantize_
+        try:
+            from torchao.quantization import Int4WeightOnlyConfig
+            config = Int4WeightOnlyConfig()
+        except ImportError:
+            # Older torchao releases expose the config as a function
+            from torchao.quantization import int4_weight_only
+            config = int4_weight_only()
+        quantize_(model.to(torch.bfloat16), config)
+    else:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    model.inference_precision = precision
+    return model
+
+def model_cache_id(model):
+    """
+    Returns the id that keys cached model outputs, which differ between precisions and dtypes of the same model.
+
+    A model converted with `apply_precision` is keyed by its precision; otherwise by the dtype it was loaded in,
+    such as a bfloat16 load through --dtype. fp32 keeps the bare model id.
+    """
+    precision = getattr(model, "inference_precision", None)
+    name = model.config.name_or_path
+    if precision not in (None, "fp32"):
+        return f"{name}@{precision}"
+    dtype = str(model.dtype).replace("torch.", "")
+    return name if dtype == "float32" else f"{name}@{dtype}"
+
+def metric_drift(reference_results, results, metrics=("exact_match", "chrf")):
+    """
+    Compares the results of a reduced-precision run with fp32 results on the same examples.
+
+    Parameters:
+        reference_results (list): The fp32 results.
+        results (list): The results to compare, in the same example order.
+        metrics (tuple): The metrics to compare.
+
+    Returns:
+        dict: The fraction of identical generations, and per metric the mean of each run,
+              the mean difference and the mean absolute difference per example.
+    """
+    pairs = list(zip(reference_results, results))
+    drift = {"identical_generations": sum(a["generated"] == b["generated"] for a, b in pairs) / max(len(pairs), 1)}
+    for name in metrics:
+        reference = [float(a["metrics"][name]) for a, _ in pairs]
+        values = [float(b["metrics"][name]) for _, b in pairs]
+        count = max(len(pairs), 1)
+        drift[name] = {
+            "reference_mean": sum(reference) / count,
+            "mean": sum(values) / count,
+            "mean_difference": sum(b - a for a, b in zip(reference, values)) / count,
+            "mean_absolute_difference": sum(abs(b - a) for a, b in zip(reference, values)) / count
+        }
+    return drift
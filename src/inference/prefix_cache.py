@@ -0,0 +1,112 @@
+import copy
+import torch
+from transformers import StoppingCriteriaList
+from src.inference.stopping import MiddleSpanStoppingCriteria
+from src.constants import MAX_NEW_TOKENS, PREFIX_SHARE_MIN_TOKENS
+
+def common_prefix_length(sequence1, sequence2):
+    """Returns the number of leading tokens two token id lists have in common."""
+    length = 0
+    for token1, token2 in zip(sequence1, sequence2):
+        if token1 != token2:
+            break
+        length += 1
+    return length
+
+def _ids_tensor(tokens, device):
+    return torch.tensor([[int(token) for token in tokens]], dtype=torch.long, device=device)
+
+def generate_with_shared_prefix(model, tokenizer, sequences, min_shared_tokens=PREFIX_SHARE_MIN_TOKENS,
+                                max_new_tokens=MAX_NEW_TOKENS, device=None, stop_rules=None):
+    """
+    Greedily generates continuations, prefilling leading tokens shared by several prompts only once.
+
+    Prompts are sorted lexicographically, so prompts with a common start, such as splits of the same source
+    file, end up next to each other and form a prefix tree. Walking that tree, the past key values of each
+    shared prefix are computed once and extended for the prompts below it; every prompt then forks generation
+    from its own copy of the deepest cache it shares, so only its remaining tokens are prefilled.
+
+    Parameters:
+        model: A causal language model.
+        tokenizer: The tokenizer matching the model.
+        sequences (list): A list of prompt token id lists.
+        min_shared_tokens (int): The minimum number of extra shared tokens worth computing a cache for.
+        max_new_tokens (int): The maximum number of tokens to generate per prompt.
+        device (torch.device or None): The device to run on; defaults to the model's device.
+        stop_rules (list or None): A `MiddleStopRule` per prompt, to stop once its middle is complete.
+
+    Returns:
+        tuple: The generated token ids (without the prompt) for each prompt in the original order, and a dict
+               with the number of prefill tokens without sharing and the number of prefill tokens saved.
+    """
+    device = device or model.device
+    generated = [None] * len(sequences)
+    total_prefill = sum(len(sequence) for sequence in sequences)
+    stats = {"prefill_tokens": total_prefill, "prefill_tokens_saved": 0, "shared_prefixes": 0}
+    performed = [0]
+
+    def generate_one(index, cache, cached):
+        input_ids = _ids_tensor(sequences[index], device)
+        kwargs = {}
+        if cache is not None:
+            # generate extends the cache in place, so every prompt forks its own copy
+            kwargs["past_key_values"] = copy.deepcopy(cache)
+        if stop_rules is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([
+                MiddleSpanStoppingCriteria(tokenizer, input_ids.shape[1], [stop_rules[index]])
+            ])
+        with torch.no_grad():
+            outputs = model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=1,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+                **kwargs
+            )
+        performed[0] += input_ids.shape[1] - cached
+        generated[index] = outputs[0][input_ids.shape[1]:].tolist()
+
+    # Depth-first walk of the prefix tree, with an explicit stack since it can be as deep as a group is large
+    order = sorted(range(len(sequences)), key=lambda i: [int(token) for token in sequences[i]])
+    stack = [(order, None, 0)] if order else []
+    while stack:
+        group, cache, cached = stack.pop()
+        if len(group) == 1:
+            generate_one(group[0], cache, cached)
+            continue
+
+        # The prefix shared by the whole group; generate needs at least one uncached token per prompt
+        lcps = [common_prefix_length(sequences[a], sequences[b]) for a, b in zip(group, group[1:])]
+        shared = min([min(lcps)] + [len(sequences[i]) - 1 for i in group])
+        if shared - cached >= min_shared_tokens:
+            with torch.no_grad():
+                cache = model(
+                    input_ids=_ids_tensor(sequences[group[0]][cached:shared], device),
+                    past_key_values=copy.deepcopy(cache) if cache is not None else None,
+                    use_cache=True
+                ).past_key_values
+            performed[0] += shared - cached
+            cached = shared
+            stats["shared_prefixes"] += 1
+
+        # Prompts with no token beyond the shared prefix left to cache generate from here
+        rest = []
+        for index in group:
+            if len(sequences[index]) - 1 <= shared:
+                generate_one(index, cache, cached)
+            else:
+                rest.append(index)
+
+        # Split the rest where neighbours share no more than `shared` tokens; each part shares a longer prefix
+        parts = []
+        for position, index in enumerate(rest):
+            if not parts or common_prefix_length(sequences[rest[position - 1]], sequences[index]) <= shared:
+                parts.append([])
+            parts[-1].append(index)
+        for part in reversed(parts):
+            stack.append((part, cache, cached))
+
+    stats["prefill_tokens_saved"] = total_prefill - performed[0]
+    return generated, stats
@@ -0,0 +1,122 @@
+import os
+import json
+import glob
+import hashlib
+from collections import Counter
+
+CONFIG_FILE = "config.json"
+RESULTS_PATTERN = "results-*.jsonl"
+
+def config_hash(config):
+    """Hashes the settings that affect the results of a run, so results of different settings never mix."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def example_ids(tokenized_data):
+    """
+    Derives a stable id for every tokenized example from its content.
+
+    Identical examples (the same split drawn twice) get an occurrence counter, so every example keeps its own
+    id regardless of where it sits in the dataset.
+
+    Returns:
+        list: One id per example.
+    """
+    seen = Counter()
+    ids = []
+    for entry in tokenized_data:
+        digest = hashlib.sha256(entry["language"].encode("utf-8"))
+        for field in ("prefix", "middle", "suffix"):
+            digest.update(b"|" + ",".join(str(int(token)) for token in entry[field][0]).encode("ascii"))
+        content = digest.hexdigest()[:16]
+        ids.append(f"{content}-{seen[content]}")
+        seen[content] += 1
+    return ids
+
+def read_results(run_dir):
+    """
+    Reads every results log of a run directory.
+
+    A run that crashed mid-write can leave a truncated last line, which is skipped.
+
+    Returns:
+        list: The records, in file order.
+    """
+    records = []
+    for path in sorted(glob.glob(os.path.join(run_dir, RESULTS_PATTERN))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+def load_configs(run_dir):
+    """Returns the configs of every run logged in a run directory, by config hash."""
+    config_path = os.path.join(run_dir, CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def merge_results(run_dir, config_hash=None):
+    """
+    Merges the results logs of all shards of a run into one list, one record per example and config.
+
+    Parameters:
+        run_dir (str): The run directory.
+        config_hash (str or None): Only keep records of this config.
+
+    Returns:
+        list: The merged records, sorted by example id.
+    """
+    merged = {}
+    for record in read_results(run_dir):
+        if config_hash is None or record["config_hash"] == config_hash:
+            merged[(record["example_id"], record["config_hash"])] = record
+    return [merged[key] for key in sorted(merged)]
+
+class ResultsLog:
+    """
+    An append-only JSONL results log inside a run directory.
+
+    Every record carries its example id and the hash of the run config. Records are flushed and fsynced
+    after each batch, so a crash or preemption loses at most the batch in flight, and a resumed run skips
+    the examples any shard of the same run directory already finished with the same config.
+    """
+
+    def __init__(self, run_dir, config, shard="0"):
+        self.run_dir = run_dir
+        self.config = config
+        self.config_hash = config_hash(config)
+        os.makedirs(run_dir, exist_ok=True)
+
+        configs = load_configs(run_dir)
+        if self.config_hash not in configs:
+            configs[self.config_hash] = config
+            with open(os.path.join(run_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+                json.dump(configs, f, indent=4)
+
+        self.path = os.path.join(run_dir, f"results-{shard}.jsonl")
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def completed(self):
+        """Returns the ids of the examples already finished with this config, in any shard."""
+        return {record["example_id"] for record in read_results(self.run_dir) if record["config_hash"] == self.config_hash}
+
+    def append(self, example_ids, records):
+        """Appends a batch of results and makes sure it reached the disk."""
+        for example_id, record in zip(example_ids, records):
+            line = dict(record, example_id=example_id, config_hash=self.config_hash)
+            self.file.write(json.dumps(line) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,157 @@
+import os
+import time
+import queue
+import traceback
+import multiprocessing
+from collections import defaultdict
+from src.constants import SHARD_CHUNK_SIZE
+
+def plan_chunks(prefix_lengths, chunk_size=SHARD_CHUNK_SIZE):
+    """
+    Splits the dataset into deterministic chunks of examples with similar prefix lengths.
+
+    Chunks are ordered longest prefixes first. Workers pull the next chunk whenever they are free, so the
+    most expensive work is handed out while there is still cheap work left to even out the finish times.
+
+    Parameters:
+        prefix_lengths (dict): The prefix length of each example index to run.
+        chunk_size (int): The number of examples per chunk.
+
+    Returns:
+        list: The chunks, each a list of example indices.
+    """
+    order = sorted(prefix_lengths, key=lambda idx: (-prefix_lengths[idx], idx))
+    return [order[start:start + chunk_size] for start in range(0, len(order), chunk_size)]
+
+def _worker(worker_index, model_id, model_options, device, num_threads, data_path, draft_model_id, inference_kwargs,
+            task_queue, result_queue):
+    # Runs in its own process: loads a model replica, then runs chunks until it gets the stop signal
+    try:
+        import torch
+        from src.models import get_model, get_tokenizer
+        from src.data.tokenized_store import load_tokenized
+        from src.inference.pipeline import run_inference_on_data
+        from src.profiling import Profiler
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        start = time.perf_counter()
+        tokenizer = get_tokenizer(model_id)
+        model = get_model(model_id, device=device, **model_options)
+        draft_model = None
+        if draft_model_id:
+            draft_model = get_model(draft_model_id, device=device, **model_options)
+        tokenized_data = load_tokenized(data_path)
+        profiler = Profiler()
+        result_queue.put(("ready", worker_index, time.perf_counter() - start))
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            mode, indices = task
+            start = time.perf_counter()
+            results = run_inference_on_data(
+                model, tokenizer, [tokenized_data[idx] for idx in indices],
+                draft_model=draft_model, mode=mode, device=torch.device(device), profiler=profiler, **inference_kwargs
+            )
+            result_queue.put(("result", worker_index, (mode, indices, results), time.perf_counter() - start))
+        result_queue.put(("done", worker_index, profiler.summary()))
+    except Exception:
+        result_queue.put(("error", worker_index, traceback.format_exc()))
+
+def run_sharded(data_path, tasks, model_id, model_options=None, devices=("cpu",), threads_per_worker=None, num_workers=2,
+                draft_model_id=None, on_result=None, **inference_kwargs):
+    """
+    Runs inference over chunks of the dataset with one model replica per worker process.
+
+    Each worker loads its own model on its own device and thread count and pulls chunks from a shared queue;
+    results stream back to this (coordinator) process as soon as a chunk is done.
+
+    Parameters:
+        data_path (str): The tokenized dataset, which every worker loads itself.
+        tasks (list): (mode, example indices) pairs, in the order they should be handed out.
+        model_id (str): The model every worker loads.
+        model_options (dict or None): Keyword arguments of `get_model`, such as the dtype.
+        devices (tuple): Devices assigned to the workers in turn, such as "cpu" or "cuda:0".
+        threads_per_worker (int or None): The torch thread count of each worker.
+        num_workers (int): The number of worker processes.
+        draft_model_id (str or None): The draft model for "draft-model" speculative decoding.
+        on_result (callable or None): Called with (mode, indices, results) for every finished chunk.
+        **inference_kwargs: Passed on to `run_inference_on_data`.
+
+    Returns:
+        tuple: The results by mode and example index, and per worker the device, load time, examples,
+               generated tokens, busy time, throughput and the worker's stage profile.
+    """
+    # CUDA and torch's thread pools do not survive a fork, so every worker starts a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    task_queue = context.Queue()
+    result_queue = context.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    for _ in range(num_workers):
+        task_queue.put(None)
+
+    processes = []
+    for worker_index in range(num_workers):
+        device = devices[worker_index % len(devices)]
+        process = context.Process(
+            target=_worker,
+            args=(worker_index, model_id, model_options or {}, device, threads_per_worker, data_path, draft_model_id,
+                  inference_kwargs, task_queue, result_queue),
+            daemon=True
+        )
+        process.start()
+        processes.append(process)
+
+    results = defaultdict(dict)
+    stats = {
+        worker_index: {"device": devices[worker_index % len(devices)], "load_seconds": 0.0, "examples": 0,
+                       "generated_tokens": 0, "busy_seconds": 0.0}
+        for worker_index in range(num_workers)
+    }
+    running = set(range(num_workers))
+    try:
+        while running:
+            try:
+                kind, worker_index, payload, *seconds = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                # A worker killed from outside (such as by the OOM killer) never reports back
+                for worker_index in list(running):
+                    if not processes[worker_index].is_alive() and result_queue.empty():
+                        raise RuntimeError(f"Worker {worker_index} exited with code {processes[worker_index].exitcode}")
+                continue
+
+            if kind == "error":
+                raise RuntimeError(f"Worker {worker_index} failed:\n{payload}")
+            if kind == "ready":
+                stats[worker_index]["load_seconds"] = payload
+            elif kind == "done":
+                stats[worker_index]["profile"] = payload
+                running.discard(worker_index)
+            else:
+                mode, indices, chunk_results = payload
+                for idx, result in zip(indices, chunk_results):
+                    results[mode][idx] = result
+                worker_stats = stats[worker_index]
+                worker_stats["examples"] += len(indices)
+                worker_stats["generated_tokens"] += sum(result["generated_tokens"] for result in chunk_results)
+                worker_stats["busy_seconds"] += seconds[0]
+                if on_result is not None:
+                    on_result(mode, indices, chunk_results)
+    finally:
+        for process in processes:
+            if process.is_alive() and running:
+                process.terminate()
+            process.join()
+
+    for worker_stats in stats.values():
+        busy = worker_stats["busy_seconds"]
+        worker_stats["examples_per_second"] = worker_stats["examples"] / busy if busy else 0.0
+        worker_stats["tokens_per_second"] = worker_stats["generated_tokens"] / busy if busy else 0.0
+    return dict(results), stats
+
+def default_threads_per_worker(num_workers):
+    """Splits the CPU cores evenly between the workers."""
+    return max((os.cpu_count() or 1) // num_workers, 1)
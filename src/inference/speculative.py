@@ -0,0 +1,187 @@
+import time
+import torch
+from src.constants import MAX_NEW_TOKENS, NUM_DRAFT_TOKENS, PROMPT_LOOKUP_MAX_NGRAM
+from src.profiling import forward_phase
+
+def truncate_cache(cache, length):
+    """Drops cached positions beyond `length` from a DynamicCache."""
+    remove = cache.get_seq_length() - length
+    if remove > 0:
+        # A negative value removes that many tokens from the end
+        cache.crop(-remove)
+
+class PromptLookupDrafter:
+    """
+    Drafts tokens by copying what followed an earlier occurrence of the most recent n-gram.
+
+    Code repeats identifiers and whole expressions, so the continuation of the current n-gram is looked up in
+    the context (prefix plus tokens generated so far, most recent match first) and then in the suffix,
+    which the model never sees in prefix-only mode but which often contains the names the middle uses.
+    """
+
+    def __init__(self, lookup_ids=(), num_draft_tokens=NUM_DRAFT_TOKENS, max_ngram=PROMPT_LOOKUP_MAX_NGRAM):
+        self.lookup_ids = [int(token) for token in lookup_ids]
+        self.num_draft_tokens = num_draft_tokens
+        self.max_ngram = max_ngram
+
+    @staticmethod
+    def _find(haystack, ngram, end, reverse):
+        # Returns the index right after the first (or last) occurrence of ngram starting before `end`
+        n = len(ngram)
+        starts = range(end - n, -1, -1) if reverse else range(0, end - n + 1)
+        for start in starts:
+            if haystack[start:start + n] == ngram:
+                return start + n
+        return None
+
+    def propose(self, tokens):
+        """
+        Parameters:
+            tokens (list): The prompt and the tokens generated so far.
+
+        Returns:
+            list: Up to `num_draft_tokens` draft tokens; empty when no n-gram matches.
+        """
+        for n in range(min(self.max_ngram, len(tokens)), 0, -1):
+            ngram = tokens[-n:]
+            # The match must end before the ngram itself, or it would only propose what just happened
+            match = self._find(tokens, ngram, len(tokens) - 1, reverse=True)
+            if match is not None:
+                return tokens[match:match + self.num_draft_tokens]
+            match = self._find(self.lookup_ids, ngram, len(self.lookup_ids), reverse=False)
+            if match is not None and match < len(self.lookup_ids):
+                return self.lookup_ids[match:match + self.num_draft_tokens]
+        return []
+
+    def rollback(self, length):
+        pass
+
+class DraftModelDrafter:
+    """
+    Drafts tokens by greedy decoding with a small model that shares the target model's tokenizer.
+
+    The draft model keeps its own KV cache, so each round only feeds the tokens accepted since the last one.
+    """
+
+    def __init__(self, draft_model, num_draft_tokens=NUM_DRAFT_TOKENS):
+        self.model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.cache = None
+
+    def propose(self, tokens):
+        device = self.model.device
+        cached = self.cache.get_seq_length() if self.cache is not None else 0
+        draft = []
+        feed = tokens[cached:]
+        with torch.no_grad():
+            for _ in range(self.num_draft_tokens):
+                outputs = self.model(
+                    input_ids=torch.tensor([feed], dtype=torch.long, device=device),
+                    past_key_values=self.cache,
+                    use_cache=True
+                )
+                self.cache = outputs.past_key_values
+                token = int(outputs.logits[0, -1].argmax())
+                draft.append(token)
+                feed = [token]
+        return draft
+
+    def rollback(self, length):
+        # Forget drafted positions the target model rejected
+        if self.cache is not None:
+            truncate_cache(self.cache, length)
+
+def speculative_generate(model, prompt_ids, drafter, max_new_tokens=MAX_NEW_TOKENS, eos_token_id=None, device=None,
+                         stopping_criteria=None):
+    """
+    Greedy decoding where a drafter proposes tokens and the model verifies all of them in one forward pass.
+
+    Each round feeds the last accepted token plus the draft. The model's greedy prediction is kept at every
+    position up to the first mismatch with the draft, plus its own token at that position, so the output is
+    exactly the model's greedy output, only produced in fewer forward passes.
+
+    Parameters:
+        model: The causal language model to generate with.
+        prompt_ids (list): The prompt token ids.
+        drafter (PromptLookupDrafter or DraftModelDrafter): The source of draft tokens.
+        max_new_tokens (int): The maximum number of tokens to generate.
+        eos_token_id (int or None): Generation stops after this token.
+        device (torch.device or None): The device to run on; defaults to the model's device.
+        stopping_criteria (StoppingCriteria or None): Checked after every accepted token, with the prompt and generated tokens.
+
+    Returns:
+        tuple: The generated token ids (without the prompt) and a dict with the number of draft tokens proposed
+               and accepted, the number of target forward passes, the acceptance rate and tokens per second.
+    """
+    device = device or model.device
+    start = time.perf_counter()
+    tokens = [int(token) for token in prompt_ids]
+    prompt_length = len(tokens)
+    stats = {"proposed": 0, "accepted": 0, "forward_passes": 0}
+
+    # Invariant: the cache covers every token except the last one, which is fed with the next draft
+    cache = None
+    if len(tokens) > 1:
+        with torch.no_grad():
+            cache = model(input_ids=torch.tensor([tokens[:-1]], device=device), use_cache=True).past_key_values
+        stats["forward_passes"] += 1
+
+    while len(tokens) - prompt_length < max_new_tokens:
+        remaining = max_new_tokens - (len(tokens) - prompt_length)
+        draft = drafter.propose(tokens)[:remaining - 1]
+        # One verify pass yields up to len(draft) + 1 new tokens, so it is a decode step however many it feeds
+        with torch.no_grad(), forward_phase("decode"):
+            outputs = model(
+                input_ids=torch.tensor([[tokens[-1]] + draft], device=device),
+                past_key_values=cache,
+                use_cache=True
+            )
+        stats["forward_passes"] += 1
+        cache = outputs.past_key_values
+        predictions = outputs.logits[0].argmax(dim=-1).tolist()
+
+        accepted = 0
+        while accepted < len(draft) and draft[accepted] == predictions[accepted]:
+            accepted += 1
+        new_tokens = draft[:accepted] + [predictions[accepted]]
+
+        # Keep the round's tokens up to the first one that ends generation, an end of sequence or a stop rule
+        # firing inside the accepted block, so the output is what one-token-at-a-time decoding returns
+        finished = False
+        if eos_token_id is not None and eos_token_id in new_tokens:
+            new_tokens = new_tokens[:new_tokens.index(eos_token_id) + 1]
+            finished = True
+        if stopping_criteria is not None:
+            for length in range(1, len(new_tokens) + 1):
+                if bool(stopping_criteria(torch.tensor([tokens + new_tokens[:length]]), None)[0]):
+                    new_tokens = new_tokens[:length]
+                    finished = True
+                    break
+        stats["proposed"] += len(draft)
+        stats["accepted"] += min(accepted, len(new_tokens))
+
+        # Roll back the positions of rejected draft tokens
+        cached_length = len(tokens) + accepted
+        truncate_cache(cache, cached_length)
+        drafter.rollback(cached_length)
+        tokens.extend(new_tokens)
+        if finished:
+            break
+
+    generated = tokens[prompt_length:]
+    elapsed = time.perf_counter() - start
+    stats["acceptance_rate"] = stats["accepted"] / stats["proposed"] if stats["proposed"] else 0.0
+    stats["tokens_per_second"] = len(generated) / elapsed if elapsed > 0 else 0.0
+    return generated, stats
+
+def summarize_speculative_stats(all_stats):
+    """Aggregates the per-example stats of `speculative_generate` into overall acceptance rate and throughput."""
+    proposed = sum(stats["proposed"] for stats in all_stats)
+    accepted = sum(stats["accepted"] for stats in all_stats)
+    return {
+        "proposed": proposed,
+        "accepted": accepted,
+        "forward_passes": sum(stats["forward_passes"] for stats in all_stats),
+        "acceptance_rate": accepted / proposed if proposed else 0.0,
+        "mean_tokens_per_second": sum(stats["tokens_per_second"] for stats in all_stats) / max(len(all_stats), 1)
+    }
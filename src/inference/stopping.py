@@ -0,0 +1,185 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+import torch
+from transformers import StoppingCriteria
+from src.constants import MAX_NEW_TOKENS, TOKEN_BUDGET_FACTOR, TOKEN_BUDGET_SLACK
+
+STOP_RULES = ("lines", "suffix", "block", "tokens")
+
+@dataclass
+class MiddleStopRule:
+    """
+    When to stop generating the middle of one example.
+
+    Attributes:
+        language (str): The programming language, for the block-end rule.
+        indent (int): The indentation of the line the cursor is on.
+        line_budget (int or None): The number of lines the middle may span.
+        suffix_line (str or None): The first non-empty line of the suffix, stripped.
+        token_budget (int or None): The maximum number of tokens to generate.
+        rules (tuple): The enabled rules, a subset of STOP_RULES.
+    """
+    language: str
+    indent: int = 0
+    line_budget: int = None
+    suffix_line: str = None
+    token_budget: int = None
+    rules: tuple = STOP_RULES
+
+def build_stop_rule(language, prefix_text, middle_text, suffix_text, middle_tokens, rules=STOP_RULES):
+    """
+    Derives the stop rule of an example from its prefix, reference middle and suffix.
+
+    Parameters:
+        language (str): The programming language of the example.
+        prefix_text (str): The decoded prefix.
+        middle_text (str): The decoded reference middle.
+        suffix_text (str): The decoded suffix.
+        middle_tokens (int): The length of the reference middle in tokens.
+        rules (tuple): The rules to enable.
+
+    Returns:
+        MiddleStopRule: The stop rule.
+    """
+    cursor_line = prefix_text.rsplit('\n', 1)[-1]
+    suffix_lines = [line.strip() for line in suffix_text.split('\n') if line.strip()]
+    return MiddleStopRule(
+        language=language,
+        indent=len(cursor_line) - len(cursor_line.lstrip()),
+        # The middle always ends with a newline, so its line count is its newline count
+        line_budget=max(middle_text.count('\n'), 1),
+        suffix_line=suffix_lines[0] if suffix_lines else None,
+        token_budget=math.ceil(middle_tokens * TOKEN_BUDGET_FACTOR) + TOKEN_BUDGET_SLACK,
+        rules=tuple(rules)
+    )
+
+def find_stop(text, rule):
+    """
+    Finds where a generated middle should end according to the line, suffix and block rules.
+
+    Only complete lines are considered, so a line that is still being generated never triggers a stop.
+
+    Parameters:
+        text (str): The generated text so far.
+        rule (MiddleStopRule): The stop rule of the example.
+
+    Returns:
+        int or None: The character offset to cut the text at, or None if generation should go on.
+    """
+    depth = 0
+    start = 0
+    line_number = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            return None
+        line = text[start:end]
+        stripped = line.strip()
+        line_number += 1
+
+        # The first line completes the cursor line, so only the following lines can run into the suffix or dedent
+        if line_number > 1 and stripped:
+            if "suffix" in rule.rules and rule.suffix_line and stripped == rule.suffix_line:
+                return start
+            if "block" in rule.rules and rule.language == "python":
+                if len(line) - len(line.lstrip()) < rule.indent:
+                    return start
+
+        if "block" in rule.rules and rule.language != "python":
+            # Closing more braces than the middle opened means the enclosing block ended on this line
+            for char in line:
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+            if line_number == 1:
+                # The cursor line may legitimately close a block that was opened in the prefix
+                depth = max(depth, 0)
+            elif depth < 0:
+                return end + 1
+
+        if "lines" in rule.rules and rule.line_budget and line_number >= rule.line_budget:
+            return end + 1
+        start = end + 1
+
+def trim_completion(text, rule):
+    """Cuts a generated middle where `find_stop` says it should have ended."""
+    cut = find_stop(text, rule)
+    return text if cut is None else text[:cut]
+
+def kept_token_count(tokenizer, tokens, rule=None):
+    """
+    Counts the generated tokens that make up the completion once it is trimmed.
+
+    A final end of sequence token is left out, and with a stop rule so are the tokens of the overshoot that
+    `trim_completion` cuts off.
+
+    Parameters:
+        tokenizer: The tokenizer to decode with.
+        tokens (list): The generated token ids.
+        rule (MiddleStopRule or None): The stop rule the completion is trimmed with.
+
+    Returns:
+        int: The number of leading tokens whose text is kept.
+    """
+    count = len(tokens)
+    if count and tokens[-1] == tokenizer.eos_token_id:
+        count -= 1
+    if rule is None:
+        return count
+    kept = len(trim_completion(tokenizer.decode(tokens[:count], skip_special_tokens=True), rule))
+    # Drop tokens from the end for as long as the text without them still covers the kept text
+    while count and len(tokenizer.decode(tokens[:count - 1], skip_special_tokens=True)) >= kept:
+        count -= 1
+    return count
+
+class MiddleSpanStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row of a (batched) generate call as soon as its middle is complete.
+
+    Rows are checked independently against their own `MiddleStopRule`; `generate` keeps padding rows that
+    are done while the others continue, and ends the call once every row is done. `stopped_at` records how
+    many tokens each row had generated when its rule stopped it, so that padding can be cut off.
+    """
+
+    def __init__(self, tokenizer, prompt_width, rules):
+        self.tokenizer = tokenizer
+        self.prompt_width = prompt_width
+        self.rules = rules
+        self.done = [False] * len(rules)
+        self.stopped_at = [None] * len(rules)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        new_tokens = input_ids[:, self.prompt_width:]
+        for row, rule in enumerate(self.rules):
+            if self.done[row]:
+                continue
+            if "tokens" in rule.rules and rule.token_budget is not None and new_tokens.shape[1] >= rule.token_budget:
+                self.done[row] = True
+            elif rule.rules != ("tokens",):
+                text = self.tokenizer.decode(new_tokens[row], skip_special_tokens=True)
+                self.done[row] = find_stop(text, rule) is not None
+            if self.done[row]:
+                self.stopped_at[row] = new_tokens.shape[1]
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+def decode_steps_report(languages, generated_tokens, max_new_tokens=MAX_NEW_TOKENS):
+    """
+    Summarises decode steps used and saved against running every example to `max_new_tokens`.
+
+    Parameters:
+        languages (list): The language of each example.
+        generated_tokens (list): The generated token ids of each example.
+        max_new_tokens (int): The generation limit without stopping criteria.
+
+    Returns:
+        dict: Per language, the number of examples, decode steps used and decode steps saved.
+    """
+    report = defaultdict(lambda: {"examples": 0, "decode_steps": 0, "decode_steps_saved": 0})
+    for language, tokens in zip(languages, generated_tokens):
+        for key in (language, "all"):
+            report[key]["examples"] += 1
+            report[key]["decode_steps"] += len(tokens)
+            report[key]["decode_steps_saved"] += max(max_new_tokens - len(tokens), 0)
+    return dict(report)
@@ -0,0 +1,99 @@
+import logging
+import importlib.util
+from functools import lru_cache
+from src.constants import MODEL_ID
+from src.inference.precision import PRECISIONS, LOAD_DTYPES, apply_precision
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ("auto", "float32", "bfloat16", "float16")
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_id=MODEL_ID):
+    """
+    Loads a tokenizer on first use, so importing modules that tokenize stays cheap.
+
+    Parameters:
+        model_id (str): The Hugging Face model id or local path of the tokenizer.
+
+    Returns:
+        PreTrainedTokenizerFast: The memoized tokenizer.
+    """
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_id)
+
+@lru_cache(maxsize=None)
+def get_model(model_id=MODEL_ID, device=None, dtype=None, low_cpu_mem_usage=True, use_safetensors=None, meta_init=False,
+              precision=None):
+    """
+    Loads a causal language model on first use and keeps it for later calls with the same options.
+
+    Parameters:
+        model_id (str): The Hugging Face model id or local path of the model.
+        device (str or None): The device to put the model on; defaults to CUDA when available.
+        dtype (str or None): One of DTYPES to load the weights in; None keeps the checkpoint loader's default.
+        low_cpu_mem_usage (bool): Load the weights one tensor at a time instead of building the model
+            in memory first and copying the checkpoint over it.
+        use_safetensors (bool or None): Require (True), refuse (False) or prefer (None) safetensors weights.
+            Safetensors files are memory-mapped, so weights are read from the page cache without an extra copy.
+        meta_init (bool): Build the model on the meta device and materialize each weight directly on `device`,
+            which needs the accelerate package; without it the model is loaded on the CPU first.
+        precision (str or None): One of PRECISIONS in src/inference/precision.py to convert the model to after
+            loading; unless `dtype` is given, the weights are loaded in the dtype that precision starts from.
+
+    Returns:
+        PreTrainedModel: The memoized model, in eval mode.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+    from src.utils import get_device
+
+    device = torch.device(device) if device else get_device()
+    if precision and not dtype:
+        dtype = LOAD_DTYPES[precision]
+    kwargs = {"low_cpu_mem_usage": low_cpu_mem_usage}
+    if dtype:
+        kwargs["dtype"] = dtype if dtype == "auto" else getattr(torch, dtype)
+    if use_safetensors is not None:
+        kwargs["use_safetensors"] = use_safetensors
+
+    place_on_device = True
+    if meta_init:
+        if importlib.util.find_spec("accelerate") is not None:
+            kwargs["device_map"] = {"": str(device)}
+            place_on_device = False
+        else:
+            logger.warning("accelerate is not installed, loading the model on the CPU before moving it to the device")
+
+    model = AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
+    if place_on_device:
+        model.to(device)
+    model.eval()
+    if precision:
+        model = apply_precision(model, precision)
+    return model
+
+def add_model_args(parser):
+    """Adds the model loading options to an argument parser."""
+    parser.add_argument("--model", default=MODEL_ID, help="Hugging Face model id or local path of the model.")
+    parser.add_argument("--dtype", choices=DTYPES, default=None,
+                        help="Load the weights in this dtype; bfloat16 halves memory compared to float32.")
+    parser.add_argument("--no-low-cpu-mem-usage", action="store_true",
+                        help="Build the full model in memory before loading the checkpoint into it.")
+    parser.add_argument("--safetensors", choices=["require", "refuse"], default=None,
+                        help="Require or refuse memory-mapped safetensors weights; by default they are used when present.")
+    parser.add_argument("--precision", choices=PRECISIONS, default=None,
+                        help="Run generation and embedding in bf16, with int8 dynamically quantized linear layers (CPU), "
+                             "or with int4 weight-only quantization (needs torchao).")
+    parser.add_argument("--meta-init", action="store_true",
+                        help="Initialize the model on the meta device and load each weight straight onto the target device (needs accelerate).")
+
+def model_kwargs(args):
+    """Returns the `get_model` keyword arguments selected by the options of `add_model_args`."""
+    return {
+        "dtype": args.dtype,
+        "low_cpu_mem_usage": not args.no_low_cpu_mem_usage,
+        "use_safetensors": {"require": True, "refuse": False}.get(args.safetensors),
+        "meta_init": args.meta_init,
+        "precision": args.precision
+    }
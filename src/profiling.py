@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+import resource
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+# The phase of the forward passes being run, when the caller knows better than the input shape
+_forward_phase = ContextVar("forward_phase", default=None)
+
+@contextmanager
+def forward_phase(phase):
+    """
+    Marks the forward passes run in the block as "prefill" or "decode" for `Profiler.track_forward`.
+
+    Passes that feed several tokens are prefill passes unless marked otherwise; speculative decoding marks
+    its verify passes, which feed a draft of several tokens after the prompt, as decode.
+    """
+    token = _forward_phase.set(phase)
+    try:
+        yield
+    finally:
+        _forward_phase.reset(token)
+
+def setup_logging(level="INFO"):
+    """Configures the root logger of a run script; per-example output is logged at DEBUG."""
+    logging.basicConfig(level=getattr(logging, level), format="%(message)s")
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets the kernel's peak RSS (VmHWM) of this process; Linux only
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mib():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Without /proc the peak covers the whole process lifetime
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _cuda_available():
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+class Profiler:
+    """
+    Collects per-stage wall time, token throughput and peak memory of an evaluation run.
+
+    Stages are timed with `stage`, and may be entered several times (once per chunk), in which case they
+    accumulate. `track_forward` splits a model's forward passes into prefill passes, which feed several new
+    tokens per row, and decode passes, which feed one or are marked with `forward_phase`. `summary` returns
+    everything as a JSON-ready dict.
+    """
+
+    def __init__(self, trace_dir=None):
+        self.start = time.perf_counter()
+        self.stages = defaultdict(lambda: {"seconds": 0.0, "calls": 0, "tokens": 0, "peak_rss_mib": 0.0, "peak_cuda_mib": None})
+        self.forward = {"prefill": {"passes": 0, "tokens": 0, "seconds": 0.0}, "decode": {"passes": 0, "tokens": 0, "seconds": 0.0}}
+        self.metric_seconds = defaultdict(float)
+        self.examples = 0
+        self.trace_dir = trace_dir
+        self.traces = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block of work and records its peak memory; the block may add to the yielded stats' "tokens"."""
+        cuda = _cuda_available()
+        if cuda:
+            import torch
+            torch.cuda.reset_peak_memory_stats()
+        _reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield self.stages[name]
+        finally:
+            stats = self.stages[name]
+            stats["seconds"] += time.perf_counter() - start
+            stats["calls"] += 1
+            stats["peak_rss_mib"] = max(stats["peak_rss_mib"], _peak_rss_mib())
+            if cuda:
+                import torch
+                stats["peak_cuda_mib"] = max(stats["peak_cuda_mib"] or 0.0, torch.cuda.max_memory_allocated() / 1024 ** 2)
+
+    @contextmanager
+    def track_forward(self, model):
+        """Times every forward pass of `model` while the block runs, split into prefill and decode passes."""
+        pending = []
+
+        def before(module, args, kwargs):
+            input_ids = kwargs.get("input_ids", args[0] if args else None)
+            pending.append((time.perf_counter(), tuple(input_ids.shape) if input_ids is not None else (0, 0),
+                            _forward_phase.get()))
+
+        def after(module, args, kwargs, output):
+            started, (rows, width), phase = pending.pop()
+            kind = self.forward[phase or ("prefill" if width > 1 else "decode")]
+            kind["passes"] += 1
+            kind["tokens"] += rows * width
+            kind["seconds"] += time.perf_counter() - started
+
+        handles = [model.register_forward_pre_hook(before, with_kwargs=True),
+                   model.register_forward_hook(after, with_kwargs=True)]
+        try:
+            yield
+        finally:
+            for handle in handles:
+                handle.remove()
+
+    @contextmanager
+    def trace(self, name):
+        """Records a torch profiler trace of the block to `trace_dir`, as a Chrome trace file."""
+        from torch.profiler import profile, ProfilerActivity
+
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if _cuda_available() else [])
+        with profile(activities=activities, record_shapes=True) as prof:
+            yield
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f"trace-{name}.json")
+        prof.export_chrome_trace(path)
+        self.traces.append(path)
+        logger.info("Profiler trace saved to %s", path)
+
+    def add_metric_seconds(self, timings):
+        for name, seconds in timings.items():
+            self.metric_seconds[name] += seconds
+
+    def summary(self):
+        """Returns the collected measurements, with tokens per second per stage and per forward pass kind."""
+        stages = {}
+        for name, stats in self.stages.items():
+            stages[name] = dict(stats, tokens_per_second=stats["tokens"] / stats["seconds"] if stats["tokens"] and stats["seconds"] else None)
+        forward = {
+            kind: dict(stats, tokens_per_second=stats["tokens"] / stats["seconds"] if stats["seconds"] else None)
+            for kind, stats in self.forward.items()
+        }
+        return {
+            "examples": self.examples,
+            "total_seconds": time.perf_counter() - self.start,
+            "stages": stages,
+            "forward": forward,
+            "metric_seconds": dict(self.metric_seconds),
+            "traces": self.traces
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=4)
+        logger.info("Profile summary saved to %s", path)
+
+def parse_window(text):
+    """Parses a "start:end" example window, as given to --profile-window."""
+    start, end = text.split(":")
+    return int(start), int(end)
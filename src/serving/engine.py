@@ -0,0 +1,253 @@
+import time
+import logging
+import threading
+from collections import deque
+import torch
+from transformers import DynamicCache
+from src.constants import MAX_TOKENS, MAX_NEW_TOKENS, SERVING_MAX_BATCH_SIZE
+from src.inference.batching import left_pad
+from src.inference.fim import fim_token_ids, build_fim_input
+from src.inference.stopping import find_stop
+from src.serving.stats import ServingStats
+
+logger = logging.getLogger(__name__)
+
+def build_prompt(tokenizer, prefix_ids, suffix_ids=None, mode="prefix", max_tokens=MAX_TOKENS):
+    """
+    Builds the prompt of a completion request, in the same layout as the batch evaluation.
+
+    Prefix mode keeps the last `max_tokens` prefix tokens, the ones next to the cursor. FIM mode builds a
+    <fim_prefix>prefix<fim_suffix>suffix<fim_middle> prompt trimmed around the cursor.
+    """
+    if mode == "fim":
+        return build_fim_input(prefix_ids, suffix_ids or [], fim_token_ids(tokenizer), max_tokens)
+    return [int(token) for token in prefix_ids][-max_tokens:]
+
+class CompletionRequest:
+    """
+    One completion being served.
+
+    Generated tokens are reported through `on_event`, called from the engine thread with a dict per event:
+    {"token", "text"} for every token, where "text" is the text released by that token, then a final
+    {"done": True, ...} with the completion, the finish reason and the request's timings. The texts of the
+    token events add up to the completion: text that a stop rule may still cut off is held back (and a token
+    ending inside a multi-byte character releases nothing) until it is certain to be part of the completion.
+    """
+
+    def __init__(self, prompt_ids, max_new_tokens=MAX_NEW_TOKENS, stop_rule=None, on_event=None):
+        self.prompt_ids = [int(token) for token in prompt_ids]
+        self.max_new_tokens = max_new_tokens
+        self.stop_rule = stop_rule
+        self.on_event = on_event
+        self.generated = []
+        self.text = ""
+        self.finish_reason = None
+        self.submitted = time.perf_counter()
+        self.admitted = None
+        self.first_token = None
+        self.finished = None
+
+    def emit(self, event):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def result(self):
+        return {
+            "done": True,
+            "completion": self.text,
+            "finish_reason": self.finish_reason,
+            "prompt_tokens": len(self.prompt_ids),
+            "generated_tokens": len(self.generated),
+            "queue_wait": self.admitted - self.submitted if self.admitted else None,
+            "time_to_first_token": self.first_token - self.submitted if self.first_token else None,
+            "latency": self.finished - self.submitted if self.finished else None
+        }
+
+def _cache_layers(cache):
+    return [(layer.keys, layer.values) for layer in cache.layers]
+
+def _build_cache(layers):
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+def _left_pad_to(tensor, length, dim):
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+class ContinuousBatcher:
+    """
+    Greedy decoding of many completion requests in one running batch, which new requests join between steps.
+
+    The batch keeps one KV cache whose rows are left-padded to a common length, with an attention mask marking
+    each row's real tokens, and the position of every token derived from that mask. Every `step`:
+
+    1. Waiting requests are admitted while the batch has room: their prompts are prefilled together, as one
+       left-padded batch, and their caches are merged into the running cache, padding the shorter side.
+    2. One token is decoded for every running request in a single forward pass.
+    3. Finished requests (end of sequence, token limit or stop rule) leave the batch, and the cache columns
+       that only held padding are dropped.
+
+    The model is only ever called from the thread running `run`; `submit` may be called from any thread.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=SERVING_MAX_BATCH_SIZE, device=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.device = device or model.device
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.stats = ServingStats()
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.running = []
+        # The cache covers every token of the running requests but the last generated one, which the next step feeds
+        self.cache = None
+        self.attention_mask = None
+        self.next_tokens = None
+
+    def submit(self, request):
+        with self.condition:
+            self.waiting.append(request)
+            self.condition.notify()
+
+    def queue_depth(self):
+        return len(self.waiting)
+
+    def summary(self):
+        return self.stats.summary(queue_depth=len(self.waiting), running=len(self.running))
+
+    def _forward(self, input_ids, attention_mask, cache):
+        position_ids = (attention_mask.cumsum(dim=1) - 1).clamp(min=0)[:, -input_ids.shape[1]:]
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=cache, use_cache=True, logits_to_keep=1)
+        return outputs.logits[:, -1].argmax(dim=-1), outputs.past_key_values
+
+    def _admit(self):
+        with self.condition:
+            room = self.max_batch_size - len(self.running)
+            admitted = [self.waiting.popleft() for _ in range(min(room, len(self.waiting)))]
+        if not admitted:
+            return
+        now = time.perf_counter()
+        for request in admitted:
+            request.admitted = now
+
+        input_ids, attention_mask = left_pad([request.prompt_ids for request in admitted], self.pad_token_id)
+        input_ids, attention_mask = input_ids.to(self.device), attention_mask.to(self.device)
+        next_tokens, cache = self._forward(input_ids, attention_mask, DynamicCache())
+
+        if self.running:
+            # Merge with the running batch, left-padding the shorter cache and mask
+            length = max(self.attention_mask.shape[1], attention_mask.shape[1])
+            cache = _build_cache([
+                (torch.cat([_left_pad_to(old_keys, length, -2), _left_pad_to(new_keys, length, -2)]),
+                 torch.cat([_left_pad_to(old_values, length, -2), _left_pad_to(new_values, length, -2)]))
+                for (old_keys, old_values), (new_keys, new_values) in zip(_cache_layers(self.cache), _cache_layers(cache))
+            ])
+            attention_mask = torch.cat([_left_pad_to(self.attention_mask, length, 1), _left_pad_to(attention_mask, length, 1)])
+            next_tokens = torch.cat([self.next_tokens, next_tokens])
+        self.running.extend(admitted)
+        self.cache, self.attention_mask, self.next_tokens = cache, attention_mask, next_tokens
+        # The prefill produced the first token of every admitted request
+        self._accept(range(len(self.running) - len(admitted), len(self.running)))
+
+    def _decode(self):
+        attention_mask = torch.cat([self.attention_mask, self.attention_mask.new_ones((len(self.running), 1))], dim=1)
+        next_tokens, cache = self._forward(self.next_tokens.unsqueeze(1), attention_mask, self.cache)
+        self.cache, self.attention_mask, self.next_tokens = cache, attention_mask, next_tokens
+        self.stats.record_step(len(self.running))
+        self._accept(range(len(self.running)))
+
+    def _accept(self, rows):
+        """Streams the newly generated token of the given rows, and retires the requests that finished."""
+        tokens = self.next_tokens.tolist()
+        now = time.perf_counter()
+        for row in rows:
+            request, token = self.running[row], tokens[row]
+            if request.first_token is None:
+                request.first_token = now
+            if token == self.eos_token_id:
+                request.finish_reason = "stop"
+            else:
+                request.generated.append(token)
+            text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+            if request.stop_rule is not None:
+                cut = find_stop(text, request.stop_rule)
+                if cut is not None:
+                    text = text[:cut]
+                    request.finish_reason = "stop_rule"
+            if request.finish_reason is None and len(request.generated) >= request.max_new_tokens:
+                request.finish_reason = "length"
+
+            if request.finish_reason is None:
+                if request.stop_rule is not None and {"suffix", "block"} & set(request.stop_rule.rules):
+                    # These rules cut off the line that runs into the suffix or out of the block once it is complete,
+                    # so the line being generated is held back until its newline lets the rule decide
+                    text = text[:text.rfind("\n") + 1]
+                elif text.endswith("\ufffd"):
+                    # Tokens that end inside a multi-byte character decode to a replacement character until it is complete
+                    text = request.text
+            # The end of sequence token only gets an event if it releases held text
+            if token != self.eos_token_id or len(text) > len(request.text):
+                request.emit({"token": token, "text": text[len(request.text):]})
+                request.text = text
+        self._retire()
+
+    def _retire(self):
+        finished = [request for request in self.running if request.finish_reason]
+        if not finished:
+            return
+        now = time.perf_counter()
+        for request in finished:
+            request.finished = now
+            self.stats.record_request(request)
+            request.emit(request.result())
+        keep = [row for row, request in enumerate(self.running) if not request.finish_reason]
+        self.running = [self.running[row] for row in keep]
+        if not keep:
+            self.cache = self.attention_mask = self.next_tokens = None
+            return
+        index = torch.tensor(keep, device=self.attention_mask.device)
+        attention_mask = self.attention_mask.index_select(0, index)
+        # Columns that are padding in every remaining row are dropped
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        self.attention_mask = attention_mask[:, start:]
+        self.cache = _build_cache([
+            (keys.index_select(0, index)[..., start:, :], values.index_select(0, index)[..., start:, :])
+            for keys, values in _cache_layers(self.cache)
+        ])
+        self.next_tokens = self.next_tokens.index_select(0, index)
+
+    def step(self):
+        """Admits waiting requests, then decodes one token for the running batch."""
+        try:
+            if self.waiting and len(self.running) < self.max_batch_size:
+                self._admit()
+            if self.running:
+                self._decode()
+        except Exception as error:
+            logger.exception("Decode step failed; failing the running requests")
+            for request in self.running:
+                request.finish_reason = "error"
+                request.finished = time.perf_counter()
+                self.stats.record_request(request)
+                request.emit(dict(request.result(), error=str(error)))
+            self.running = []
+            self.cache = self.attention_mask = self.next_tokens = None
+
+    def run(self, stop_event):
+        """Steps until `stop_event` is set, sleeping while there is nothing to do."""
+        while not stop_event.is_set():
+            with self.condition:
+                if not self.waiting and not self.running:
+                    self.condition.wait(timeout=0.1)
+                    continue
+            self.step()
@@ -0,0 +1,159 @@
+import json
+import time
+import random
+import asyncio
+from contextlib import aclosing
+from src.constants import SERVING_HOST, SERVING_PORT
+from src.serving.stats import percentiles
+
+async def http_request(host, port, method, path, payload=None):
+    """
+    Sends one HTTP request to the completion server.
+
+    Yields:
+        dict: The decoded JSON body, or every JSON line of a chunked streaming response as it arrives.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if status != 200:
+            raise RuntimeError(f"{method} {path} failed with {status}: {(await reader.read()).decode('utf-8', 'replace')}")
+
+        if headers.get("transfer-encoding") != "chunked":
+            yield json.loads(await reader.readexactly(int(headers["content-length"])))
+            return
+        buffer = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            buffer += await reader.readexactly(size)
+            await reader.readexactly(2)
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                yield json.loads(line)
+    finally:
+        writer.close()
+
+async def get_json(host, port, path):
+    async with aclosing(http_request(host, port, "GET", path)) as responses:
+        async for payload in responses:
+            return payload
+
+async def stream_completion(host, port, payload):
+    """
+    Streams one completion and times it from the client side.
+
+    Returns:
+        dict: The server's final event, with the client-side "client_time_to_first_token" and "client_latency".
+    """
+    start = time.perf_counter()
+    first_token = None
+    async with aclosing(http_request(host, port, "POST", "/complete", dict(payload, stream=True))) as events:
+        async for event in events:
+            if event.get("done"):
+                event["client_time_to_first_token"] = (first_token or time.perf_counter()) - start
+                event["client_latency"] = time.perf_counter() - start
+                return event
+            if first_token is None:
+                first_token = time.perf_counter()
+    raise RuntimeError("The stream ended without a final event")
+
+def replay_payloads(tokenized_data, mode="prefix", max_new_tokens=None, stop_on=None, max_lines=None):
+    """Builds a completion request per tokenized example, sending its stored token ids."""
+    payloads = []
+    for entry in tokenized_data:
+        payload = {
+            "prefix_ids": [int(token) for token in entry["prefix"][0]],
+            "suffix_ids": [int(token) for token in entry["suffix"][0]],
+            "language": entry["language"],
+            "mode": mode
+        }
+        if max_new_tokens:
+            payload["max_new_tokens"] = max_new_tokens
+        if stop_on:
+            payload["stop_on"] = list(stop_on)
+        if max_lines:
+            payload["max_lines"] = max_lines
+        payloads.append(payload)
+    return payloads
+
+async def replay(payloads, host=SERVING_HOST, port=SERVING_PORT, concurrency=8, rate=None, seed=0):
+    """
+    Replays completion requests against the server.
+
+    With `rate`, requests arrive as a Poisson process of that many requests per second (an open loop, so the
+    queue grows when the server falls behind); otherwise `concurrency` clients send requests back to back.
+    In both cases at most `concurrency` requests are in flight.
+
+    Parameters:
+        payloads (list): The request bodies, sent in order.
+        host (str): The server host.
+        port (int): The server port.
+        concurrency (int): The maximum number of requests in flight.
+        rate (float or None): The mean arrival rate in requests per second.
+        seed (int): The seed of the arrival times.
+
+    Returns:
+        tuple: The final event of every request, in order, and a summary of the client-side measurements
+               with the server's /stats at the end of the run.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+    results = [None] * len(payloads)
+    max_queue_depth = 0
+
+    async def send(index):
+        async with semaphore:
+            try:
+                results[index] = await stream_completion(host, port, payloads[index])
+            except (OSError, RuntimeError) as error:
+                results[index] = {"done": True, "error": str(error)}
+
+    async def watch_queue():
+        nonlocal max_queue_depth
+        while True:
+            try:
+                stats = await get_json(host, port, "/stats")
+            except OSError:
+                return
+            max_queue_depth = max(max_queue_depth, stats["queue_depth"])
+            await asyncio.sleep(0.2)
+
+    start = time.perf_counter()
+    watcher = asyncio.create_task(watch_queue())
+    tasks = []
+    for index in range(len(payloads)):
+        if rate:
+            await asyncio.sleep(rng.expovariate(rate))
+        tasks.append(asyncio.create_task(send(index)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    watcher.cancel()
+
+    succeeded = [result for result in results if "error" not in result]
+    generated_tokens = sum(result["generated_tokens"] for result in succeeded)
+    summary = {
+        "requests": len(results),
+        "failed": len(results) - len(succeeded),
+        "seconds": elapsed,
+        "requests_per_second": len(succeeded) / elapsed if elapsed else None,
+        "tokens_per_second": generated_tokens / elapsed if elapsed else None,
+        "max_queue_depth": max_queue_depth,
+        "client_time_to_first_token": percentiles([result["client_time_to_first_token"] for result in succeeded]),
+        "client_latency": percentiles([result["client_latency"] for result in succeeded]),
+        "server": await get_json(host, port, "/stats")
+    }
+    return results, summary
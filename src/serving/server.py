@@ -0,0 +1,180 @@
+import json
+import asyncio
+import logging
+import threading
+from src.constants import MAX_NEW_TOKENS, SERVING_HOST, SERVING_PORT
+from src.inference.fim import INFERENCE_MODES
+from src.inference.stopping import STOP_RULES, MiddleStopRule
+from src.serving.engine import CompletionRequest, build_prompt
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+def _positive_int(payload, name, default=None):
+    # JSON booleans are ints in Python, so they are ruled out explicitly
+    value = payload.get(name, default)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+async def read_request(reader):
+    """
+    Reads one HTTP/1.1 request.
+
+    Returns:
+        tuple: The method, the path, the headers (lowercase names) and the body bytes; None if the client closed.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path.split("?", 1)[0], headers, body
+
+async def write_json(writer, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+class CompletionServer:
+    """
+    An HTTP front end of a `ContinuousBatcher`, with one asyncio task per connection.
+
+    Endpoints:
+        POST /complete: A JSON request with "prefix" and "suffix" texts, or "prefix_ids" and "suffix_ids" token ids,
+            and optionally "mode" ("prefix" or "fim"), "max_new_tokens", "language", "stop_on" (a subset of
+            STOP_RULES without "tokens") and "max_lines", which the "lines" rule requires. With "stream" (the
+            default) the response is chunked JSON lines: {"token", "text"} per generated token, then
+            {"done": true, "completion", ...}. Without it, only the final object is returned.
+        GET /stats: Queue depth, running batch size, throughput and latency percentiles.
+        GET /health: {"status": "ok"}.
+
+    The batcher runs in a thread of its own, since a forward pass would block the event loop; its events are
+    handed to the loop with `call_soon_threadsafe`.
+    """
+
+    def __init__(self, batcher, host=SERVING_HOST, port=SERVING_PORT, mode="prefix", max_new_tokens=MAX_NEW_TOKENS):
+        self.batcher = batcher
+        self.tokenizer = batcher.tokenizer
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.max_new_tokens = max_new_tokens
+        self.stop_event = threading.Event()
+
+    def parse_completion(self, payload):
+        """Builds a `CompletionRequest` from a request body; raises ValueError on invalid input."""
+        mode = payload.get("mode", self.mode)
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"mode must be one of {INFERENCE_MODES}")
+        if "prefix_ids" in payload:
+            prefix_ids, suffix_ids = payload["prefix_ids"], payload.get("suffix_ids", [])
+        elif "prefix" in payload:
+            prefix_ids = self.tokenizer.encode(payload["prefix"])
+            suffix_ids = self.tokenizer.encode(payload.get("suffix", ""))
+        else:
+            raise ValueError("the request needs a prefix or prefix_ids")
+
+        max_new_tokens = _positive_int(payload, "max_new_tokens", self.max_new_tokens)
+        max_lines = _positive_int(payload, "max_lines")
+        stop_rule = None
+        stop_on = tuple(payload.get("stop_on") or ())
+        if stop_on:
+            if not set(stop_on) <= set(STOP_RULES) - {"tokens"}:
+                raise ValueError(f"stop_on must be a subset of {tuple(rule for rule in STOP_RULES if rule != 'tokens')}")
+            if "lines" in stop_on and max_lines is None:
+                raise ValueError("stop_on 'lines' needs max_lines")
+            prefix_text = payload.get("prefix", None)
+            if prefix_text is None:
+                prefix_text = self.tokenizer.decode(prefix_ids, skip_special_tokens=True)
+            suffix_text = payload.get("suffix", None)
+            if suffix_text is None:
+                suffix_text = self.tokenizer.decode(suffix_ids, skip_special_tokens=True)
+            cursor_line = prefix_text.rsplit("\n", 1)[-1]
+            suffix_lines = [line.strip() for line in suffix_text.split("\n") if line.strip()]
+            stop_rule = MiddleStopRule(
+                language=payload.get("language", "python"),
+                indent=len(cursor_line) - len(cursor_line.lstrip()),
+                line_budget=max_lines,
+                suffix_line=suffix_lines[0] if suffix_lines else None,
+                rules=stop_on
+            )
+        prompt_ids = build_prompt(self.tokenizer, prefix_ids, suffix_ids, mode)
+        if not prompt_ids:
+            raise ValueError("the prompt is empty")
+        return CompletionRequest(prompt_ids, max_new_tokens, stop_rule)
+
+    async def complete(self, writer, payload):
+        loop = asyncio.get_running_loop()
+        request = self.parse_completion(payload)
+        events = asyncio.Queue()
+        request.on_event = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+        self.batcher.submit(request)
+
+        if not payload.get("stream", True):
+            while True:
+                event = await events.get()
+                if event.get("done"):
+                    await write_json(writer, 500 if "error" in event else 200, event)
+                    return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        while True:
+            event = await events.get()
+            line = (json.dumps(event) + "\n").encode("utf-8")
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+            if event.get("done"):
+                break
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, _, body = request
+            if path == "/complete":
+                if method != "POST":
+                    await write_json(writer, 405, {"error": "use POST"})
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                    await self.complete(writer, payload)
+                except (ValueError, TypeError) as error:
+                    await write_json(writer, 400, {"error": str(error)})
+            elif path == "/stats":
+                await write_json(writer, 200, self.batcher.summary())
+            elif path == "/health":
+                await write_json(writer, 200, {"status": "ok"})
+            else:
+                await write_json(writer, 404, {"error": f"no route {path}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client went away; its request still finishes in the batch
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Serves until cancelled, with the batcher stepping in a background thread."""
+        engine = threading.Thread(target=self.batcher.run, args=(self.stop_event,), name="continuous-batcher", daemon=True)
+        engine.start()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info("Serving completions on http://%s:%d", self.host, self.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop_event.set()
+            engine.join()
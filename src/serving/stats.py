@@ -0,0 +1,69 @@
+import time
+import threading
+from collections import deque
+import numpy as np
+from src.constants import SERVING_STATS_WINDOW
+
+PERCENTILES = (50, 90, 99)
+
+def percentiles(values, points=PERCENTILES):
+    """Returns the mean and the given percentiles of a list of values, or None for an empty list."""
+    if not len(values):
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    summary = {"mean": float(values.mean())}
+    summary.update({f"p{point}": float(value) for point, value in zip(points, np.percentile(values, points))})
+    return summary
+
+class ServingStats:
+    """
+    Latency and throughput of the completion server.
+
+    Each finished request records its queue wait (submission to admission into the decode batch), its time to
+    first token, its total latency and its mean time per generated token. Only the last `window` requests are
+    kept for the percentiles, so a long-running server reflects its current load.
+    """
+
+    def __init__(self, window=SERVING_STATS_WINDOW):
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.latencies = {name: deque(maxlen=window) for name in ("queue_wait", "time_to_first_token", "latency", "time_per_token")}
+        self.completed = 0
+        self.failed = 0
+        self.generated_tokens = 0
+        self.decode_steps = 0
+        self.batch_size_sum = 0
+
+    def record_step(self, batch_size):
+        with self.lock:
+            self.decode_steps += 1
+            self.batch_size_sum += batch_size
+
+    def record_request(self, request):
+        with self.lock:
+            if request.finish_reason == "error":
+                self.failed += 1
+                return
+            self.completed += 1
+            self.generated_tokens += len(request.generated)
+            self.latencies["queue_wait"].append(request.admitted - request.submitted)
+            self.latencies["time_to_first_token"].append(request.first_token - request.submitted)
+            self.latencies["latency"].append(request.finished - request.submitted)
+            if len(request.generated) > 1:
+                self.latencies["time_per_token"].append((request.finished - request.first_token) / (len(request.generated) - 1))
+
+    def summary(self, queue_depth=0, running=0):
+        """Returns the counters, the current queue depth and batch size, and the latency percentiles in seconds."""
+        with self.lock:
+            elapsed = time.perf_counter() - self.start
+            return {
+                "uptime_seconds": elapsed,
+                "queue_depth": queue_depth,
+                "running": running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "generated_tokens": self.generated_tokens,
+                "tokens_per_second": self.generated_tokens / elapsed if elapsed else None,
+                "mean_batch_size": self.batch_size_sum / self.decode_steps if self.decode_steps else None,
+                **{name: percentiles(list(values)) for name, values in self.latencies.items()}
+            }
@@ -0,0 +1,66 @@
+import pytest
+from src.constants import RAW_DATA_DIR, SPLIT_SEED
+from src.data.split_code import iter_code_files, split_file, file_seed
+from src.data.tokenize_dataset import tokenize_examples
+from src.models import get_model, get_tokenizer
+from src.inference.pipeline import generate_single
+from benchmarks.suite import train_tokenizer, build_tiny_model
+
+# Tests generate a few tokens only; the tiny model's position table still covers MAX_TOKENS plus this
+TEST_MAX_NEW_TOKENS = 24
+# Generation tests run on the examples of the first files, three of them
+NUM_PROMPTS = 12
+
+@pytest.fixture(scope="session")
+def examples():
+    """Four split examples per file of data/raw, drawn with the streaming splitter's seeds."""
+    examples = []
+    for file_path, language in iter_code_files(RAW_DATA_DIR):
+        examples.extend(split_file(file_path, language, 4, file_seed(SPLIT_SEED, file_path)))
+    return examples
+
+@pytest.fixture(scope="session")
+def tokenizer_dir(tmp_path_factory):
+    """A small BPE tokenizer trained on data/raw, with StarCoder's special tokens."""
+    out_dir = str(tmp_path_factory.mktemp("tokenizer"))
+    train_tokenizer(RAW_DATA_DIR, out_dir, vocab_size=600)
+    return out_dir
+
+@pytest.fixture(scope="session")
+def tokenizer(tokenizer_dir):
+    return get_tokenizer(tokenizer_dir)
+
+def _tiny_model_dir(tmp_path_factory, tokenizer, seed):
+    out_dir = str(tmp_path_factory.mktemp(f"model-{seed}"))
+    build_tiny_model(tokenizer, out_dir, TEST_MAX_NEW_TOKENS, seed)
+    return out_dir
+
+@pytest.fixture(scope="session")
+def model_dir(tmp_path_factory, tokenizer):
+    """A randomly initialized two-layer GPTBigCode model, saved with the tokenizer for worker processes to load."""
+    out_dir = _tiny_model_dir(tmp_path_factory, tokenizer, seed=0)
+    tokenizer.save_pretrained(out_dir)
+    return out_dir
+
+@pytest.fixture(scope="session")
+def model(model_dir):
+    return get_model(model_dir, device="cpu")
+
+@pytest.fixture(scope="session")
+def draft_model(tmp_path_factory, tokenizer):
+    """Another random GPTBigCode model, which mostly disagrees with `model`."""
+    return get_model(_tiny_model_dir(tmp_path_factory, tokenizer, seed=1), device="cpu")
+
+@pytest.fixture(scope="session")
+def tokenized_data(examples, tokenizer_dir):
+    return tokenize_examples(examples, model_id=tokenizer_dir)
+
+@pytest.fixture(scope="session")
+def prompts(tokenized_data):
+    """Whole prefixes of the first files' examples, so examples of the same file share leading tokens."""
+    return [[int(token) for token in entry["prefix"][0]] for entry in tokenized_data[:NUM_PROMPTS]]
+
+@pytest.fixture(scope="session")
+def single_outputs(model, tokenizer, prompts):
+    """The reference greedy outputs, generated one prompt at a time."""
+    return [generate_single(model, tokenizer, prompt, max_new_tokens=TEST_MAX_NEW_TOKENS) for prompt in prompts]
@@ -0,0 +1,22 @@
+import pytest
+from src.inference.batching import bucket_by_length, left_pad, generate_batched
+from tests.conftest import TEST_MAX_NEW_TOKENS, NUM_PROMPTS
+
+def test_bucket_by_length_covers_every_sequence_once():
+    sequences = [[0] * length for length in (5, 1, 9, 3, 9, 2, 7)]
+    batches = bucket_by_length(sequences, batch_size=3, max_batch_tokens=20)
+    assert sorted(index for batch in batches for index in batch) == list(range(len(sequences)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or len(batch) * max(len(sequences[index]) for index in batch) <= 20
+
+def test_left_pad():
+    input_ids, attention_mask = left_pad([[1, 2, 3], [4]], pad_token_id=0)
+    assert input_ids.tolist() == [[1, 2, 3], [0, 0, 4]]
+    assert attention_mask.tolist() == [[1, 1, 1], [0, 0, 1]]
+
+@pytest.mark.parametrize("batch_size, max_batch_tokens", [(4, None), (NUM_PROMPTS, None), (8, 2000)])
+def test_generate_batched_matches_single(model, tokenizer, prompts, single_outputs, batch_size, max_batch_tokens):
+    generated = generate_batched(model, tokenizer, prompts, batch_size=batch_size, max_batch_tokens=max_batch_tokens,
+                                 max_new_tokens=TEST_MAX_NEW_TOKENS)
+    assert generated == single_outputs
@@ -0,0 +1,103 @@
+import os
+import multiprocessing
+import numpy as np
+import torch
+from src.inference.cache import ArtifactCache, RESCAN_FRACTION, cached_embeddings, cached_decode, cached_encode
+
+ENTRY = np.zeros(16, dtype=np.float32)
+
+def cache_files(cache_dir):
+    return [os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names]
+
+def test_keys_depend_on_content_model_and_params(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=None)
+    key = cache.key("embedding", "model", [1, 2, 3], "mean")
+    assert key == cache.key("embedding", "model", [1, 2, 3], "mean")
+    assert key == cache.key("embedding", "model", np.array([1, 2, 3]), "mean")
+    others = [cache.key("embedding", "model", [1, 2, 4], "mean"), cache.key("embedding", "other", [1, 2, 3], "mean"),
+              cache.key("embedding", "model", [1, 2, 3], "last"), cache.key("decoded", "model", [1, 2, 3], "mean"),
+              cache.key("embedding", "model", "1,2,3", "mean")]
+    assert len({key, *others}) == len(others) + 1
+
+def test_cached_embeddings_compute_only_misses(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=None)
+    calls = []
+
+    def compute(items):
+        calls.append(list(items))
+        return torch.tensor([[float(len(item)), float(item[0])] for item in items])
+
+    first = cached_embeddings(cache, "model", "mean", [[1], [2, 3]], compute)
+    second = cached_embeddings(cache, "model", "mean", [[2, 3], [4, 5, 6], [1]], compute)
+    assert calls == [[[1], [2, 3]], [[4, 5, 6]]]
+    assert torch.equal(second, torch.tensor([[2.0, 2.0], [3.0, 4.0], [1.0, 1.0]]))
+    assert torch.equal(first, cached_embeddings(None, "model", "mean", [[1], [2, 3]], compute))
+
+def test_cached_decode_and_encode_match_the_tokenizer(tmp_path, tokenizer, tokenized_data):
+    cache = ArtifactCache(str(tmp_path), max_bytes=None)
+    sequences = [list(entry["middle"][0]) for entry in tokenized_data[:4]]
+    texts = [tokenizer.decode(sequence, skip_special_tokens=True) for sequence in sequences]
+    for _ in range(2):
+        # The second round is served from the cache
+        assert cached_decode(cache, "model", tokenizer, sequences) == texts
+        assert [list(ids) for ids in cached_encode(cache, "model", tokenizer, texts)] == \
+            [tokenizer.encode(text, truncation=True) for text in texts]
+    assert len(cache_files(str(tmp_path))) == len({tuple(sequence) for sequence in sequences}) + len(set(texts))
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=None)
+    keys = [cache.key("embedding", "model", text) for text in ("a", "b", "c", "d")]
+    for key in keys[:3]:
+        cache.put_array(key, ENTRY)
+    # Give the entries distinct, increasing access times, then read the oldest one again
+    for age, key in enumerate(keys[:3]):
+        os.utime(cache._path(key, ".npy"), (age + 1, age + 1))
+    cache.scan()
+    assert cache.get_array(keys[0]) is not None
+
+    entry_bytes = cache.total_bytes // 3
+    cache.max_bytes = int(entry_bytes * 3.5)
+    cache.put_array(keys[3], ENTRY)
+    assert cache.get_array(keys[1]) is None
+    assert all(cache.get_array(key) is not None for key in (keys[0], keys[2], keys[3]))
+    assert cache.total_bytes == 3 * entry_bytes
+
+def test_eviction_frees_space_down_to_low_water_mark(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=20_000)
+    scans = []
+    scan = cache.scan
+    cache.scan = lambda: (scans.append(1), scan())
+    for index in range(1000):
+        cache.put_array(cache.key("embedding", "model", str(index)), ENTRY)
+    assert cache.total_bytes <= cache.max_bytes
+    assert sum(os.path.getsize(path) for path in cache_files(str(tmp_path))) == cache.total_bytes
+    # Only the periodic rescans, not one per write over the limit
+    entry_bytes = os.path.getsize(cache_files(str(tmp_path))[0])
+    assert len(scans) <= 1000 * entry_bytes * RESCAN_FRACTION // cache.max_bytes
+
+def _write_entries(cache_dir, max_bytes, worker_index, count):
+    cache = ArtifactCache(cache_dir, max_bytes=max_bytes)
+    for index in range(count):
+        # Every worker writes a shared half of the keys too, to race on the same entries
+        content = str(index) if index % 2 else f"{worker_index}-{index}"
+        cache.put_array(cache.key("embedding", "model", content), np.full(16, index, dtype=np.float32))
+
+def test_concurrent_writers_share_one_directory(tmp_path):
+    cache_dir, max_bytes, num_workers = str(tmp_path), 20_000, 4
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_write_entries, args=(cache_dir, max_bytes, worker_index, 200))
+                 for worker_index in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    files = cache_files(cache_dir)
+    assert not any(path.endswith(".tmp") for path in files)
+    # Each process may be up to one rescan interval behind the others' writes
+    assert sum(os.path.getsize(path) for path in files) <= max_bytes * (1 + num_workers / RESCAN_FRACTION)
+    cache = ArtifactCache(cache_dir, max_bytes=max_bytes)
+    for path in files:
+        key = os.path.basename(path)[:-len(".npy")]
+        assert cache.get_array(key).shape == (16,)
@@ -0,0 +1,88 @@
+import random
+import numpy as np
+from src.data.dedup import (TokenHashes, token_hashes_of, minhash_signatures, find_near_duplicates, stratified_sample,
+                            dedup_and_sample, middle_length_stratum)
+
+WORDS = ["total", "count", "items", "value", "index", "result", "buffer", "node", "offset", "limit", "name", "key"]
+
+def snippet(rng, lines=12):
+    # Random statements over a small vocabulary, so distinct snippets still share many tokens
+    return "\n".join(f"{rng.choice(WORDS)}_{rng.randint(0, 9)} = {rng.choice(WORDS)}({rng.choice(WORDS)}, {rng.randint(0, 99)})"
+                     for _ in range(lines)) + "\n"
+
+def near_duplicate(text, rng):
+    # Reindented, with one identifier renamed: the edits a copied snippet typically goes through
+    lines = ["    " + line if rng.random() < 0.5 else line for line in text.split("\n")]
+    target = rng.randrange(len(lines) - 1)
+    lines[target] = lines[target].replace("=", "= renamed +", 1)
+    return "\n".join(lines)
+
+def planted_corpus(num_originals=150, num_copies=50, seed=0):
+    rng = random.Random(seed)
+    texts = [snippet(rng) for _ in range(num_originals)]
+    copies = [near_duplicate(texts[rng.randrange(num_originals)], rng) for _ in range(num_copies)]
+    return texts + copies
+
+def shingles(text):
+    tokens = token_hashes_of(text, TokenHashes())
+    return set(zip(tokens, tokens[1:], tokens[2:]))
+
+def test_minhash_estimates_jaccard_similarity():
+    texts = planted_corpus(num_originals=20, num_copies=20)
+    signatures = minhash_signatures(texts, num_perm=256)
+    for i, j in [(0, 1), (2, 3), (0, 20), (5, 25), (10, 39)]:
+        first, second = shingles(texts[i]), shingles(texts[j])
+        exact = len(first & second) / len(first | second)
+        assert abs((signatures[i] == signatures[j]).mean() - exact) < 0.12
+
+def test_minhash_signatures_do_not_depend_on_chunking():
+    texts = planted_corpus(num_originals=30, num_copies=10) + ["", "x"]
+    signatures = minhash_signatures(texts)
+    assert signatures.shape == (len(texts), 64) and signatures.dtype == np.uint32
+    assert np.array_equal(signatures, minhash_signatures(texts, chunk_shingles=1))
+    assert np.array_equal(signatures, minhash_signatures(iter(texts), chunk_shingles=50))
+    assert minhash_signatures([]).shape == (0, 64)
+
+def test_finds_planted_near_duplicates():
+    num_originals = 150
+    texts = planted_corpus(num_originals)
+    duplicates = find_near_duplicates(minhash_signatures(texts))
+    # Every original is kept, and nearly every planted copy is caught
+    assert not duplicates[:num_originals].any()
+    assert duplicates[num_originals:].mean() >= 0.9
+
+def test_stratified_sample_keeps_each_strata_share():
+    rng = random.Random(0)
+    examples = ([{"language": "python", "middle": "x" * rng.randint(1, 300)} for _ in range(300)]
+                + [{"language": "java", "middle": "x" * rng.randint(1, 300)} for _ in range(100)]
+                + [{"language": "c", "middle": "x"}])
+    selected, report = stratified_sample(examples, target=80, seed=1)
+    assert len(selected) == 80 and selected == sorted(set(selected))
+    assert sum(stratum["kept"] for stratum in report.values()) == 80
+    for stratum in report.values():
+        assert abs(stratum["kept"] - 80 * stratum["available"] / len(examples)) <= 1
+    for key, stratum in report.items():
+        language, bin_index = key.split("/")
+        chosen = [index for index in selected if examples[index]["language"] == language
+                  and middle_length_stratum(examples[index]) == int(bin_index)]
+        assert len(chosen) == stratum["kept"]
+    assert stratified_sample(examples, target=80, seed=1) == (selected, report)
+
+def test_stratified_sample_rounds_to_the_exact_target():
+    examples = [{"language": "python", "middle": "x"}] * 2 + [{"language": "java", "middle": "x"}] * 50
+    # Shares of 1.54 and 38.46: the larger remainder gets the last example
+    _, report = stratified_sample(examples, target=40, seed=0)
+    assert report == {"java/0": {"available": 50, "kept": 38}, "python/0": {"available": 2, "kept": 2}}
+    _, report = stratified_sample(examples, target=51, seed=0)
+    assert report["java/0"]["kept"] == 49 and report["python/0"]["kept"] == 2
+    assert stratified_sample(examples, target=100)[0] == list(range(len(examples)))
+
+def test_dedup_and_sample_report():
+    texts = planted_corpus(num_originals=60, num_copies=20)
+    examples = [{"prefix": "", "middle": text, "language": "python"} for text in texts]
+    kept, report = dedup_and_sample(examples, target=None)
+    assert report["examples"] == 80 and report["distinct"] == report["kept"] == len(kept)
+    assert report["near_duplicates"] == 80 - len(kept) >= 18
+    kept, report = dedup_and_sample(examples, target=30)
+    assert len(kept) == report["kept"] == 30
+    assert all(example in examples[:60] for example in kept)
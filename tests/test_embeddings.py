@@ -0,0 +1,45 @@
+import pytest
+import torch
+from src.inference.batching import generate_batched
+from src.inference.embeddings import StarCoderEmbedder
+from src.inference.pipeline import run_inference_on_data
+from src.inference.stopping import MiddleStopRule, kept_token_count
+from tests.conftest import TEST_MAX_NEW_TOKENS
+from tests.test_stopping import stop_rules_for
+
+def test_batched_embeddings_match_one_at_a_time(model, tokenizer, tokenized_data):
+    embedder = StarCoderEmbedder(model, tokenizer, batch_size=4)
+    middles = [entry["middle"][0] for entry in tokenized_data[:10]]
+    batched = embedder.embed_ids(middles)
+    single = torch.cat([embedder.embed_ids([middle]) for middle in middles])
+    assert torch.allclose(batched, single, atol=1e-5)
+
+def test_kept_token_count_leaves_out_trimmed_tokens(tokenizer):
+    rule = MiddleStopRule(language="python", indent=4, rules=("block",))
+    kept_text = "x = 1\n    y = 2\n"
+    tokens = tokenizer.encode(kept_text + "z = 3\n") + [tokenizer.eos_token_id]
+    count = kept_token_count(tokenizer, tokens, rule)
+    assert tokenizer.decode(tokens[:count]).startswith(kept_text)
+    assert not tokenizer.decode(tokens[:count - 1]).startswith(kept_text)
+    assert count < len(tokens) - 1
+    assert kept_token_count(tokenizer, tokens) == len(tokens) - 1
+
+@pytest.mark.parametrize("max_new_tokens, with_stop_rules", [(TEST_MAX_NEW_TOKENS, False), (TEST_MAX_NEW_TOKENS, True), (1, False)])
+def test_generation_states_match_embedding_in_context(model, tokenizer, prompts, tokenized_data, max_new_tokens, with_stop_rules):
+    stop_rules = stop_rules_for(tokenized_data) if with_stop_rules else None
+    generated, embeddings = generate_batched(model, tokenizer, prompts, batch_size=4, max_new_tokens=max_new_tokens,
+                                             return_embeddings=True, stop_rules=stop_rules)
+    kept = [tokens[:kept_token_count(tokenizer, tokens, stop_rules[idx] if stop_rules else None)]
+            for idx, tokens in enumerate(generated)]
+    if with_stop_rules:
+        assert len({len(tokens) for tokens in kept}) > 1
+    expected = StarCoderEmbedder(model, tokenizer).embed_continuations(prompts, kept)
+    assert torch.allclose(embeddings, expected, atol=1e-4)
+    assert all(embedding.abs().sum() > 0 for embedding, tokens in zip(embeddings, kept) if tokens)
+
+def test_reused_states_are_reported_as_contextual_similarity(model, tokenizer, tokenized_data):
+    results = run_inference_on_data(model, tokenizer, tokenized_data[:4], batch_size=4, reuse_generation_states=True,
+                                    max_new_tokens=TEST_MAX_NEW_TOKENS)
+    for result in results:
+        assert "cosine_similarity" not in result["metrics"]
+        assert -1 <= result["metrics"]["contextual_cosine_similarity"] <= 1
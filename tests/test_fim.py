@@ -0,0 +1,47 @@
+import pytest
+from src.inference.fim import (FIM_PREFIX, FIM_SUFFIX, FIM_MIDDLE, fim_token_ids, trim_around_cursor,
+                               build_fim_input, compare_modes)
+from src.inference.pipeline import run_inference_on_data, generate_single
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+class NoFimTokenizer:
+    unk_token_id = 0
+
+    def convert_tokens_to_ids(self, token):
+        return self.unk_token_id
+
+def test_fim_token_ids(tokenizer):
+    ids = fim_token_ids(tokenizer)
+    assert ids == tuple(tokenizer.encode(token)[0] for token in (FIM_PREFIX, FIM_SUFFIX, FIM_MIDDLE))
+    assert len(set(ids)) == 3
+    with pytest.raises(ValueError):
+        fim_token_ids(NoFimTokenizer())
+
+def test_trim_around_cursor_keeps_the_tokens_next_to_the_cursor():
+    prefix, suffix = list(range(10)), list(range(100, 110))
+    assert trim_around_cursor(prefix, suffix, 30) == (prefix, suffix)
+    assert trim_around_cursor(prefix, suffix, 6) == ([7, 8, 9], [100, 101, 102])
+    # A short side leaves the rest of the budget to the other
+    assert trim_around_cursor(prefix, [100], 6) == ([5, 6, 7, 8, 9], [100])
+    assert trim_around_cursor([1], suffix, 6) == ([1], [100, 101, 102, 103, 104])
+    assert trim_around_cursor(prefix, suffix, 0) == ([], [])
+
+def test_build_fim_input_fits_the_token_limit():
+    fim_ids = (-1, -2, -3)
+    assert build_fim_input([1, 2], [3], fim_ids) == [-1, 1, 2, -2, 3, -3]
+    prompt = build_fim_input(list(range(50)), list(range(100, 150)), fim_ids, max_tokens=13)
+    assert prompt == [-1, 45, 46, 47, 48, 49, -2, 100, 101, 102, 103, 104, -3]
+
+def test_fim_inference_generates_from_the_fim_prompt(model, tokenizer, tokenized_data):
+    data = tokenized_data[:4]
+    results = run_inference_on_data(model, tokenizer, data, mode="fim", max_new_tokens=TEST_MAX_NEW_TOKENS)
+    fim_ids = fim_token_ids(tokenizer)
+    for result, entry in zip(results, data):
+        prompt = build_fim_input(entry["prefix"][0], entry["suffix"][0], fim_ids)
+        expected = generate_single(model, tokenizer, prompt, max_new_tokens=TEST_MAX_NEW_TOKENS)
+        assert result["mode"] == "fim"
+        assert result["generated"] == tokenizer.decode(expected, skip_special_tokens=True)
+
+    report = compare_modes(results + run_inference_on_data(model, tokenizer, data, max_new_tokens=TEST_MAX_NEW_TOKENS))
+    assert sorted(report) == ["fim", "prefix"]
+    assert all(summary["examples"] == len(data) for summary in report.values())
@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+from src.constants import RAW_DATA_DIR
+from src.data.manifest import update_split, update_tokenized, STORE_MANIFEST_FILE
+from src.data.split_code import generate_split_stream, iter_code_files
+from src.data.tokenize_dataset import tokenize_dataset, tokenize_examples
+from src.data.tokenized_store import TokenizedStore, FIELDS
+
+@pytest.fixture
+def corpus(tmp_path):
+    """A copy of data/raw that the tests can edit."""
+    directory = tmp_path / "raw"
+    shutil.copytree(RAW_DATA_DIR, directory, ignore=shutil.ignore_patterns("__pycache__"))
+    return str(directory)
+
+def read_jsonl(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def write_jsonl(file_path, examples):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(example) + "\n" for example in examples)
+
+def assert_store_matches(store_path, expected):
+    store = TokenizedStore(store_path)
+    assert len(store) == len(expected)
+    for entry, reference in zip(store, expected):
+        assert entry["language"] == reference["language"]
+        for field in FIELDS:
+            assert entry[field][0].tolist() == reference[field][0]
+
+def edit_corpus(directory):
+    """Changes one file, deletes another and adds a new one."""
+    files = [file_path for file_path, _ in iter_code_files(directory)]
+    with open(files[0], 'a', encoding='utf-8') as f:
+        f.write("\n# appended\nvalue = 1\nvalue += 2\n")
+    os.remove(files[1])
+    shutil.copy(files[2], os.path.join(os.path.dirname(files[2]), "copy_" + os.path.basename(files[2])))
+
+def test_update_split_matches_full_split(corpus, tmp_path):
+    output_file, manifest_path = str(tmp_path / "split.jsonl"), str(tmp_path / "split_manifest.json")
+    stats = update_split(corpus, output_file, manifest_path)
+    assert stats["added"] > 0 and stats["changed"] == 0
+    assert update_split(corpus, output_file, manifest_path)["unchanged"] == stats["added"]
+
+    edit_corpus(corpus)
+    stats = update_split(corpus, output_file, manifest_path)
+    assert (stats["added"], stats["changed"], stats["deleted"]) == (1, 1, 1)
+
+    full_file = str(tmp_path / "full.jsonl")
+    generate_split_stream(corpus, full_file)
+    assert read_jsonl(output_file) == read_jsonl(full_file)
+
+def test_update_tokenized_matches_full_tokenization(corpus, tmp_path, tokenizer_dir):
+    input_path, store_path = str(tmp_path / "split.jsonl"), str(tmp_path / "store")
+    update_split(corpus, input_path, str(tmp_path / "split_manifest.json"))
+    update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+
+    edit_corpus(corpus)
+    update_split(corpus, input_path, str(tmp_path / "split_manifest.json"))
+    stats = update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+    assert stats["retokenized"] == 2 and stats["dropped"] == 1 and stats["copied"] > 0
+    assert_store_matches(store_path, tokenize_examples(read_jsonl(input_path), model_id=tokenizer_dir))
+
+def test_full_tokenize_then_incremental_update(tmp_path, tokenizer_dir, corpus):
+    input_path, store_path = str(tmp_path / "split.jsonl"), str(tmp_path / "store")
+    update_split(corpus, input_path, str(tmp_path / "split_manifest.json"))
+    examples = read_jsonl(input_path)
+    update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+
+    # A full run over fewer examples rewrites the store, and the manifest of the larger store goes with it
+    reduced_path = str(tmp_path / "reduced.jsonl")
+    write_jsonl(reduced_path, examples[len(examples) // 2:])
+    tokenize_dataset(input_path=reduced_path, store_path=store_path, model_id=tokenizer_dir)
+    assert not os.path.exists(os.path.join(store_path, STORE_MANIFEST_FILE))
+
+    update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+    assert_store_matches(store_path, tokenize_examples(examples, model_id=tokenizer_dir))
+
+def test_update_tokenized_ignores_manifest_of_another_store(tmp_path, tokenizer_dir, corpus):
+    input_path, store_path = str(tmp_path / "split.jsonl"), str(tmp_path / "store")
+    update_split(corpus, input_path, str(tmp_path / "split_manifest.json"))
+    examples = read_jsonl(input_path)
+    update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+    manifest_path = os.path.join(store_path, STORE_MANIFEST_FILE)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        stale_manifest = f.read()
+
+    # A store rewritten by something that does not know about manifests, with the old manifest put back
+    tokenize_dataset(input_path=input_path, store_path=store_path, model_id=tokenizer_dir)
+    reduced_path = str(tmp_path / "reduced.jsonl")
+    write_jsonl(reduced_path, examples[:3])
+    tokenize_dataset(input_path=reduced_path, store_path=store_path, model_id=tokenizer_dir)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        f.write(stale_manifest)
+
+    stats = update_tokenized(input_path, store_path, model_id=tokenizer_dir)
+    assert stats["copied"] == 0
+    assert_store_matches(store_path, tokenize_examples(examples, model_id=tokenizer_dir))
@@ -0,0 +1,67 @@
+from collections import Counter
+import pytest
+from sacrebleu import sentence_chrf, corpus_chrf
+from Levenshtein import distance as levenshtein_distance
+from src.evaluation.metrics import ngram_counts, compute_codebleu, score_example, score_examples, corpus_scores
+
+def legacy_codebleu(preds, refs):
+    # The original implementation, which rebuilt the n-gram counters for every order
+    def ngram_match_score(candidate, reference, n):
+        def ngram_counter(text, n):
+            tokens = text.split()
+            return Counter([tuple(tokens[i:i+n]) for i in range(len(tokens)-n+1)])
+        candidate_ngrams = ngram_counter(candidate, n)
+        reference_ngrams = ngram_counter(reference, n)
+        overlap = sum((candidate_ngrams & reference_ngrams).values())
+        total = sum(candidate_ngrams.values())
+        return overlap / total if total > 0 else 0
+
+    ngram_scores = [ngram_match_score(preds, refs, n) for n in range(1, 5)]
+    return sum(ngram_scores) / len(ngram_scores) * 100
+
+def legacy_metrics(generated, reference):
+    # The metrics the inference loop computed per example
+    return {
+        "exact_match": int(generated.strip() == reference.strip()),
+        "chrf": sentence_chrf(generated, [reference]).score,
+        "levenshtein_distance": levenshtein_distance(generated, reference),
+        "codebleu": legacy_codebleu(generated, reference)
+    }
+
+@pytest.fixture(scope="module")
+def pairs(examples):
+    # Each middle against the next one, against itself and against an edited copy, plus degenerate texts
+    middles = [example["middle"] for example in examples]
+    pairs = [(middle, other, example["language"]) for middle, other, example in zip(middles, middles[1:] + middles[:1], examples)]
+    pairs += [(middle, middle, "python") for middle in middles[:5]]
+    pairs += [(middle.replace(" ", "  ", 1) + "x", middle, "c") for middle in middles[5:10]]
+    pairs += [("", "", "python"), ("", "a b c", "java"), ("a b c d e", "", "c"), ("a a a a", "a a", "python")]
+    return pairs
+
+def test_compute_codebleu_matches_legacy(pairs):
+    for generated, reference, lang in pairs:
+        assert compute_codebleu(generated, reference, lang) == legacy_codebleu(generated, reference)
+
+@pytest.mark.parametrize("workers, chunk_size", [(0, 1000), (0, 3), (2, 5)])
+def test_score_examples_matches_legacy(pairs, workers, chunk_size):
+    expected = [legacy_metrics(generated, reference) for generated, reference, _ in pairs]
+    timings = {}
+    assert score_examples(pairs, workers=workers, chunk_size=chunk_size, timings=timings) == expected
+    assert set(timings) == set(expected[0])
+    assert [score_example(*pair) for pair in pairs] == expected
+
+def test_ngram_counts_match_per_order_counters(pairs):
+    for text, _, _ in pairs:
+        tokens = text.split()
+        expected = [Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)) for n in range(1, 5)]
+        assert ngram_counts(text) == expected
+
+def test_corpus_scores_per_language(pairs):
+    results = [{"generated": generated, "true_middle": reference, "language": lang, "metrics": legacy_metrics(generated, reference)}
+               for generated, reference, lang in pairs]
+    report = corpus_scores(results)
+    assert report["all"]["count"] == len(results)
+    assert sum(report[lang]["count"] for lang in report if lang != "all") == len(results)
+    python = [result for result in results if result["language"] == "python"]
+    assert report["python"]["corpus_chrf"] == corpus_chrf([r["generated"] for r in python], [[r["true_middle"] for r in python]]).score
+    assert report["python"]["mean_exact_match"] == pytest.approx(sum(r["metrics"]["exact_match"] for r in python) / len(python))
@@ -0,0 +1,38 @@
+import pytest
+from src.inference.pipeline import run_inference_on_data, generation_conflicts
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+def assert_identical_results(results, expected):
+    for result, reference in zip(results, expected):
+        assert result["generated"] == reference["generated"]
+        assert result["generated_tokens"] == reference["generated_tokens"]
+        metrics = dict(result["metrics"])
+        reference_metrics = dict(reference["metrics"])
+        assert metrics.pop("cosine_similarity") == pytest.approx(reference_metrics.pop("cosine_similarity"), abs=1e-5)
+        assert metrics == reference_metrics
+
+@pytest.mark.parametrize("options", [
+    {"batch_size": 4},
+    {"share_prefix": True},
+    {"speculative": "prompt-lookup"},
+    {"speculative": "draft-model"},
+    {"batch_size": 4, "stop_rules": ("lines", "block")},
+    {"share_prefix": True, "stop_rules": ("lines", "block")},
+    {"speculative": "prompt-lookup", "stop_rules": ("lines", "block")},
+    {"speculative": "draft-model", "stop_rules": ("lines", "tokens")}
+])
+def test_inference_paths_give_identical_results(model, draft_model, tokenizer, tokenized_data, options):
+    data = tokenized_data[:8]
+    stop_rules = options.get("stop_rules")
+    expected = run_inference_on_data(model, tokenizer, data, stop_rules=stop_rules, max_new_tokens=TEST_MAX_NEW_TOKENS)
+    results = run_inference_on_data(model, tokenizer, data, draft_model=draft_model,
+                                    max_new_tokens=TEST_MAX_NEW_TOKENS, **options)
+    assert len(results) == len(data)
+    assert_identical_results(results, expected)
+
+def test_generation_conflicts():
+    assert generation_conflicts(batch_size=4) == []
+    assert generation_conflicts(batch_size=4, reuse_generation_states=True) == []
+    assert len(generation_conflicts(batch_size=4, share_prefix=True)) == 1
+    assert len(generation_conflicts(share_prefix=True, speculative="prompt-lookup")) == 1
+    assert len(generation_conflicts(reuse_generation_states=True)) == 1
@@ -0,0 +1,25 @@
+from src.inference.pipeline import generate_single
+from src.inference.prefix_cache import common_prefix_length, generate_with_shared_prefix
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+def test_common_prefix_length():
+    assert common_prefix_length([1, 2, 3], [1, 2, 4]) == 2
+    assert common_prefix_length([1, 2], [1, 2, 3]) == 2
+    assert common_prefix_length([], [1]) == 0
+
+def test_shared_prefix_matches_single(model, tokenizer, prompts, single_outputs):
+    generated, stats = generate_with_shared_prefix(model, tokenizer, prompts, min_shared_tokens=4,
+                                                   max_new_tokens=TEST_MAX_NEW_TOKENS)
+    assert generated == single_outputs
+    assert stats["shared_prefixes"] > 0
+    assert 0 < stats["prefill_tokens_saved"] < stats["prefill_tokens"]
+
+def test_shared_prefix_handles_duplicates_and_nested_prompts(model, tokenizer, prompts, single_outputs):
+    # A prompt repeated, and a prompt that is a prefix of another
+    nested = prompts[0][:len(prompts[0]) // 2]
+    sequences = [prompts[0], prompts[0], nested, prompts[1]]
+    generated, _ = generate_with_shared_prefix(model, tokenizer, sequences, min_shared_tokens=1,
+                                               max_new_tokens=TEST_MAX_NEW_TOKENS)
+    assert generated[:2] == [single_outputs[0], single_outputs[0]]
+    assert generated[3] == single_outputs[1]
+    assert generated[2] == generate_single(model, tokenizer, nested, max_new_tokens=TEST_MAX_NEW_TOKENS)
@@ -0,0 +1,25 @@
+from src.profiling import Profiler
+from src.inference.pipeline import generate_single
+from src.inference.speculative import speculative_generate, DraftModelDrafter
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+def test_track_forward_splits_generate_into_prefill_and_decode(model, tokenizer, prompts, single_outputs):
+    profiler = Profiler()
+    with profiler.track_forward(model):
+        generate_single(model, tokenizer, prompts[0], max_new_tokens=TEST_MAX_NEW_TOKENS)
+    forward = profiler.summary()["forward"]
+    assert forward["prefill"]["passes"] == 1
+    assert forward["prefill"]["tokens"] == len(prompts[0])
+    # The first token comes out of the prefill; an end of sequence token is stripped from the output
+    assert len(single_outputs[0]) - 1 <= forward["decode"]["passes"] <= len(single_outputs[0])
+
+def test_track_forward_counts_speculative_verify_passes_as_decode(model, draft_model, tokenizer, prompts):
+    profiler = Profiler()
+    # Only the target model is tracked; its verify passes feed several tokens over a filled cache
+    with profiler.track_forward(model):
+        _, stats = speculative_generate(model, prompts[0], DraftModelDrafter(draft_model),
+                                        max_new_tokens=TEST_MAX_NEW_TOKENS, eos_token_id=tokenizer.eos_token_id)
+    forward = profiler.summary()["forward"]
+    assert stats["proposed"] > 0
+    assert forward["prefill"]["passes"] == 1
+    assert forward["decode"]["passes"] == stats["forward_passes"] - 1
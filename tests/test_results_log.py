@@ -0,0 +1,75 @@
+import os
+import json
+import subprocess
+import sys
+import pytest
+from src.constants import PROJECT_ROOT
+from src.evaluation.metrics import load_results
+from src.inference.pipeline import run_logged, run_config
+from src.inference.results_log import ResultsLog, config_hash, example_ids, merge_results
+from tests.conftest import TEST_MAX_NEW_TOKENS
+from tests.test_pipeline import assert_identical_results
+
+def record(generated):
+    return {"language": "python", "generated": generated, "true_middle": "x = 1\n", "metrics": {}}
+
+def test_example_ids_are_stable_and_unique(tokenized_data):
+    ids = example_ids(tokenized_data[:4] + tokenized_data[:2])
+    assert len(set(ids)) == len(ids)
+    assert ids[:4] == example_ids(tokenized_data[:4])
+    assert ids[4].rsplit("-", 1)[0] == ids[0].rsplit("-", 1)[0]
+
+def test_merge_skips_truncated_lines_and_keeps_configs_apart(tmp_path):
+    run_dir = str(tmp_path)
+    prefix_config, fim_config = run_config("model", "prefix"), run_config("model", "fim")
+    with ResultsLog(run_dir, prefix_config, shard="0") as log:
+        log.append(["a", "b"], [record("x = 1\n"), record("x = 2\n")])
+    with ResultsLog(run_dir, fim_config, shard="1") as log:
+        log.append(["a"], [record("y = 1\n")])
+        assert log.completed() == {"a"}
+    with open(os.path.join(run_dir, "results-1.jsonl"), 'a', encoding='utf-8') as f:
+        f.write('{"example_id": "b", "conf')
+
+    assert [r["example_id"] for r in merge_results(run_dir, config_hash(prefix_config))] == ["a", "b"]
+    assert [r["generated"] for r in merge_results(run_dir, config_hash(fim_config))] == ["y = 1\n"]
+    assert len(merge_results(run_dir)) == 3
+
+def test_load_results_refuses_mixed_configs(tmp_path):
+    run_dir = str(tmp_path)
+    for mode in ("prefix", "fim"):
+        with ResultsLog(run_dir, run_config("model", mode), shard=mode) as log:
+            log.append(["a"], [record(mode)])
+    with pytest.raises(ValueError, match="2 configs"):
+        load_results(run_dir)
+    fim_hash = config_hash(run_config("model", "fim"))
+    assert [result["generated"] for result in load_results(run_dir, fim_hash)] == ["fim"]
+    assert [result["generated"] for result in load_results(os.path.join(run_dir, "results-fim.jsonl"))] == ["fim"]
+
+def test_run_metrics_reports_each_config(tmp_path):
+    run_dir = str(tmp_path / "run")
+    for mode in ("prefix", "fim"):
+        with ResultsLog(run_dir, run_config("model", mode), shard=mode) as log:
+            log.append(["a", "b"], [record("x = 1\n"), record(f"{mode} = 2\n")])
+    report_path = str(tmp_path / "report.json")
+    subprocess.run([sys.executable, "run_metrics.py", run_dir, "--report", report_path], cwd=PROJECT_ROOT, check=True,
+                   capture_output=True)
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    assert sorted(entry["config"]["mode"] for entry in report.values()) == ["fim", "prefix"]
+    assert all(entry["examples"] == 2 and entry["metrics"]["all"]["count"] == 2 for entry in report.values())
+
+def test_resumed_run_only_generates_missing_examples(model, tokenizer, tokenized_data, tmp_path):
+    data = tokenized_data[:6]
+    ids = example_ids(data)
+    config = run_config("tiny", "prefix", max_new_tokens=TEST_MAX_NEW_TOKENS)
+    kwargs = {"batch_size": 3, "max_new_tokens": TEST_MAX_NEW_TOKENS}
+    # A run that stopped after its first chunk
+    with ResultsLog(str(tmp_path), config, shard="0-of-1") as log:
+        run_logged(model, tokenizer, data[:3], log, ids[:3], flush_every=3, **kwargs)
+    with ResultsLog(str(tmp_path), config, shard="0-of-1") as log:
+        resumed = run_logged(model, tokenizer, data, log, ids, resume=True, flush_every=3, **kwargs)
+    assert len(resumed) == 3
+
+    expected = run_logged(model, tokenizer, data, None, ids, **kwargs)
+    merged = {result["example_id"]: result for result in merge_results(str(tmp_path), config_hash(config))}
+    assert_identical_results([merged[example_id] for example_id in ids], expected)
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+import pytest
+from src.inference.pipeline import generate_single
+from src.inference.stopping import MiddleStopRule, trim_completion
+from src.serving.engine import CompletionRequest, ContinuousBatcher
+from src.serving.server import CompletionServer
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+def serving_rules(tokenized_data, count):
+    rules = []
+    for idx, entry in enumerate(tokenized_data[:count]):
+        if idx % 3 == 0:
+            rules.append(None)
+        elif idx % 3 == 1:
+            rules.append(MiddleStopRule(language=entry["language"], line_budget=1 + idx % 4, rules=("lines",)))
+        else:
+            rules.append(MiddleStopRule(language=entry["language"], indent=4, suffix_line="}", rules=("suffix", "block")))
+    return rules
+
+def test_continuous_batching_matches_single(model, tokenizer, prompts, tokenized_data):
+    rules = serving_rules(tokenized_data, len(prompts))
+    max_new_tokens = [TEST_MAX_NEW_TOKENS - idx % 5 for idx in range(len(prompts))]
+    streams = [[] for _ in prompts]
+    finals = [None] * len(prompts)
+
+    def on_event(idx):
+        def handle(event):
+            if event.get("done"):
+                finals[idx] = event
+            else:
+                streams[idx].append(event["text"])
+        return handle
+
+    requests = [CompletionRequest(prompt, limit, rule, on_event(idx))
+                for idx, (prompt, limit, rule) in enumerate(zip(prompts, max_new_tokens, rules))]
+    batcher = ContinuousBatcher(model, tokenizer, max_batch_size=5)
+    # Requests arrive while others are decoding, so they join a running batch
+    for request in requests[:3]:
+        batcher.submit(request)
+    pending = requests[3:]
+    while batcher.running or batcher.waiting or pending:
+        if pending:
+            batcher.submit(pending.pop(0))
+        batcher.step()
+
+    for idx, (prompt, rule) in enumerate(zip(prompts, rules)):
+        expected = generate_single(model, tokenizer, prompt, rule, max_new_tokens=max_new_tokens[idx])
+        assert requests[idx].generated == [token for token in expected if token != tokenizer.eos_token_id]
+        text = tokenizer.decode(expected, skip_special_tokens=True)
+        completion = text if rule is None else trim_completion(text, rule)
+        assert finals[idx]["completion"] == completion
+        assert "".join(streams[idx]) == completion
+        if rule is not None and "suffix" in rule.rules:
+            # Until the request finished, only whole lines were released
+            for end in range(1, len(streams[idx])):
+                streamed = "".join(streams[idx][:end])
+                assert streamed == "" or streamed.endswith("\n")
+
+@pytest.mark.parametrize("payload, message", [
+    ({"prefix": "x = 1\n", "stop_on": ["lines"]}, "max_lines"),
+    ({"prefix": "x = 1\n", "max_new_tokens": 0}, "max_new_tokens"),
+    ({"prefix": "x = 1\n", "max_new_tokens": "8"}, "max_new_tokens"),
+    ({"prefix": "x = 1\n", "stop_on": ["lines"], "max_lines": -1}, "max_lines"),
+    ({"prefix": "x = 1\n", "stop_on": ["tokens"]}, "stop_on"),
+    ({"suffix": "x = 1\n"}, "prefix")
+])
+def test_invalid_completion_requests_are_rejected(tokenizer, payload, message):
+    server = CompletionServer(SimpleNamespace(tokenizer=tokenizer))
+    with pytest.raises(ValueError, match=message):
+        server.parse_completion(payload)
+
+def test_completion_request_with_line_budget(tokenizer):
+    server = CompletionServer(SimpleNamespace(tokenizer=tokenizer))
+    request = server.parse_completion({"prefix": "def f():\n    ", "suffix": "\n    return x\n", "stop_on": ["lines", "suffix"],
+                                       "max_lines": 2, "max_new_tokens": 16})
+    assert request.max_new_tokens == 16
+    assert (request.stop_rule.line_budget, request.stop_rule.suffix_line, request.stop_rule.indent) == (2, "return x", 4)
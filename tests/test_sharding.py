@@ -0,0 +1,28 @@
+from src.data.tokenized_store import TokenizedStoreWriter
+from src.inference.pipeline import run_inference_on_data
+from src.inference.sharding import plan_chunks, run_sharded
+from tests.conftest import TEST_MAX_NEW_TOKENS
+from tests.test_pipeline import assert_identical_results
+
+def test_plan_chunks_orders_longest_prefixes_first():
+    chunks = plan_chunks({0: 5, 1: 9, 2: 5, 3: 1, 4: 9}, chunk_size=2)
+    assert chunks == [[1, 4], [0, 2], [3]]
+
+def test_sharded_run_matches_single_process(model, model_dir, tokenizer, tokenized_data, tmp_path):
+    data = tokenized_data[:8]
+    data_path = str(tmp_path / "store")
+    with TokenizedStoreWriter(data_path) as writer:
+        for entry in data:
+            writer.add(entry)
+
+    tasks = [("prefix", chunk) for chunk in plan_chunks({idx: len(entry["prefix"][0]) for idx, entry in enumerate(data)},
+                                                         chunk_size=3)]
+    finished = []
+    results, stats = run_sharded(data_path, tasks, model_dir, num_workers=2, threads_per_worker=1,
+                                 on_result=lambda mode, indices, chunk_results: finished.extend(indices),
+                                 max_new_tokens=TEST_MAX_NEW_TOKENS)
+    assert sorted(finished) == list(range(len(data)))
+    assert sum(worker_stats["examples"] for worker_stats in stats.values()) == len(data)
+
+    expected = run_inference_on_data(model, tokenizer, data, max_new_tokens=TEST_MAX_NEW_TOKENS)
+    assert_identical_results([results["prefix"][idx] for idx in range(len(data))], expected)
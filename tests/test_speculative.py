@@ -0,0 +1,33 @@
+from src.inference.speculative import speculative_generate, PromptLookupDrafter, DraftModelDrafter
+from tests.conftest import TEST_MAX_NEW_TOKENS
+
+def test_prompt_lookup_drafts_from_context_then_suffix():
+    drafter = PromptLookupDrafter(lookup_ids=[7, 8, 9, 10], num_draft_tokens=2, max_ngram=2)
+    # The last bigram (1, 2) occurred earlier in the context, followed by 3, 4
+    assert drafter.propose([1, 2, 3, 4, 5, 1, 2]) == [3, 4]
+    # No earlier occurrence of 8 in the context, so the suffix provides the continuation
+    assert drafter.propose([5, 6, 8]) == [9, 10]
+    assert drafter.propose([42]) == []
+
+def test_speculative_prompt_lookup_matches_single(model, tokenizer, prompts, single_outputs, tokenized_data):
+    accepted = 0
+    for prompt, expected, entry in zip(prompts, single_outputs, tokenized_data):
+        generated, stats = speculative_generate(model, prompt, PromptLookupDrafter(entry["suffix"][0]),
+                                                max_new_tokens=TEST_MAX_NEW_TOKENS, eos_token_id=tokenizer.eos_token_id)
+        assert generated == expected
+        accepted += stats["accepted"]
+    assert accepted > 0
+
+def test_speculative_draft_model_matches_single(model, draft_model, tokenizer, prompts, single_outputs):
+    for prompt, expected in zip(prompts, single_outputs):
+        generated, _ = speculative_generate(model, prompt, DraftModelDrafter(draft_model),
+                                            max_new_tokens=TEST_MAX_NEW_TOKENS, eos_token_id=tokenizer.eos_token_id)
+        assert generated == expected
+
+def test_speculative_self_draft_accepts_every_token(model, tokenizer, prompts, single_outputs):
+    # Drafting with the target model itself must accept every draft token, in fewer forward passes than tokens
+    generated, stats = speculative_generate(model, prompts[0], DraftModelDrafter(model),
+                                            max_new_tokens=TEST_MAX_NEW_TOKENS, eos_token_id=tokenizer.eos_token_id)
+    assert generated == single_outputs[0]
+    assert stats["proposed"] > 0 and stats["accepted"] == stats["proposed"]
+    assert stats["forward_passes"] < len(generated)
@@ -0,0 +1,104 @@
+import os
+import json
+import random
+import shutil
+from src.constants import RAW_DATA_DIR, MIN_PREFIX_LENGTH, MIN_SUFFIX_LENGTH
+from src.data.split_code import (LineIndex, iter_code_files, split_code_example, split_file, file_seed,
+                                 generate_code_completion_examples, generate_split_stream)
+
+def legacy_split_code_example(code_text, rng):
+    # The per-call splitter from before the line index: it strips and joins lines for every split point
+    if len(code_text) < MIN_PREFIX_LENGTH:
+        return None
+    code_lines = code_text.splitlines()
+    if len(code_lines) < 1:
+        return None
+    valid_lines_indexes = [
+        i for i, line in enumerate(code_lines)
+        if line.strip() and not line.strip().startswith(("\n", "#", "//"))
+    ]
+    if not valid_lines_indexes:
+        return None
+    chosen_line = rng.choice(valid_lines_indexes)
+    position_in_line = rng.randint(0, len(code_lines[chosen_line].strip()) // 2)
+    position_in_line += len(code_lines[chosen_line]) - len(code_lines[chosen_line].lstrip())
+
+    prefix = '\n'.join(code_lines[:chosen_line]) + '\n' + code_lines[chosen_line][:position_in_line]
+    middle = code_lines[chosen_line][position_in_line:] + '\n'
+    additional_lines = min(len(code_lines) - chosen_line - 1, rng.randint(1, 5))
+    for i in range(1, additional_lines + 1):
+        if not code_lines[chosen_line + i].strip().startswith(("#", "//")):
+            middle += code_lines[chosen_line + i] + '\n'
+    suffix = '\n'.join(code_lines[chosen_line + additional_lines + 1:])
+
+    if len(prefix) >= MIN_PREFIX_LENGTH and len(suffix) >= MIN_SUFFIX_LENGTH:
+        return {"prefix": prefix, "middle": middle, "suffix": suffix}
+    return None
+
+SYNTHETIC_TEXTS = [
+    # A cursor on the first line, comments inside the middle and blank lines at the end
+    "value = compute(1, 2)\n" + "".join(f"    # note {i}\nresult_{i} = value * {i}\n" for i in range(40)) + "\n\n",
+    # Windows line endings and C++ comments
+    "".join(f"int x{i} = {i};\r\n// comment {i}\r\n" for i in range(60)),
+    # Only comments: no valid cursor line
+    "".join(f"# comment line {i}\n" for i in range(50)),
+]
+
+def corpus_texts():
+    texts = list(SYNTHETIC_TEXTS)
+    for file_path, _ in iter_code_files(RAW_DATA_DIR):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+def test_line_index_matches_legacy_splitter():
+    for text in corpus_texts():
+        index = LineIndex.from_text(text)
+        for seed in range(200):
+            expected = legacy_split_code_example(text, random.Random(seed))
+            assert split_code_example(text, random.Random(seed)) == expected
+            assert split_code_example(text, random.Random(seed), index=index) == expected
+
+def test_line_index_offsets():
+    index = LineIndex.from_text("a = 1\n    # skip\n  b = 2\n\nc")
+    assert index.valid == [0, 2, 4]
+    assert index.comments == [False, True, False, False, False]
+    assert [index.text[index.starts[i]:index.line_end(i)] for i in range(len(index))] == index.lines
+    assert index.cut(0, 2, 3) == ("\na ", "= 1\n  b = 2\n\n", "c")
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_split_stream_is_independent_of_workers_and_location(tmp_path):
+    # The corpus plus a nested copy, so files of the same name get different seeds by relative path
+    corpus = tmp_path / "corpus"
+    shutil.copytree(RAW_DATA_DIR, corpus)
+    shutil.copytree(RAW_DATA_DIR, corpus / "nested")
+    moved = tmp_path / "moved"
+    shutil.copytree(corpus, moved)
+
+    counts, outputs = [], []
+    for directory, workers, max_pending in ((corpus, 0, None), (corpus, 2, 1), (moved, 3, None)):
+        output_file = tmp_path / f"split-{workers}.jsonl"
+        counts.append(generate_split_stream(str(directory), str(output_file), num_examples=5, workers=workers,
+                                            seed=7, max_pending=max_pending))
+        outputs.append(read_jsonl(output_file))
+    assert outputs[0] and outputs[0] == outputs[1] == outputs[2]
+    assert counts == [len(outputs[0])] * 3
+
+    generate_split_stream(str(corpus), str(tmp_path / "other-seed.jsonl"), num_examples=5, seed=8)
+    assert read_jsonl(tmp_path / "other-seed.jsonl") != outputs[0]
+
+def test_split_stream_draws_each_file_from_its_own_seed(tmp_path):
+    output_file = tmp_path / "split.jsonl"
+    generate_split_stream(RAW_DATA_DIR, str(output_file), num_examples=3, seed=7)
+    expected = []
+    for file_path, language in iter_code_files(RAW_DATA_DIR):
+        source = os.path.relpath(file_path, RAW_DATA_DIR)
+        expected.extend(split_file(file_path, language, 3, file_seed(7, source), source))
+    assert read_jsonl(output_file) == expected
+
+    # The keys of the in-memory splitter's examples, plus the source file
+    keys = set(generate_code_completion_examples(RAW_DATA_DIR, num_examples=1)[0])
+    assert all(set(example) == keys | {"source"} for example in expected)
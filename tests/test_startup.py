@@ -0,0 +1,30 @@
+import subprocess
+import sys
+from src.constants import PROJECT_ROOT
+from src.data.tokenized_store import TokenizedStoreWriter
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout
+
+def test_importing_the_script_loads_no_model():
+    output = run_python(
+        "import run_starcoder_inference\n"
+        "from src.models import get_model, get_tokenizer\n"
+        "print(get_model.cache_info().currsize, get_tokenizer.cache_info().currsize)\n"
+        "from run_starcoder_inference import compute_codebleu\n"
+        "print(compute_codebleu('x = 1', 'x = 1'))\n"
+    )
+    sizes, score = output.split("\n")[:2]
+    assert sizes == "0 0"
+    assert float(score) > 0
+
+def test_dry_run_does_not_load_the_model(tmp_path, tokenized_data):
+    data_path = str(tmp_path / "store")
+    with TokenizedStoreWriter(data_path) as writer:
+        for entry in tokenized_data[:5]:
+            writer.add(entry)
+    # A model id that does not exist: loading it would fail the run
+    result = subprocess.run([sys.executable, "run_starcoder_inference.py", "--data", data_path, "--model", str(tmp_path / "no-model"),
+                             "--mode", "both", "--dry-run"], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "5 examples" in result.stderr + result.stdout
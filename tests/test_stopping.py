@@ -0,0 +1,54 @@
+from src.inference.batching import generate_batched
+from src.inference.pipeline import generate_single
+from src.inference.prefix_cache import generate_with_shared_prefix
+from src.inference.speculative import speculative_generate, PromptLookupDrafter, DraftModelDrafter
+from src.inference.stopping import MiddleStopRule, MiddleSpanStoppingCriteria, find_stop
+from tests.conftest import TEST_MAX_NEW_TOKENS, NUM_PROMPTS
+
+def stop_rules_for(tokenized_data):
+    # Rules that end most rows early and at different steps
+    return [
+        MiddleStopRule(language=entry["language"], line_budget=1 + idx % 3, token_budget=4 + idx,
+                       rules=("lines", "tokens") if idx % 2 else ("lines",))
+        for idx, entry in enumerate(tokenized_data[:NUM_PROMPTS])
+    ]
+
+def single_with_stop_rules(model, tokenizer, prompts, stop_rules):
+    return [generate_single(model, tokenizer, prompt, rule, max_new_tokens=TEST_MAX_NEW_TOKENS)
+            for prompt, rule in zip(prompts, stop_rules)]
+
+def test_find_stop_rules():
+    assert find_stop("a\nb\nc", MiddleStopRule(language="python", line_budget=2, rules=("lines",))) == 4
+    assert find_stop("x = 1", MiddleStopRule(language="python", line_budget=1, rules=("lines",))) is None
+    suffix_rule = MiddleStopRule(language="python", suffix_line="return x", rules=("suffix",))
+    assert find_stop("y = 2\nreturn x\n", suffix_rule) == 6
+    block_rule = MiddleStopRule(language="python", indent=4, rules=("block",))
+    assert find_stop("x = 1\n    y = 2\nz = 3\n", block_rule) == 16
+    brace_rule = MiddleStopRule(language="java", rules=("block",))
+    assert find_stop("x++;\n}\n}\n", brace_rule) == 7
+
+def test_generate_batched_with_stop_rules_matches_single(model, tokenizer, prompts, tokenized_data):
+    stop_rules = stop_rules_for(tokenized_data)
+    generated = generate_batched(model, tokenizer, prompts, batch_size=6, max_new_tokens=TEST_MAX_NEW_TOKENS,
+                                 stop_rules=stop_rules)
+    expected = single_with_stop_rules(model, tokenizer, prompts, stop_rules)
+    assert generated == expected
+    assert any(len(tokens) < TEST_MAX_NEW_TOKENS for tokens in expected)
+
+def test_shared_prefix_with_stop_rules_matches_single(model, tokenizer, prompts, tokenized_data):
+    stop_rules = stop_rules_for(tokenized_data)
+    generated, _ = generate_with_shared_prefix(model, tokenizer, prompts, min_shared_tokens=4,
+                                               max_new_tokens=TEST_MAX_NEW_TOKENS, stop_rules=stop_rules)
+    assert generated == single_with_stop_rules(model, tokenizer, prompts, stop_rules)
+
+def test_speculative_with_stop_rules_matches_single(model, draft_model, tokenizer, prompts, tokenized_data):
+    stop_rules = stop_rules_for(tokenized_data)
+    expected = single_with_stop_rules(model, tokenizer, prompts, stop_rules)
+    for make_drafter in (lambda entry: PromptLookupDrafter(entry["suffix"][0]),
+                         lambda entry: DraftModelDrafter(model),
+                         lambda entry: DraftModelDrafter(draft_model)):
+        for prompt, rule, entry, reference in zip(prompts, stop_rules, tokenized_data, expected):
+            criteria = MiddleSpanStoppingCriteria(tokenizer, len(prompt), [rule])
+            generated, _ = speculative_generate(model, prompt, make_drafter(entry), max_new_tokens=TEST_MAX_NEW_TOKENS,
+                                                eos_token_id=tokenizer.eos_token_id, stopping_criteria=criteria)
+            assert generated == reference
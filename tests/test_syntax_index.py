@@ -0,0 +1,108 @@
+import os
+import random
+import numpy as np
+from src.data.split_code import LineIndex, index_code, split_code_example
+from src.data.syntax_index import SyntaxIndex, lex, find_split_points, load_split_points, CLOSING_TOKENS
+
+PYTHON_SOURCE = '''import os
+
+def load(path, mode="r"):
+    """
+    Reads a file.
+    value = not_code(1)
+    """
+    # a comment with code(1) in it
+    with open(path, mode) as f:  # trailing comment
+        text = f.read() + 'x # y'
+    return f"{text} and {path}"
+'''
+
+JAVA_SOURCE = '''/* A block comment
+   int hidden = 1;
+*/
+public class Box {
+    private char c = '}';
+    // int alsoHidden = 2;
+    public int size(int count) {
+        String s = "a /* b */ c";
+        return count * 2;
+    }
+}
+'''
+
+C_SOURCE = '''#include <stdio.h>
+#define TWICE(x) \\
+    ((x) * 2)
+int main(void) {
+    printf("%d\\n", TWICE(3)); /* done */
+    return 0;
+}
+'''
+
+def assert_points_outside_comments_and_strings(text, language):
+    index = LineIndex.from_text(text)
+    tokens = lex(index, language)
+    points = find_split_points(index, language)
+    assert len(points)
+    for line, position in points.tolist():
+        offset = index.starts[line] + position
+        assert not index.text[offset].isspace()
+        for kind, start, end in tokens:
+            if kind in ("comment", "preprocessor"):
+                assert not start <= offset < end
+            elif kind == "string":
+                assert not start < offset < end
+        # Lines that only close a block have no split points
+        assert index.lines[line].strip() not in CLOSING_TOKENS
+    return index, points
+
+def test_python_split_points():
+    index, points = assert_points_outside_comments_and_strings(PYTHON_SOURCE, "python")
+    lines = {line for line, _ in points.tolist()}
+    # Nothing in the docstring body or on the comment line
+    assert not lines & {4, 5, 6, 7}
+    assert {0, 2, 8, 9, 10} <= lines
+    # Statement start, then identifier and string boundaries of `text = f.read() + 'x # y'`
+    assert [position for line, position in points.tolist() if line == 9] == [8, 15, 17, 26]
+
+def test_python_with_broken_indentation_falls_back_to_the_regex_lexer():
+    text = "def f():\n  x = 1\n    y = 'a # b'  # note\n  return x\n"
+    index, points = assert_points_outside_comments_and_strings(text, "python")
+    assert [position for line, position in points.tolist() if line == 2] == [4, 8]
+
+def test_c_family_split_points():
+    _, points = assert_points_outside_comments_and_strings(JAVA_SOURCE, "java")
+    lines = {line for line, _ in points.tolist()}
+    assert not lines & {0, 1, 2, 5, 9, 10}
+    assert {3, 4, 6, 7, 8} <= lines
+
+    _, points = assert_points_outside_comments_and_strings(C_SOURCE, "c")
+    lines = {line for line, _ in points.tolist()}
+    assert not lines & {0, 1, 2, 6}
+    assert {3, 4, 5} <= lines
+
+def test_split_points_are_cached_by_content(tmp_path):
+    cache_dir = str(tmp_path)
+    index = LineIndex.from_text(PYTHON_SOURCE)
+    points = load_split_points(index, "python", cache_dir)
+    cached = [os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names]
+    assert len(cached) == 1
+    # A cached index is read back rather than rebuilt
+    np.save(cached[0], points[:1])
+    assert load_split_points(index, "python", cache_dir).tolist() == points[:1].tolist()
+
+    load_split_points(LineIndex.from_text(PYTHON_SOURCE + "x = 1\n"), "python", cache_dir)
+    load_split_points(index, "java", cache_dir)
+    assert sum(len(names) for _, _, names in os.walk(cache_dir)) == 3
+
+def test_syntax_split_cuts_at_split_points(tmp_path):
+    text = PYTHON_SOURCE * 3
+    index = SyntaxIndex.from_text(text, "python", cache_dir=str(tmp_path))
+    assert isinstance(index_code(text, "python", "syntax"), SyntaxIndex)
+    rng = random.Random(0)
+    cursors = {index.starts[line] + position for line, positions in index.split_points.items() for position in positions}
+    examples = [split_code_example(text, rng, index) for _ in range(50)]
+    assert any(examples)
+    for example in filter(None, examples):
+        assert len(example["prefix"]) in cursors
+        assert text.startswith(example["prefix"])
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+from src.data.tokenize_dataset import FIELDS, tokenize_entry, tokenize_examples, verify_tokenization
+
+def legacy_tokenize_entry(entry, tokenizer):
+    # The original per-example encoding, a tensor per field turned back into a one-row list
+    tokenized = {"language": entry["language"]}
+    for field in FIELDS:
+        tokenized[field] = tokenizer.encode(entry[field], return_tensors="pt", truncation=True).tolist()
+    return tokenized
+
+def edge_cases(examples):
+    # Empty fields, non-ASCII text and a prefix longer than the truncation limit
+    language = examples[0]["language"]
+    return [
+        {"prefix": "", "middle": "x = 1\n", "suffix": "", "language": language},
+        {"prefix": "s = 'héllo wörld ✓'\n", "middle": "# ünïcode — ok\n", "suffix": "\t\n", "language": language},
+        {"prefix": "\n".join(example["prefix"] for example in examples), "middle": "pass\n", "suffix": "", "language": language}
+    ]
+
+def test_tokenize_examples_matches_legacy_encoding(examples, tokenizer, tokenizer_dir):
+    entries = examples + edge_cases(examples)
+    expected = [legacy_tokenize_entry(entry, tokenizer) for entry in entries]
+    assert tokenize_examples(entries, model_id=tokenizer_dir) == expected
+    assert tokenize_examples(entries, chunk_size=7, model_id=tokenizer_dir) == expected
+    assert [tokenize_entry(entry, tokenizer) for entry in entries] == expected
+
+def test_tokenize_examples_with_workers_matches_legacy_encoding(examples, tokenizer, tokenizer_dir):
+    entries = examples + edge_cases(examples)
+    tokenized = tokenize_examples(entries, workers=2, chunk_size=5, model_id=tokenizer_dir)
+    assert tokenized == [legacy_tokenize_entry(entry, tokenizer) for entry in entries]
+    assert verify_tokenization(entries, tokenized, tokenizer) == []
+
+def test_importing_the_tokenizer_module_loads_no_tokenizer():
+    # A fresh interpreter, since this test session has long imported transformers
+    code = "import sys, src.data.tokenize_dataset; print('transformers' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False"
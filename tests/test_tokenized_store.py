@@ -0,0 +1,51 @@
+import json
+import numpy as np
+import pytest
+from src.data.tokenized_store import (FIELDS, TokenizedStore, TokenizedStoreWriter, convert_json_to_store,
+                                      dtype_for_vocab, load_tokenized)
+
+def as_lists(entries):
+    return [{"language": entry["language"], **{field: [[int(token) for token in entry[field][0]]] for field in FIELDS}}
+            for entry in entries]
+
+def test_dtype_for_vocab():
+    assert dtype_for_vocab(49152) == np.uint16
+    assert dtype_for_vocab(65536) == np.uint16
+    assert dtype_for_vocab(65537) == np.uint32
+
+def test_store_round_trips_the_json_layout(tmp_path, tokenized_data):
+    # An empty field and a second language, next to the tokenized examples
+    entries = tokenized_data + [{"language": "java", "prefix": [[1, 2]], "middle": [[]], "suffix": [[3]]}]
+    with TokenizedStoreWriter(str(tmp_path / "store")) as writer:
+        for entry in entries:
+            writer.add(entry)
+    store = TokenizedStore(str(tmp_path / "store"))
+    assert len(store) == len(entries)
+    assert as_lists(store) == as_lists(entries)
+    assert as_lists([store[-1]]) == as_lists(entries[-1:])
+    with pytest.raises(IndexError):
+        store[len(entries)]
+
+    store.to_json(str(tmp_path / "export.json"))
+    with open(tmp_path / "export.json", 'r', encoding='utf-8') as f:
+        assert json.load(f) == as_lists(entries)
+
+def test_convert_json_to_store_picks_the_dtype(tmp_path, tokenized_data):
+    json_path = tmp_path / "tokenized.json"
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(as_lists(tokenized_data), f)
+    store = convert_json_to_store(str(json_path), str(tmp_path / "store"))
+    assert store.tokens.dtype == np.uint16
+    assert as_lists(store) == as_lists(load_tokenized(str(json_path)))
+    assert as_lists(load_tokenized(str(tmp_path / "store"))) == as_lists(tokenized_data)
+
+    wide = [{"language": "python", "prefix": [[70000]], "middle": [[1]], "suffix": [[]]}]
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(wide, f)
+    store = convert_json_to_store(str(json_path), str(tmp_path / "wide"))
+    assert store.tokens.dtype == np.uint32
+    assert as_lists(store) == wide
+
+def test_writer_rejects_ids_beyond_the_dtype(tmp_path):
+    with TokenizedStoreWriter(str(tmp_path), dtype=np.uint16) as writer, pytest.raises(ValueError):
+        writer.add({"language": "python", "prefix": [[70000]], "middle": [[]], "suffix": [[]]})